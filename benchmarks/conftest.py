@@ -0,0 +1,60 @@
+"""Shared fixtures for the `dftinputgen` benchmarks."""
+
+import os
+
+import numpy as np
+import pytest
+
+import ase
+from ase import io as ase_io
+
+
+# numbers of atoms in the crystal structures to benchmark against
+ATOM_COUNTS = [10, 100, 1000, 10000, 100000]
+
+qe_files_dir = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "tests", "qe", "files"
+)
+
+
+def _random_structure(natoms, seed=42):
+    """Amorphous-like FeO cell with `natoms` randomly placed atoms."""
+    rng = np.random.RandomState(seed)
+    length = 2.5 * natoms ** (1.0 / 3)
+    return ase.Atoms(
+        symbols=["Fe", "O"] * (natoms // 2) + ["Fe"] * (natoms % 2),
+        scaled_positions=rng.uniform(size=(natoms, 3)),
+        cell=np.eye(3) * length,
+        pbc=True,
+    )
+
+
+@pytest.fixture(scope="session")
+def random_structure():
+    """Factory of (cached) random FeO structures with a given atom count."""
+    cache = {}
+
+    def _factory(natoms):
+        if natoms not in cache:
+            cache[natoms] = _random_structure(natoms)
+        return cache[natoms]
+
+    return _factory
+
+
+@pytest.fixture(scope="session")
+def pseudo_dir():
+    """Directory with pseudopotentials for Fe, O, and Al."""
+    return qe_files_dir
+
+
+@pytest.fixture(scope="session")
+def feo_struct_file():
+    """Path to the conventional FeO crystal structure file."""
+    return os.path.join(qe_files_dir, "feo_conv.vasp")
+
+
+@pytest.fixture(scope="session")
+def feo_struct(feo_struct_file):
+    """Conventional FeO crystal structure."""
+    return ase_io.read(feo_struct_file)
@@ -0,0 +1,52 @@
+"""Benchmarks for rendering the structure-dependent pw.x cards.
+
+Run with `pytest benchmarks/test_bench_cards.py` (requires
+`pytest-benchmark`); the timings for the different atom counts show how the
+rendering time scales with the size of the crystal structure.
+"""
+
+import pytest
+
+from dftinputgen.qe.pwx import PwxInputGenerator
+
+from conftest import ATOM_COUNTS
+
+
+def _legacy_atomic_positions_card(crystal_structure):
+    """Per-atom `str.format` loop, for comparison."""
+    symbols = crystal_structure.get_chemical_symbols()
+    positions = crystal_structure.get_scaled_positions()
+    lines = ["ATOMIC_POSITIONS {crystal}"]
+    for s, p in zip(symbols, positions):
+        lines.append("{:4s}  {:12.8f}  {:12.8f}  {:12.8f}".format(s, *p))
+    return "\n".join(lines)
+
+
+@pytest.mark.parametrize("natoms", ATOM_COUNTS)
+def test_atomic_positions_card(benchmark, random_structure, natoms):
+    benchmark.group = "atomic_positions_card"
+    pwig = PwxInputGenerator(crystal_structure=random_structure(natoms))
+    card = benchmark(lambda: pwig.atomic_positions_card)
+    assert card == _legacy_atomic_positions_card(pwig.crystal_structure)
+
+
+@pytest.mark.parametrize("natoms", ATOM_COUNTS)
+def test_legacy_atomic_positions_card(benchmark, random_structure, natoms):
+    benchmark.group = "atomic_positions_card"
+    crystal_structure = random_structure(natoms)
+    benchmark(_legacy_atomic_positions_card, crystal_structure)
+
+
+def test_cell_parameters_card(benchmark, random_structure):
+    pwig = PwxInputGenerator(crystal_structure=random_structure(10))
+    benchmark(lambda: pwig.cell_parameters_card)
+
+
+@pytest.mark.parametrize("repetitions", [5, 10, 20])
+def test_supercell_atomic_positions_card(benchmark, feo_struct, repetitions):
+    benchmark.group = "supercell_atomic_positions_card"
+    pwig = PwxInputGenerator(
+        crystal_structure=feo_struct, supercell=repetitions
+    )
+    card = benchmark(lambda: pwig.atomic_positions_card)
+    assert card.count("\n") == len(feo_struct) * repetitions ** 3
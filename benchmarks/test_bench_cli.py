@@ -0,0 +1,29 @@
+"""End-to-end benchmarks of the `dftinputgen` command line tool."""
+
+import sys
+import subprocess
+
+
+def _run_cli(*args):
+    cmd = [sys.executable, "-m", "dftinputgen.cli", "pw.x"] + list(args)
+    subprocess.check_call(cmd, stdout=subprocess.DEVNULL)
+
+
+def test_cli_single_structure(benchmark, tmpdir, feo_struct_file):
+    benchmark.group = "cli"
+    benchmark(
+        _run_cli, "-i", feo_struct_file, "-pre", "scf", "-loc", str(tmpdir)
+    )
+
+
+def test_cli_many_structures(benchmark, tmpdir, feo_struct):
+    """One CLI call for 100 structures (vs. 100 single-structure calls)."""
+    from ase import io as ase_io
+
+    benchmark.group = "cli"
+    xyz_file = str(tmpdir.join("frames.xyz"))
+    ase_io.write(xyz_file, [feo_struct] * 100, format="extxyz")
+    write_location = str(tmpdir.mkdir("inputs"))
+    benchmark(
+        _run_cli, "-I", xyz_file, "-pre", "scf", "-loc", write_location
+    )
@@ -0,0 +1,87 @@
+"""Benchmarks for finding duplicate crystal structures.
+
+Run with `pytest benchmarks/test_bench_dedup.py` (requires
+`pytest-benchmark`); the timings for the different atom counts show how
+fingerprinting scales with the size of the crystal structure, and the
+deduplication of a stream of structures with many duplicates shows the cost
+of the dedup stage per structure. The deduplication of many distinct
+configurations of the same lattice (the worst case for finding near
+duplicates) shows how the dedup stage scales with the number of unique
+structures: the time per structure should stay roughly constant.
+"""
+
+import itertools
+
+import pytest
+import numpy as np
+
+import ase
+from ase.build import bulk
+
+from dftinputgen.dedup import StructureDeduplicator
+from dftinputgen.dedup import get_structure_fingerprint
+
+
+@pytest.mark.parametrize("natoms", [10, 100])
+def test_structure_fingerprint(benchmark, random_structure, natoms):
+    benchmark.group = "structure_fingerprint"
+    benchmark(get_structure_fingerprint, random_structure(natoms))
+
+
+def test_deduplicate(benchmark, random_structure):
+    # 10 distinct structures, each repeated 10 times with the atoms shuffled
+    rng = np.random.RandomState(0)
+    structures = []
+    for seed in range(10):
+        structure = random_structure(10 + seed)
+        for _ in range(10):
+            order = rng.permutation(len(structure))
+            structures.append(
+                ase.Atoms(
+                    symbols=np.array(structure.get_chemical_symbols())[order],
+                    positions=structure.positions[order],
+                    cell=structure.cell,
+                    pbc=True,
+                )
+            )
+
+    def _deduplicate():
+        dedup = StructureDeduplicator()
+        return list(dedup.iter_unique(structures))
+
+    unique = benchmark(_deduplicate)
+    assert len(unique) == 10
+
+
+def _fcc_configurations(count, seed=0):
+    """Random Al/Cu decorations of a 32-atom fcc supercell."""
+    unit = bulk("Al", "fcc", a=4.05, cubic=True)
+    positions = [
+        position + np.dot(translation, unit.cell)
+        for translation in itertools.product(range(2), repeat=3)
+        for position in unit.positions
+    ]
+    rng = np.random.RandomState(seed)
+    symbols = np.array(["Al"] * 16 + ["Cu"] * 16)
+    for _ in range(count):
+        rng.shuffle(symbols)
+        yield ase.Atoms(
+            symbols=symbols.tolist(),
+            positions=positions,
+            cell=unit.cell * 2,
+            pbc=True,
+        )
+
+
+@pytest.mark.parametrize("count", [100, 1000])
+def test_deduplicate_configurations(benchmark, count):
+    benchmark.group = "deduplicate_configurations"
+    structures = list(_fcc_configurations(count))
+
+    def _deduplicate():
+        dedup = StructureDeduplicator()
+        return list(dedup.iter_unique(structures))
+
+    unique = benchmark.pedantic(_deduplicate, rounds=1, iterations=1)
+    # (a few random configurations may be equivalent by symmetry)
+    assert 0.99 * count <= len(unique) <= count
@@ -0,0 +1,127 @@
+"""Benchmarks for constructing `PwxInputGenerator` and rendering input."""
+
+import json
+
+import pytest
+
+from dftinputgen.qe.pwx import PwxInputGenerator
+
+from conftest import ATOM_COUNTS
+
+
+def test_constructor_bare(benchmark, feo_struct):
+    benchmark.group = "constructor"
+    benchmark(PwxInputGenerator, crystal_structure=feo_struct)
+
+
+def test_constructor_presets_and_custom_settings(
+    benchmark, tmpdir, feo_struct, pseudo_dir
+):
+    benchmark.group = "constructor"
+    sett_file = str(tmpdir.join("sett.json"))
+    with open(sett_file, "w") as fw:
+        json.dump({"ecutwfc": 50, "ecutrho": 400}, fw)
+    benchmark(
+        PwxInputGenerator,
+        crystal_structure=feo_struct,
+        calculation_presets="scf",
+        custom_sett_file=sett_file,
+        custom_sett_dict={"pseudo_dir": pseudo_dir},
+        specify_potentials=True,
+    )
+
+
+@pytest.mark.parametrize("natoms", ATOM_COUNTS)
+def test_pwx_input_as_str(benchmark, random_structure, pseudo_dir, natoms):
+    benchmark.group = "pwx_input_as_str"
+    pwig = PwxInputGenerator(
+        crystal_structure=random_structure(natoms),
+        calculation_presets="scf",
+        custom_sett_dict={"pseudo_dir": pseudo_dir},
+        specify_potentials=True,
+    )
+    benchmark(lambda: pwig.pwx_input_as_str)
+
+
+@pytest.mark.parametrize("natoms", ATOM_COUNTS)
+def test_end_to_end(benchmark, random_structure, pseudo_dir, natoms):
+    """New generator for every structure, as in a high-throughput loop."""
+    benchmark.group = "end_to_end"
+    crystal_structure = random_structure(natoms)
+
+    def _generate():
+        return PwxInputGenerator(
+            crystal_structure=crystal_structure,
+            calculation_presets="scf",
+            custom_sett_dict={"pseudo_dir": pseudo_dir},
+            specify_potentials=True,
+        ).pwx_input_as_str
+
+    benchmark(_generate)
+
+
+@pytest.mark.parametrize("natoms", ATOM_COUNTS)
+def test_write_pwx_input(benchmark, tmpdir, random_structure, natoms):
+    benchmark.group = "write_pwx_input"
+    pwig = PwxInputGenerator(
+        crystal_structure=random_structure(natoms), calculation_presets="scf",
+    )
+    benchmark(
+        pwig.write_pwx_input, write_location=str(tmpdir), filename="scf.in"
+    )
+
+
+@pytest.mark.parametrize("spacing", [0.3, 0.15, 0.05])
+def test_kpoints_card_from_spacing(benchmark, feo_struct, spacing):
+    benchmark.group = "kpoints_card"
+    pwig = PwxInputGenerator(
+        crystal_structure=feo_struct,
+        custom_sett_dict={
+            "kpoints": {
+                "scheme": "automatic",
+                "spacing": spacing,
+                "shift": [0, 0, 0],
+            }
+        },
+    )
+    benchmark(lambda: pwig.kpoints_card)
+
+
+@pytest.mark.parametrize("natoms", ATOM_COUNTS)
+def test_sweep_ecutwfc_kspacing(benchmark, random_structure, natoms):
+    from dftinputgen.qe.sweep import PwxSweep
+
+    benchmark.group = "sweep"
+    pwig = PwxInputGenerator(
+        crystal_structure=random_structure(natoms), calculation_presets="scf",
+    )
+    kpoints = [
+        {"scheme": "automatic", "spacing": s / 100.0, "shift": [0, 0, 0]}
+        for s in range(10, 40)
+    ]
+    parameters = {"ecutwfc": list(range(30, 80, 5)), "kpoints": kpoints}
+
+    def _sweep():
+        for sweep_input in PwxSweep(pwig, parameters).iter_inputs():
+            pass
+
+    benchmark(_sweep)
+
+
+@pytest.mark.parametrize("enabled", [False, True])
+def test_render_with_stats(benchmark, feo_struct, pseudo_dir, enabled):
+    from dftinputgen.stats import GenerationStats
+
+    benchmark.group = "stats_overhead"
+
+    def _render():
+        pwig = PwxInputGenerator(
+            crystal_structure=feo_struct,
+            calculation_presets="scf",
+            custom_sett_dict={"pseudo_dir": pseudo_dir},
+            specify_potentials=True,
+            stats=GenerationStats() if enabled else None,
+        )
+        return pwig.pwx_input_as_str
+
+    benchmark(_render)
@@ -0,0 +1,23 @@
+"""Benchmarks for the time to import `dftinputgen` (e.g., CLI startup)."""
+
+import sys
+import subprocess
+
+
+def _import_in_subprocess(module):
+    subprocess.check_call([sys.executable, "-c", "import {}".format(module)])
+
+
+def test_import_python(benchmark):
+    benchmark.group = "import"
+    benchmark(_import_in_subprocess, "sys")
+
+
+def test_import_ase(benchmark):
+    benchmark.group = "import"
+    benchmark(_import_in_subprocess, "ase")
+
+
+def test_import_dftinputgen_cli(benchmark):
+    benchmark.group = "import"
+    benchmark(_import_in_subprocess, "dftinputgen.cli")
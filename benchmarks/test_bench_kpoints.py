@@ -0,0 +1,39 @@
+"""Benchmarks for computing k-point grids from a k-spacing.
+
+Run with `pytest benchmarks/test_bench_kpoints.py` (requires
+`pytest-benchmark`); compares computing grids for a stack of cells one cell
+at a time with the vectorized computation for all cells at once.
+"""
+
+import pytest
+import numpy as np
+
+from dftinputgen.utils import StructureView
+from dftinputgen.utils import get_kpoint_grid_from_spacing
+from dftinputgen.utils import get_kpoint_grids_from_spacing
+
+
+CELL_COUNTS = [100, 10000]
+
+
+def _random_cells(ncells):
+    rng = np.random.RandomState(0)
+    return np.eye(3) * 4.0 + rng.uniform(-0.5, 0.5, size=(ncells, 3, 3))
+
+
+@pytest.mark.parametrize("ncells", CELL_COUNTS)
+def test_kpoint_grids_loop(benchmark, ncells):
+    benchmark.group = "kpoint_grids_{}".format(ncells)
+    views = [
+        StructureView(("Fe",), [], np.zeros((0, 3)), cell)
+        for cell in _random_cells(ncells)
+    ]
+    benchmark(lambda: [get_kpoint_grid_from_spacing(v, 0.2) for v in views])
+
+
+@pytest.mark.parametrize("ncells", CELL_COUNTS)
+def test_kpoint_grids_vectorized(benchmark, ncells):
+    benchmark.group = "kpoint_grids_{}".format(ncells)
+    cells = _random_cells(ncells)
+    grids = benchmark(get_kpoint_grids_from_spacing, cells, 0.2)
+    assert grids.shape == (ncells, 3)
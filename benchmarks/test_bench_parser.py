@@ -0,0 +1,40 @@
+"""Benchmarks for reading pw.x input files.
+
+Run with `pytest benchmarks/test_bench_parser.py` (requires
+`pytest-benchmark`); the timings for the different atom counts show how the
+parsing time scales with the size of the crystal structure.
+"""
+
+import pytest
+
+from dftinputgen.qe.pwx import PwxInputGenerator
+from dftinputgen.qe.parser import parse_pwx_input
+from dftinputgen.qe.parser import read_many_pwx_inputs
+
+from conftest import ATOM_COUNTS
+
+
+@pytest.mark.parametrize("natoms", ATOM_COUNTS)
+def test_parse_pwx_input(benchmark, random_structure, natoms):
+    benchmark.group = "parse_pwx_input"
+    pwig = PwxInputGenerator(
+        crystal_structure=random_structure(natoms), calculation_presets="scf",
+    )
+    lines = pwig.pwx_input_as_str.splitlines()
+    pwx_input = benchmark(parse_pwx_input, lines)
+    assert len(pwx_input.structure) == natoms
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_read_many_pwx_inputs(benchmark, tmpdir, feo_struct, max_workers):
+    benchmark.group = "read_many_pwx_inputs"
+    pwig = PwxInputGenerator(
+        crystal_structure=feo_struct, calculation_presets="scf",
+    )
+    text = pwig.pwx_input_as_str
+    for i in range(1000):
+        tmpdir.join("{}.in".format(i)).write(text)
+    results = benchmark(
+        read_many_pwx_inputs, str(tmpdir), max_workers=max_workers
+    )
+    assert all(r.error is None for r in results)
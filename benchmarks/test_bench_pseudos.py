@@ -0,0 +1,40 @@
+"""Benchmarks for matching pseudopotentials in large directories."""
+
+import pytest
+
+from dftinputgen.data import get_standard_atomic_weights
+from dftinputgen.qe.pseudos import PseudoResolver
+
+
+@pytest.fixture(scope="module", params=[100, 1000, 10000])
+def large_pseudo_dir(request, tmpdir_factory):
+    """Directory with many (empty) pseudopotential files."""
+    dirname = tmpdir_factory.mktemp("pseudos_{}".format(request.param))
+    elements = sorted(get_standard_atomic_weights())
+    for i in range(request.param):
+        elem = elements[i % len(elements)].lower()
+        dirname.join("{}_v{}.pbe.UPF".format(elem, i)).write("")
+    return str(dirname)
+
+
+def test_resolve_cold(benchmark, large_pseudo_dir):
+    """Directory is listed and indexed for every species."""
+    benchmark.group = "resolve_pseudos"
+    resolver = PseudoResolver()
+
+    def _resolve():
+        resolver.clear()
+        return resolver.resolve("Fe", large_pseudo_dir)
+
+    assert benchmark(_resolve) is not None
+
+
+def test_resolve_warm(benchmark, large_pseudo_dir):
+    """Directory index is cached."""
+    benchmark.group = "resolve_pseudos"
+    resolver = PseudoResolver()
+
+    def _resolve():
+        return [resolver.resolve(s, large_pseudo_dir) for s in ("Fe", "O")]
+
+    assert None not in benchmark(_resolve)
@@ -21,9 +21,10 @@ setup(
     packages=find_packages(where="src"),
     package_dir={"": "src"},
     include_package_data=True,
+    python_requires=">=3.9",
     install_requires=["six", "numpy", "ase <= 3.17"],
     entry_points={"console_scripts": ["dftinputgen = dftinputgen.cli:driver"]},
     classifiers=[
-        "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
     ],
 )
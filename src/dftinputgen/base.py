@@ -1,5 +1,6 @@
 import os
 import six
+import copy
 import json
 import abc
 from abc import abstractproperty
@@ -7,6 +8,8 @@ from abc import abstractmethod
 
 import ase
 
+from dftinputgen.stats import NULL_STATS
+
 
 class DftInputGeneratorError(Exception):
     """Base class for errors associated with DFT input files generation."""
@@ -14,6 +17,149 @@ class DftInputGeneratorError(Exception):
     pass
 
 
+def _immutable(self, *args, **kwargs):
+    msg = "'{}' object is immutable".format(type(self).__name__)
+    raise TypeError(msg)
+
+
+class FrozenDict(dict):
+    """Immutable dictionary (that still compares equal to a `dict`).
+
+    Methods that would modify the dictionary in place raise `TypeError`.
+    Copies (shallow or deep) are the object itself; use `thaw` to get a
+    mutable copy.
+    """
+
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+    __ior__ = _immutable
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __hash__(self):
+        return hash(frozenset(self.items()))
+
+
+class FrozenList(list):
+    """Immutable list (that still compares equal to a `list`).
+
+    Methods that would modify the list in place raise `TypeError`.
+    """
+
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _immutable
+    append = extend = insert = pop = remove = _immutable
+    clear = reverse = sort = _immutable
+
+    def __reduce__(self):
+        return (type(self), (list(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+
+def freeze(value):
+    """Recursively convert dicts and lists to `FrozenDict`/`FrozenList`."""
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return FrozenList(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    """Recursively convert (frozen) dicts and lists to mutable copies."""
+    if isinstance(value, dict):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [thaw(v) for v in value]
+    return value
+
+
+class _SettingsDict(dict):
+    """Dictionary that calls `on_change` whenever it is modified in place.
+
+    Used to store user-input settings so that any cached, derived settings
+    can be invalidated when, e.g., `custom_sett_dict["tag"] = val` is done.
+
+    Nested dictionaries are stored as `_SettingsDict` objects as well, that
+    report their changes to the parent, so that changes such as
+    `custom_sett_dict["kpoints"]["spacing"] = val` are tracked too. (Changes
+    to lists in place are not tracked.) Copies and pickles are plain dicts.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.on_change = None
+        super(_SettingsDict, self).__init__()
+        for key, value in dict(*args, **kwargs).items():
+            super(_SettingsDict, self).__setitem__(key, self._wrap(value))
+
+    def _wrap(self, value):
+        if isinstance(value, dict):
+            value = _SettingsDict(value)
+            value.on_change = self._changed
+        return value
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def __setitem__(self, key, value):
+        super(_SettingsDict, self).__setitem__(key, self._wrap(value))
+        self._changed()
+
+    def __delitem__(self, key):
+        super(_SettingsDict, self).__delitem__(key)
+        self._changed()
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(dict(self), memo)
+
+    def clear(self):
+        super(_SettingsDict, self).clear()
+        self._changed()
+
+    def pop(self, *args):
+        value = super(_SettingsDict, self).pop(*args)
+        self._changed()
+        return value
+
+    def popitem(self):
+        item = super(_SettingsDict, self).popitem()
+        self._changed()
+        return item
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            super(_SettingsDict, self).__setitem__(key, self._wrap(default))
+        self._changed()
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            super(_SettingsDict, self).__setitem__(key, self._wrap(value))
+        self._changed()
+
+
 @six.add_metaclass(abc.ABCMeta)
 class DftInputGenerator(object):
     """Base abstract class for DFT input generators."""
@@ -26,6 +172,7 @@ class DftInputGenerator(object):
         custom_sett_dict=None,
         write_location=None,
         overwrite_files=None,
+        stats=None,
         **kwargs
     ):
         """
@@ -77,10 +224,23 @@ class DftInputGenerator(object):
 
             Default: True
 
+        stats: :class:`GenerationStats`, optional
+            Object to record the wall time and number of calls of each phase
+            of input generation in. Share one object between generators to
+            aggregate stats over all of them.
+
+            Default: None (nothing is recorded)
+
         **kwargs:
             Arbitrary keyword arguments.
 
         """
+        self._stats = NULL_STATS
+        self.stats = stats
+
+        self._calculation_settings = None
+        self._calculation_settings_version = 0
+
         self._crystal_structure = None
         self.crystal_structure = crystal_structure
 
@@ -91,7 +251,7 @@ class DftInputGenerator(object):
         self._custom_sett_from_file = {}
         self.custom_sett_file = custom_sett_file
 
-        self._custom_sett_dict = {}
+        self._custom_sett_dict = self._make_settings_dict({})
         if custom_sett_dict is not None:
             self.custom_sett_dict = custom_sett_dict
 
@@ -102,6 +262,15 @@ class DftInputGenerator(object):
         if overwrite_files is not None:
             self.overwrite_files = overwrite_files
 
+    @property
+    def stats(self):
+        """:class:`GenerationStats` with timings of generation phases."""
+        return self._stats
+
+    @stats.setter
+    def stats(self, stats):
+        self._stats = NULL_STATS if stats is None else stats
+
     @property
     def crystal_structure(self):
         """Input crystal structure as an `ase.Atoms` object."""
@@ -117,6 +286,7 @@ class DftInputGenerator(object):
             msg = 'Expected type "ase.Atoms"; found "{}"'.format(input_type)
             raise TypeError(msg)
         self._crystal_structure = crystal_structure
+        self._invalidate_calculation_settings()
 
     @property
     def calculation_presets(self):
@@ -126,6 +296,7 @@ class DftInputGenerator(object):
     @calculation_presets.setter
     def calculation_presets(self, calculation_presets):
         self._calculation_presets = calculation_presets
+        self._invalidate_calculation_settings()
 
     @property
     def custom_sett_file(self):
@@ -136,6 +307,7 @@ class DftInputGenerator(object):
     def custom_sett_file(self, custom_sett_file):
         self._custom_sett_file = custom_sett_file
         self._custom_sett_from_file = self._read_custom_sett_from_file()
+        self._invalidate_calculation_settings()
 
     @property
     def custom_sett_from_file(self):
@@ -144,12 +316,52 @@ class DftInputGenerator(object):
 
     @property
     def custom_sett_dict(self):
-        """Dictionary of custom settings to use for generating input."""
+        """Dictionary of custom settings to use for generating input.
+
+        The dictionary is copied when set, so later changes to the original
+        dictionary have no effect. Changes made in place to this property,
+        including to nested dictionaries (e.g.
+        `custom_sett_dict["kpoints"]["spacing"] = 0.2`), are tracked, and
+        update `calculation_settings`. Lists should be replaced rather than
+        modified in place.
+
+        A :class:`FrozenDict` (e.g. settings shared by many generators) is
+        not copied when set, but only on first access to this property.
+        """
+        if isinstance(self._custom_sett_dict, FrozenDict):
+            self._custom_sett_dict = self._make_settings_dict(
+                self._custom_sett_dict
+            )
         return self._custom_sett_dict
 
     @custom_sett_dict.setter
     def custom_sett_dict(self, custom_sett_dict):
-        self._custom_sett_dict = custom_sett_dict
+        if isinstance(custom_sett_dict, FrozenDict):
+            # (immutable: shared as is, until it is accessed to be changed)
+            self._custom_sett_dict = custom_sett_dict
+        else:
+            self._custom_sett_dict = self._make_settings_dict(custom_sett_dict)
+        self._invalidate_calculation_settings()
+
+    def _make_settings_dict(self, settings):
+        settings = _SettingsDict(thaw(settings))
+        settings.on_change = self._invalidate_calculation_settings
+        return settings
+
+    @property
+    def calculation_settings_version(self):
+        """Number of times `calculation_settings` has been (re)built.
+
+        The aggregated settings are cached, and rebuilt only when any of
+        `crystal_structure`, `calculation_presets`, `custom_sett_file`, or
+        `custom_sett_dict` changes. Callers can compare this counter across
+        accesses to detect a rebuild.
+        """
+        return self._calculation_settings_version
+
+    def _invalidate_calculation_settings(self):
+        """Discard the cached aggregated calculation settings."""
+        self._calculation_settings = None
 
     @property
     def write_location(self):
@@ -175,8 +387,9 @@ class DftInputGenerator(object):
     def _read_custom_sett_from_file(self):
         if self.custom_sett_file is None:
             return {}
-        with open(self.custom_sett_file, "r") as fr:
-            return json.load(fr)
+        with self.stats.phase("settings_file"):
+            with open(self.custom_sett_file, "r") as fr:
+                return json.load(fr)
 
     @abstractproperty
     def dft_package(self):
@@ -0,0 +1,457 @@
+"""Generate pw.x input files for many crystal structures at once."""
+
+import os
+import gc
+import json
+import itertools
+import collections
+from concurrent import futures
+
+from dftinputgen.base import freeze
+from dftinputgen.data import get_standard_atomic_weights
+from dftinputgen.utils import iter_chunks
+from dftinputgen.layouts import get_layout
+from dftinputgen.manifest import Manifest
+from dftinputgen.stats import NULL_STATS
+from dftinputgen.stats import GenerationStats
+from dftinputgen.targets import DirectoryTarget
+from dftinputgen.qe.settings.calculation_presets import get_qe_presets
+from dftinputgen.qe.pseudos import PSEUDO_RESOLVER
+from dftinputgen.qe.pseudos import PseudoResolverError
+from dftinputgen.qe.pwx import PwxRenderPlan
+from dftinputgen.qe.pwx import PwxInputGenerator
+from dftinputgen.qe.pwx import PwxInputGeneratorError
+from dftinputgen.qe.pwx import _validate_calculation_settings
+
+
+__all__ = ["BatchResult", "generate_many"]
+
+
+BatchResult = collections.namedtuple(
+    "BatchResult", ["index", "path", "text", "error", "written"]
+)
+BatchResult.__doc__ = """Outcome of input generation for one structure.
+
+`index` is the position of the structure in the input sequence, `path` the
+file (or archive member) written (None if nothing was written), `text` the
+rendered input (None if it was written instead), and `error` the exception
+raised while generating input for this structure (None on success).
+`written` is False if the input file was skipped because it was already up
+to date.
+"""
+
+
+# per-process state shared by all chunks handled in a worker
+_WORKER_CONTEXT = {}
+
+# tags that vary across structures with `auto_cutoffs`
+_CUTOFF_TAGS = ("ecutwfc", "ecutrho")
+
+
+def _resolve_settings(calculation_presets, custom_sett_file, custom_sett_dict):
+    """Merge presets and custom settings once, for all structures."""
+    calc_sett = {}
+    if calculation_presets is not None:
+        calc_sett.update(get_qe_presets()[calculation_presets])
+    if custom_sett_file is not None:
+        with open(custom_sett_file, "r") as fr:
+            calc_sett.update(json.load(fr))
+    if custom_sett_dict is not None:
+        calc_sett.update(custom_sett_dict)
+    return calc_sett
+
+
+def _resolve_pseudo_names(calc_sett):
+    """Match every element to a pseudopotential in `pseudo_dir`, once.
+
+    Pseudopotentials specified by the user in `pseudo_names` take
+    precedence. If `pseudo_dir` cannot be listed, the user-specified names
+    are returned as is, and the error surfaces for individual structures.
+    """
+    pseudo_dir = calc_sett.get("pseudo_dir")
+    pseudo_names = {}
+    if pseudo_dir:
+        try:
+            index = PSEUDO_RESOLVER.index(pseudo_dir)
+        except PseudoResolverError:
+            index = {}
+        for elem in get_standard_atomic_weights():
+            if elem.lower() in index:
+                pseudo_names[elem] = index[elem.lower()]
+    pseudo_names.update(calc_sett.get("pseudo_names", {}))
+    return pseudo_names
+
+
+def _init_worker(context):
+    _WORKER_CONTEXT.clear()
+    _WORKER_CONTEXT.update(context)
+
+
+def _generate_chunk(chunk):
+    return _generate_chunk_with_context(chunk, _WORKER_CONTEXT)
+
+
+def _generate_chunk_with_context(chunk, context):
+    """Generate input for every (index, structure, filename, key) in a chunk.
+
+    If `context["render_only"]` is True, the rendered inputs are returned
+    (with their paths relative to the target) instead of written.
+    """
+    results = []
+    # entries for files written, to be merged into the batch manifest
+    entries = []
+    # stats for the chunk, to be merged into the batch stats
+    stats = GenerationStats() if context["stats_enabled"] else None
+    write_location = context["write_location"]
+    manifest = context["manifest"]
+    layout = context["layout"]
+    generators = []
+    for index, structure, filename, key in chunk:
+        try:
+            pwig = PwxInputGenerator(
+                crystal_structure=structure,
+                calculation_presets=context["calculation_presets"],
+                custom_sett_dict=context["calculation_settings"],
+                specify_potentials=context["specify_potentials"],
+                write_location=write_location,
+                pwx_input_file=filename,
+                stats=stats,
+                layout=layout,
+                input_key=key,
+                supercell=context["supercell"],
+                auto_cutoffs=context["auto_cutoffs"],
+            )
+            if context["render_plan"] is not None:
+                pwig.render_plan = context["render_plan"]
+            generators.append((index, pwig, pwig.input_path))
+        except Exception as err:
+            results.append(BatchResult(index, None, None, err, False))
+    if write_location is not None and layout.keyed:
+        # create the directories for the whole chunk at once
+        layout.make_dirs(write_location, [p for _, _, p in generators])
+    for index, pwig, input_path in generators:
+        try:
+            if context["render_only"]:
+                text = pwig.pwx_input_as_str
+                result = BatchResult(index, input_path, text, None, False)
+            elif write_location is None:
+                text = pwig.pwx_input_as_str
+                result = BatchResult(index, None, text, None, False)
+            else:
+                written = pwig.write_pwx_input(
+                    write_location=write_location,
+                    filename=input_path,
+                    manifest=manifest,
+                )
+                if written and manifest is not None:
+                    entries.append((input_path, manifest.get(input_path)))
+                path = os.path.join(write_location, input_path)
+                result = BatchResult(index, path, None, None, written)
+        except Exception as err:
+            result = BatchResult(index, None, None, err, False)
+        results.append(result)
+    results.sort(key=lambda result: result.index)
+    return results, entries, stats
+
+
+def _write_to_target(chunk_results, output_target, stats):
+    """Write inputs rendered by the workers to the output target."""
+    results = []
+    for result in chunk_results:
+        if result.error is None:
+            try:
+                with stats.phase("write"):
+                    location = output_target.write(result.path, [result.text])
+                stats.count("files_written")
+                result = BatchResult(result.index, location, None, None, True)
+            except Exception as err:
+                result = BatchResult(result.index, None, None, err, False)
+        results.append(result)
+    return results
+
+
+def _map_bounded(executor, fn, iterable, window, ordered=False):
+    """Like `executor.map`, with at most `window` calls submitted at once.
+
+    Results are yielded as the calls complete, or in the order of
+    `iterable` if `ordered` is True (completed calls waiting for earlier
+    ones then count toward the window).
+    """
+    items = enumerate(iterable)
+    pending = {}
+    completed = {}
+    next_index = 0
+    while True:
+        while len(pending) + len(completed) < window:
+            item = next(items, None)
+            if item is None:
+                break
+            pending[executor.submit(fn, item[1])] = item[0]
+        if not pending:
+            return
+        done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+        for future in done:
+            index = pending.pop(future)
+            if ordered:
+                completed[index] = future
+            else:
+                yield future.result()
+        while next_index in completed:
+            yield completed.pop(next_index).result()
+            next_index += 1
+
+
+def generate_many(
+    structures,
+    calculation_presets=None,
+    custom_sett_file=None,
+    custom_sett_dict=None,
+    specify_potentials=None,
+    write_location=None,
+    filenames=None,
+    max_workers=None,
+    chunksize=64,
+    incremental=False,
+    stats=None,
+    strict=False,
+    output_target=None,
+    layout=None,
+    keys=None,
+    supercell=None,
+    auto_cutoffs=False,
+):
+    """Generate pw.x input for a sequence of crystal structures.
+
+    Calculation settings (presets, custom settings file and dictionary) are
+    merged, pseudopotentials are matched to elements, and the namelists are
+    rendered (see :class:`PwxRenderPlan`), only once for the whole batch.
+    The resolved settings are sent once to each worker process, and the
+    structures are distributed among the workers in chunks, with at most two
+    chunks per worker submitted at a time (so that `structures` can be a
+    lazy iterable of any length).
+
+    Errors are not raised, but reported for each structure in the results.
+
+    Parameters
+    ----------
+    structures: iterable of :class:`ase.Atoms` objects
+        Crystal structures to generate input files for.
+
+    calculation_presets: str, optional
+        Name of the pw.x calculation presets to use for all structures.
+
+    custom_sett_file: str, optional
+        Location of a JSON file with custom calculation settings.
+
+    custom_sett_dict: dict, optional
+        Dictionary with custom calculation settings.
+
+    specify_potentials: bool, optional
+        Whether to set pseudopotentials for each chemical species.
+
+        Default: False
+
+    write_location: str, optional
+        Directory to write the input files in (created if missing). If not
+        specified, the rendered inputs are returned instead.
+
+    filenames: iterable of str, optional
+        Names of the input files, in the same order as `structures`.
+
+        Default: "[index]_[`calculation_presets`].in" ("[index]_pwx.in" if
+        no presets are specified).
+
+    max_workers: int, optional
+        Number of worker processes. If 1, input is generated serially in
+        the current process.
+
+        Default: number of processors on the machine.
+
+    chunksize: int, optional
+        Number of structures sent to a worker at a time.
+
+        Default: 64
+
+    incremental: bool, optional
+        Whether to skip input files in `write_location` that are already up
+        to date (see :class:`Manifest`). The manifest is loaded once before,
+        and saved once after, generating input for all structures.
+
+        Default: False
+
+    stats: :class:`GenerationStats`, optional
+        Object to aggregate the wall time and number of calls of each phase
+        of input generation in, over all structures (and worker processes).
+
+        Default: None (nothing is recorded)
+
+    strict: bool, optional
+        Whether to check the calculation settings up front, and raise a
+        `PwxInputGeneratorError` if any of them would not be written to the
+        input files (e.g. misspelled tags; see `check_pwx_settings`).
+
+        Default: False
+
+    output_target: :class:`OutputTarget`, optional
+        Target to write the input files to instead of `write_location`, e.g.
+        an :class:`ArchiveTarget`. Inputs are rendered by the workers and
+        written to the target, in order, by the current process. The caller
+        is responsible for closing the target.
+
+    layout: str or :class:`Layout`, optional
+        How to lay out the input files under `write_location` (or in the
+        output target), e.g. "sharded" to fan them out into subdirectories
+        by their keys (see :class:`ShardedLayout`). The directories needed
+        for each chunk of structures are created at once.
+
+        Default: "flat"
+
+    keys: iterable of str, optional
+        Keys identifying the inputs in keyed layouts, in the same order as
+        `structures`.
+
+        Default: derived from the crystal structure and settings of each
+        input (see `PwxInputGenerator.input_key`).
+
+    supercell: int, sequence of 3 ints, or (3, 3) array of ints, optional
+        Generate input for the same supercell of every structure, without
+        building the supercells (see `PwxInputGenerator.supercell`).
+
+    auto_cutoffs: bool, optional
+        Whether to use the cutoffs suggested by the pseudopotentials of the
+        species in each structure, unless specified in the custom settings
+        (see `PwxInputGenerator.auto_cutoffs`). The namelists are still
+        rendered only once, with slots for the cutoffs.
+
+        Default: False
+
+    Returns
+    -------
+    List of :class:`BatchResult` objects, one per input structure, in the
+    same order as `structures`.
+
+    """
+    if stats is None:
+        stats = NULL_STATS
+    if isinstance(output_target, DirectoryTarget):
+        write_location = output_target.write_location
+        output_target = None
+    with stats.phase("settings_merge"):
+        calc_sett = _resolve_settings(
+            calculation_presets, custom_sett_file, custom_sett_dict
+        )
+    if strict:
+        _validate_calculation_settings(calc_sett)
+    if specify_potentials:
+        with stats.phase("pseudo_resolution"):
+            calc_sett["pseudo_names"] = _resolve_pseudo_names(calc_sett)
+    # namelists are the same for all structures: render them only once
+    try:
+        with stats.phase("render_namelists"):
+            render_plan = PwxRenderPlan(
+                calc_sett,
+                specify_potentials=specify_potentials,
+                variable_tags=_CUTOFF_TAGS if auto_cutoffs else None,
+            )
+    except PwxInputGeneratorError:
+        # (errors are reported for each structure instead)
+        render_plan = None
+    if write_location is not None and not os.path.isdir(write_location):
+        os.makedirs(write_location)
+    manifest = None
+    if incremental and write_location is not None:
+        manifest = Manifest.load(write_location)
+    generator_presets = None
+    if auto_cutoffs:
+        # cutoffs from the presets are only defaults for each structure;
+        # custom cutoffs take precedence over the suggested ones
+        custom_sett = _resolve_settings(
+            None, custom_sett_file, custom_sett_dict
+        )
+        generator_presets = calculation_presets
+        calc_sett = {
+            tag: value
+            for tag, value in calc_sett.items()
+            if tag not in _CUTOFF_TAGS or tag in custom_sett
+        }
+    context = {
+        "auto_cutoffs": auto_cutoffs,
+        "calculation_presets": generator_presets,
+        # (frozen: shared by all generators in a worker, without copies)
+        "calculation_settings": freeze(calc_sett),
+        "layout": get_layout(layout),
+        "manifest": manifest,
+        "render_only": False,
+        "render_plan": render_plan,
+        "stats_enabled": stats.enabled,
+        "supercell": supercell,
+        "specify_potentials": specify_potentials,
+        "write_location": write_location,
+    }
+
+    if filenames is None:
+        default_name = "{}.in".format(calculation_presets or "pwx")
+        filenames = (
+            "{}_{}".format(i, default_name) for i in itertools.count()
+        )
+    if keys is None:
+        keys = itertools.repeat(None)
+    items = (
+        (i, s, f, k)
+        for i, (s, f, k) in enumerate(zip(structures, filenames, keys))
+    )
+    if output_target is not None:
+        # inputs are rendered by the workers, and written here
+        context["write_location"] = None
+        context["render_only"] = True
+    chunks = iter_chunks(items, chunksize)
+
+    def _collect(chunk_results, chunk_stats):
+        if output_target is not None:
+            chunk_results = _write_to_target(
+                chunk_results, output_target, stats
+            )
+        results.extend(chunk_results)
+        if chunk_stats is not None:
+            stats.merge(chunk_stats)
+
+    results = []
+    if max_workers == 1:
+        # (the manifest is updated in place)
+        for chunk in chunks:
+            chunk_results, _, chunk_stats = _generate_chunk_with_context(
+                chunk, context
+            )
+            _collect(chunk_results, chunk_stats)
+    else:
+        # keep the garbage collector from touching objects that exist before
+        # the workers are forked (e.g. the frozen presets, and the context),
+        # so that their memory stays shared, copy-on-write
+        gc.freeze()
+        try:
+            with futures.ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_init_worker,
+                initargs=(context,),
+            ) as executor:
+                # submit only a few chunks per worker at a time, so that
+                # the structures are not all read (and pickled) up front;
+                # inputs are written to the output target in order
+                outcomes = _map_bounded(
+                    executor,
+                    _generate_chunk,
+                    chunks,
+                    window=2 * (max_workers or os.cpu_count() or 1),
+                    ordered=output_target is not None,
+                )
+                for chunk_results, entries, chunk_stats in outcomes:
+                    _collect(chunk_results, chunk_stats)
+                    if manifest is not None:
+                        for filename, entry in entries:
+                            manifest.add(filename, entry)
+        finally:
+            gc.unfreeze()
+    if manifest is not None:
+        manifest.save()
+    results.sort(key=lambda result: result.index)
+    return results
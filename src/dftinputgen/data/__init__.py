@@ -1,8 +1,9 @@
 import json
-import pkg_resources
+import functools
+from importlib import resources
 
 
-__all__ = ["STANDARD_ATOMIC_WEIGHTS"]
+__all__ = ["STANDARD_ATOMIC_WEIGHTS", "get_standard_atomic_weights"]
 
 
 """
@@ -17,8 +18,20 @@ Filtered as follows:
   is not necessarily the most likely value).
 
 """
-saw_file = pkg_resources.resource_filename(
-    "dftinputgen.data", "standard_atomic_weights.json"
-)
-with open(saw_file) as fr:
-    STANDARD_ATOMIC_WEIGHTS = json.load(fr)
+
+
+@functools.lru_cache(maxsize=None)
+def get_standard_atomic_weights():
+    """Standard atomic weights of all elements (loaded on first use)."""
+    saw_file = resources.files("dftinputgen.data").joinpath(
+        "standard_atomic_weights.json"
+    )
+    return json.loads(saw_file.read_text())
+
+
+def __getattr__(name):
+    # `STANDARD_ATOMIC_WEIGHTS` is loaded lazily, on first access
+    if name == "STANDARD_ATOMIC_WEIGHTS":
+        return get_standard_atomic_weights()
+    msg = "module {!r} has no attribute {!r}".format(__name__, name)
+    raise AttributeError(msg)
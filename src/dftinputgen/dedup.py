@@ -0,0 +1,565 @@
+"""Find duplicate crystal structures, to generate input only once for each."""
+
+import json
+import hashlib
+import itertools
+import functools
+import collections
+
+import numpy as np
+
+from dftinputgen.utils import StructureView
+
+
+__all__ = [
+    "StructureFingerprint",
+    "StructureDeduplicator",
+    "get_structure_fingerprint",
+]
+
+
+# fractional coordinates that are multiples of 1/24 (e.g. 1/2, 1/3, 1/4, 1/8)
+# are exactly on the grid that positions are rounded to
+_GRID_MULTIPLE = 24
+
+# number of nearest neighbors (of all species) of each atom whose distances
+# are compared to screen for near duplicates
+_NEIGHBOR_COUNT = 24
+
+# largest number of interatomic distances computed at a time
+_DISTANCES_PER_BLOCK = 1 << 20
+
+# safety factor on the largest difference between the neighbor distances of
+# near duplicates
+_DISTANCE_BOUND_FACTOR = 1.5
+
+
+StructureFingerprint = collections.namedtuple(
+    "StructureFingerprint",
+    [
+        "digest",
+        "formula",
+        "cell_parameters",
+        "cell",
+        "species_indices",
+        "scaled_positions",
+    ],
+)
+StructureFingerprint.__doc__ = """Canonical fingerprint of a crystal structure.
+
+`digest` is a hash of the canonical form of the structure, equal for
+structures that are identical within the tolerances (up to rounding at the
+boundaries of the tolerance grid); `formula` the species and number of atoms
+of each, as a tuple of (species, count) pairs; `cell_parameters` the lengths
+(in Angstrom) and angles (in degrees) of the Niggli-reduced cell; `cell` the
+Niggli-reduced cell in standard orientation; and `species_indices` and
+`scaled_positions` the species (index into the species in `formula`) and
+fractional coordinates of the atoms in the canonical form.
+"""
+
+
+def _get_reduced_structure(view):
+    """Niggli-reduced cell and fractional coordinates of the atoms in it."""
+    from ase.build.tools import niggli_reduce_cell
+    from ase.geometry import cell_to_cellpar
+
+    cell, op = niggli_reduce_cell(view.cell)
+    # reduced lattice vectors = op^T . (input lattice vectors)
+    positions = np.dot(view.scaled_positions, np.linalg.inv(op.T))
+    positions %= 1.0
+    positions %= 1.0
+    return cell, cell_to_cellpar(cell), positions
+
+
+@functools.lru_cache(maxsize=1)
+def _get_unimodular_matrices():
+    """All (3, 3) matrices with entries -1, 0, 1 and determinant +/-1.
+
+    Returns the matrices and their (integer) inverses.
+    """
+    matrices = np.array(list(itertools.product([-1, 0, 1], repeat=9)))
+    matrices = matrices.reshape(-1, 3, 3)
+    determinants = np.round(np.linalg.det(matrices))
+    matrices = matrices[np.abs(determinants) == 1]
+    inverses = np.round(np.linalg.inv(matrices)).astype(int)
+    return matrices, inverses
+
+
+def _get_lattice_automorphisms(cell, length_tolerance):
+    """Changes of basis that map a reduced cell onto itself.
+
+    Returns the inverses of the (M, 3, 3) integer matrices that transform
+    the lattice vectors of the (Niggli-reduced) cell into equivalent lattice
+    vectors (same lengths and angles, within the tolerance), i.e. the
+    matrices that transform fractional coordinates. For reduced cells, all
+    such matrices have entries -1, 0, or 1.
+    """
+    matrices, inverses = _get_unimodular_matrices()
+    metric = np.dot(cell, cell.T)
+    transformed = np.matmul(
+        np.matmul(matrices, metric), matrices.swapaxes(1, 2)
+    )
+    tolerance = 2 * length_tolerance * np.sqrt(metric.diagonal().max())
+    equal = np.all(np.abs(transformed - metric) < tolerance, axis=(1, 2))
+    return inverses[equal]
+
+
+def _get_origin_candidates(species_indices):
+    """Atoms of the least abundant species (any of them can be the origin)."""
+    counts = np.bincount(species_indices)
+    counts[counts == 0] = len(species_indices) + 1
+    return np.flatnonzero(species_indices == np.argmin(counts))
+
+
+def _iter_settings(species_indices, positions, automorphisms):
+    """Yield positions for every equivalent choice of basis and origin."""
+    origins = _get_origin_candidates(species_indices)
+    for inverse in automorphisms:
+        transformed = np.dot(positions, inverse)
+        for origin in origins:
+            yield (transformed - transformed[origin]) % 1.0
+
+
+def _get_neighbor_counts(formula):
+    """Number of nearest neighbors of each species to compare, per atom."""
+    natoms = sum(count for _, count in formula)
+    return [
+        max(1, int(round(_NEIGHBOR_COUNT * count / float(natoms))))
+        for _, count in formula
+    ]
+
+
+def _get_neighbor_distances(fingerprint):
+    """Distances from every atom to its nearest neighbors of each species.
+
+    Returns an (N, M) array with the distances from each atom to its k_s
+    nearest neighbors (in all periodic images) of each species s, in order
+    (see `_get_neighbor_counts`).
+    """
+    cell = fingerprint.cell
+    positions = fingerprint.scaled_positions
+    species = fingerprint.species_indices
+    counts = _get_neighbor_counts(fingerprint.formula)
+    # radius of a sphere with all the neighbors of each species, for atoms
+    # distributed uniformly in the cell (then increased until it is)
+    volume = abs(np.linalg.det(cell))
+    radius = max(
+        (3 * volume * count / (4 * np.pi * natoms)) ** (1.0 / 3)
+        for count, (_, natoms) in zip(counts, fingerprint.formula)
+    )
+    # (lengths of the reciprocal lattice vectors, without the 2 pi)
+    reciprocal = np.linalg.norm(np.linalg.inv(cell), axis=0)
+    diff = positions[np.newaxis] - positions[:, np.newaxis]
+    diff -= np.round(diff)
+    while True:
+        radius *= 1.5
+        # all images within `radius` of every atom
+        n_images = np.ceil(radius * reciprocal + 0.5).astype(int)
+        images = np.dot(
+            list(itertools.product(*[range(-n, n + 1) for n in n_images])),
+            cell,
+        )
+        # (minimum-image vectors are at most half a cell diagonal long)
+        reach = radius + 0.5 * np.linalg.norm(cell, axis=1).sum()
+        images = images[np.linalg.norm(images, axis=1) <= reach]
+        distances = [
+            _get_nearest_distances(
+                np.dot(diff[:, species == s], cell), images, count
+            )
+            for s, count in enumerate(counts)
+        ]
+        # (complete only if all neighbors are within `radius`)
+        if all(d.shape[1] == c for d, c in zip(distances, counts)):
+            if max(d[:, -1].max() for d in distances) <= radius:
+                return np.hstack(distances)
+
+
+def _get_nearest_distances(vectors, images, count):
+    """Distances from each atom to its `count` nearest neighbors, sorted.
+
+    `vectors` are the (N, K, 3) vectors from each atom to K other atoms
+    (the atom itself, if included, is skipped), and `images` the (M, 3)
+    lattice translations to them. Atoms are handled in blocks, so that at
+    most about `_DISTANCES_PER_BLOCK` distances are computed at a time.
+    """
+    count = min(count, vectors.shape[1] * len(images) - 1)
+    block_size = max(
+        1, _DISTANCES_PER_BLOCK // (vectors.shape[1] * len(images) or 1)
+    )
+    nearest = []
+    for start in range(0, len(vectors), block_size):
+        block = vectors[start:start + block_size, :, np.newaxis] + images
+        d = np.einsum("ijkl,ijkl->ijk", block, block).reshape(len(block), -1)
+        d[d < 1e-16] = np.inf
+        d = np.partition(d, count - 1, axis=1)[:, :count]
+        nearest.append(np.sqrt(np.sort(d, axis=1)))
+    return np.concatenate(nearest)
+
+
+def _get_distance_signature(fingerprint, length_tolerance, angle_tolerance):
+    """Neighbor distances to screen for near duplicates, and their bound.
+
+    The signature is, for every pair of species (a, b), the distances from
+    all atoms of species a to their nearest neighbors of species b, sorted.
+    It does not depend on the choice of lattice vectors, origin, or order
+    of the atoms. Moving atoms (and straining the cell) within the
+    tolerances changes every distance, and thus every element of the sorted
+    signature, by at most the bound returned.
+    """
+    distances = _get_neighbor_distances(fingerprint)
+    species = fingerprint.species_indices
+    signature = np.concatenate(
+        [
+            np.sort(distances[species == s], axis=0).T.ravel()
+            for s in range(len(fingerprint.formula))
+        ]
+    )
+    # largest change of a distance from the displacements of both atoms,
+    # and from differences in the lattice parameters (up to the tolerances)
+    reciprocal = np.linalg.norm(np.linalg.inv(fingerprint.cell), axis=0)
+    lengths = fingerprint.cell_parameters[:3]
+    strain = length_tolerance + 2 * lengths * np.radians(angle_tolerance)
+    bound = 2 * length_tolerance + np.sum(
+        distances.max() * reciprocal * strain
+    )
+    return signature, _DISTANCE_BOUND_FACTOR * bound
+
+
+def _argmin_rows(rows):
+    """Index of the lexicographically smallest row of a 2D array."""
+    candidates = np.arange(len(rows))
+    for column in rows.T:
+        values = column[candidates]
+        candidates = candidates[values == values.min()]
+        if len(candidates) == 1:
+            break
+    return candidates[0]
+
+
+def _get_canonical_positions(species_indices, positions, automorphisms, grid):
+    """Canonical positions, and their keys on the tolerance grid.
+
+    Every equivalent choice of lattice vectors (automorphism of the reduced
+    cell) and origin (atoms of the least abundant species) is tried, and the
+    one with the lexicographically smallest sorted keys is used. Each atom
+    is keyed by its species and the grid point nearest to it (relative to
+    the origin), encoded in a single integer, and all origins are tried at
+    once.
+    """
+    origins = _get_origin_candidates(species_indices)
+    strides = np.array([grid[1] * grid[2], grid[2], 1])
+    species_keys = species_indices * np.prod(grid)
+    best = None
+    for inverse in automorphisms:
+        transformed = np.dot(positions, inverse)
+        points = np.round(transformed * grid).astype(np.int64)
+        # (origins, atoms, 3)
+        shifted = (points - points[origins, np.newaxis]) % grid
+        keys = np.dot(shifted, strides) + species_keys
+        order = np.argsort(keys, axis=1, kind="stable")
+        keys = np.take_along_axis(keys, order, axis=1)
+        i = _argmin_rows(keys)
+        if best is None or keys[i].tolist() < best[0]:
+            best = (keys[i].tolist(), transformed, origins[i], order[i])
+    keys, transformed, origin, order = best
+    positions = (transformed[order] - transformed[origin]) % 1.0
+    return keys, positions, species_indices[order]
+
+
+def get_structure_fingerprint(
+    crystal_structure, length_tolerance=1e-2, angle_tolerance=0.1
+):
+    """Get the canonical fingerprint of a crystal structure.
+
+    The fingerprint does not depend on the order of the atoms, the choice of
+    origin, the choice of lattice vectors (via Niggli reduction, and the
+    symmetry of the reduced lattice), or the orientation of the structure in
+    space. (Mirror images of a structure have the same fingerprint.)
+
+    Parameters
+    ----------
+    crystal_structure: :class:`ase.Atoms` or :class:`StructureView` object
+        Crystal structure to fingerprint.
+
+    length_tolerance: float, optional
+        Tolerance (in Angstrom) for lattice parameters and atomic positions.
+
+        Default: 0.01
+
+    angle_tolerance: float, optional
+        Tolerance (in degrees) for the angles between lattice vectors.
+
+        Default: 0.1
+
+    Returns
+    -------
+    :class:`StructureFingerprint` of the crystal structure.
+
+    """
+    view = crystal_structure
+    if not isinstance(view, StructureView):
+        view = StructureView.from_atoms(crystal_structure)
+    cell, cellpar, positions = _get_reduced_structure(view)
+    counts = np.bincount(view.species_indices, minlength=len(view.species))
+    formula = tuple(zip(view.species, counts.tolist()))
+    automorphisms = _get_lattice_automorphisms(cell, length_tolerance)
+    # number of grid points along each lattice vector (a multiple of
+    # `_GRID_MULTIPLE`, so that special positions are on grid points)
+    grid = np.ceil(cellpar[:3] / length_tolerance / _GRID_MULTIPLE)
+    grid = (np.maximum(grid, 1) * _GRID_MULTIPLE).astype(int)
+    keys, positions, species_indices = _get_canonical_positions(
+        view.species_indices, positions, automorphisms, grid
+    )
+    rounded_cellpar = np.concatenate(
+        [
+            np.round(cellpar[:3] / length_tolerance),
+            np.round(cellpar[3:] / angle_tolerance),
+        ]
+    )
+    canonical = [formula, rounded_cellpar.astype(int).tolist(), keys]
+    digest = hashlib.sha256(json.dumps(canonical).encode()).hexdigest()
+    return StructureFingerprint(
+        digest=digest,
+        formula=formula,
+        cell_parameters=cellpar,
+        cell=cell,
+        species_indices=species_indices,
+        scaled_positions=positions,
+    )
+
+
+class _Bucket(object):
+    """Unique structures with the same formula and similar lattices.
+
+    The distance signatures (see `_get_distance_signature`) of all
+    structures are stacked in one array, to screen them all at once.
+    """
+
+    def __init__(self):
+        # (order added, name, fingerprint) of each structure
+        self.entries = []
+        self._signatures = None
+        self._bounds = None
+
+    def add(self, order, name, fingerprint, signature, bound):
+        n = len(self.entries)
+        if self._signatures is None:
+            self._signatures = np.empty((4, len(signature)))
+            self._bounds = np.empty(4)
+        elif n == len(self._bounds):
+            # (grow the arrays geometrically: amortized O(1) additions)
+            self._signatures = np.concatenate(
+                [self._signatures, np.empty_like(self._signatures)]
+            )
+            self._bounds = np.concatenate([self._bounds, self._bounds])
+        self._signatures[n] = signature
+        self._bounds[n] = bound
+        self.entries.append((order, name, fingerprint))
+
+    def candidates(self, signature, bound):
+        """Entries whose signatures are within the bounds of `signature`."""
+        n = len(self.entries)
+        if not n:
+            return []
+        differences = np.abs(self._signatures[:n] - signature).max(axis=1)
+        close = differences <= np.maximum(self._bounds[:n], bound)
+        return [self.entries[i] for i in np.flatnonzero(close)]
+
+
+class StructureDeduplicator(object):
+    """Find duplicates in a stream of crystal structures.
+
+    Structures are compared by their canonical fingerprints (see
+    `get_structure_fingerprint`). Exact duplicates (e.g. the same structure
+    with atoms reordered, shifted, or with a different choice of lattice
+    vectors) are found with a hash index of fingerprint digests. Near
+    duplicates (within the tolerances, but rounded differently) are found
+    among the unique structures with the same formula and similar lattice
+    parameters (looked up in buckets keyed by the rounded lattice
+    parameters), screened by the distances from every atom to its nearest
+    neighbors (which are compared for all structures in a bucket at once),
+    and only then compared atom by atom.
+
+    Only fingerprints of unique structures are kept, not the structures.
+    """
+
+    def __init__(self, length_tolerance=1e-2, angle_tolerance=0.1):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        length_tolerance: float, optional
+            Tolerance (in Angstrom) for lattice parameters and atomic
+            positions.
+
+            Default: 0.01
+
+        angle_tolerance: float, optional
+            Tolerance (in degrees) for angles between lattice vectors.
+
+            Default: 0.1
+
+        """
+        self.length_tolerance = length_tolerance
+        self.angle_tolerance = angle_tolerance
+        # fingerprint digest -> name of the unique structure
+        self._digests = {}
+        # (formula, rounded lattice parameters) -> unique structures
+        self._buckets = {}
+        # name of every structure -> name of the unique structure
+        self._mapping = collections.OrderedDict()
+
+    @property
+    def unique(self):
+        """Names of the unique structures, in the order they were added."""
+        return [name for name, rep in self._mapping.items() if name == rep]
+
+    @property
+    def duplicates(self):
+        """Names of duplicate structures -> names of their unique structure."""
+        return collections.OrderedDict(
+            (name, rep) for name, rep in self._mapping.items() if name != rep
+        )
+
+    @property
+    def mapping(self):
+        """Names of all structures -> names of their unique structure."""
+        return collections.OrderedDict(self._mapping)
+
+    def _is_near_duplicate(self, fingerprint, other):
+        """Do fingerprints with the same formula match within tolerances."""
+        lengths = fingerprint.cell_parameters[:3]
+        other_lengths = other.cell_parameters[:3]
+        if np.any(np.abs(lengths - other_lengths) > self.length_tolerance):
+            return False
+        angles = fingerprint.cell_parameters[3:]
+        other_angles = other.cell_parameters[3:]
+        if np.any(np.abs(angles - other_angles) > self.angle_tolerance):
+            return False
+        species = fingerprint.species_indices
+        other_species = other.species_indices
+        same_species = species[:, np.newaxis] == other_species[np.newaxis]
+        automorphisms = _get_lattice_automorphisms(
+            fingerprint.cell, self.length_tolerance
+        )
+        for positions in _iter_settings(
+            species, fingerprint.scaled_positions, automorphisms
+        ):
+            diff = positions[:, np.newaxis] - other.scaled_positions
+            diff -= np.round(diff)
+            distances = np.linalg.norm(np.dot(diff, fingerprint.cell), axis=2)
+            matched = same_species & (distances < self.length_tolerance)
+            if matched.any(axis=1).all() and matched.any(axis=0).all():
+                return True
+        return False
+
+    def _get_bucket_size(self):
+        """Widths of the buckets of lattice lengths and angles."""
+        return np.array(
+            [2 * self.length_tolerance] * 3 + [2 * self.angle_tolerance] * 3
+        )
+
+    def _get_bucket_key(self, fingerprint):
+        size = self._get_bucket_size()
+        rounded = np.floor(fingerprint.cell_parameters / size).astype(int)
+        return fingerprint.formula, tuple(rounded.tolist())
+
+    def _iter_bucket_keys(self, fingerprint):
+        """Keys of all buckets that may have near duplicates.
+
+        Buckets are twice as wide as the tolerances, so lattice parameters
+        within the tolerances are either in the same bucket or in the
+        adjacent one on the nearer side, along each lattice parameter.
+        """
+        scaled = fingerprint.cell_parameters / self._get_bucket_size()
+        rounded = np.floor(scaled).astype(int)
+        nearest = np.where(scaled - rounded < 0.5, -1, 1) + rounded
+        for key in itertools.product(*zip(rounded.tolist(), nearest.tolist())):
+            yield fingerprint.formula, key
+
+    def _find_near_duplicate(self, fingerprint, signature, bound):
+        """Name of the first unique structure within the tolerances."""
+        candidates = []
+        for key in self._iter_bucket_keys(fingerprint):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                candidates.extend(bucket.candidates(signature, bound))
+        for _, name, other in sorted(candidates, key=lambda c: c[0]):
+            if self._is_near_duplicate(fingerprint, other):
+                return name
+        return None
+
+    def add(self, crystal_structure, name=None):
+        """Add a crystal structure, and find the structure it duplicates.
+
+        Parameters
+        ----------
+        crystal_structure: :class:`ase.Atoms` or :class:`StructureView`
+            Crystal structure to add.
+
+        name: str, optional
+            Name of the structure (must be unique).
+
+            Default: number of structures added before this one.
+
+        Returns
+        -------
+        Name of the unique structure that this structure duplicates, or the
+        name of the structure itself if it is not a duplicate.
+
+        """
+        if name is None:
+            name = len(self._mapping)
+        if name in self._mapping:
+            msg = 'Structure "{}" already added'.format(name)
+            raise ValueError(msg)
+        fingerprint = get_structure_fingerprint(
+            crystal_structure,
+            length_tolerance=self.length_tolerance,
+            angle_tolerance=self.angle_tolerance,
+        )
+        rep = self._digests.get(fingerprint.digest)
+        if rep is None:
+            signature, bound = _get_distance_signature(
+                fingerprint, self.length_tolerance, self.angle_tolerance
+            )
+            rep = self._find_near_duplicate(fingerprint, signature, bound)
+            if rep is None:
+                rep = name
+                key = self._get_bucket_key(fingerprint)
+                bucket = self._buckets.setdefault(key, _Bucket())
+                bucket.add(
+                    len(self._mapping), name, fingerprint, signature, bound
+                )
+            # (exact hits for further copies of this structure)
+            self._digests[fingerprint.digest] = rep
+        self._mapping[name] = rep
+        return rep
+
+    def iter_unique(self, crystal_structures, names=None):
+        """Yield (name, structure) for each unique structure in a stream.
+
+        Duplicates are skipped (and recorded in `duplicates`). `names` are
+        the names of the structures, in the same order (default: as in
+        `add`).
+        """
+        if names is None:
+            names = itertools.repeat(None)
+        for crystal_structure, name in zip(crystal_structures, names):
+            if name is None:
+                name = len(self._mapping)
+            if self.add(crystal_structure, name=name) == name:
+                yield name, crystal_structure
+
+    def as_dict(self):
+        """Unique structures and duplicates as a JSON-serializable dict."""
+        return {
+            "unique": self.unique,
+            "duplicates": self.duplicates,
+        }
+
+    def dump(self, path):
+        """Write the unique structures and duplicates as JSON to a file."""
+        with open(path, "w") as fw:
+            json.dump(self.as_dict(), fw, indent=2)
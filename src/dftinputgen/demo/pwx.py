@@ -1,10 +1,66 @@
 """Demo generating input files for doing a calculation with pw.x."""
 
+import os
+import sys
 import json
 import argparse
+import itertools
 
 from dftinputgen.utils import read_crystal_structure
+from dftinputgen.utils import read_crystal_structures
+from dftinputgen.utils import expand_structure_paths
 from dftinputgen.qe.pwx import PwxInputGenerator
+from dftinputgen.qe.settings.calculation_presets import get_qe_presets
+from dftinputgen.batch import generate_many
+from dftinputgen.dedup import StructureDeduplicator
+from dftinputgen.stats import GenerationStats
+from dftinputgen.targets import ArchiveTarget
+
+
+class _SingleStructureAction(argparse.Action):
+    """Store the input crystal structure (-i).
+
+    Options that apply only to multiple input crystal structures (-I) are
+    rejected, if specified before -i (see `_ManyStructuresAction`).
+    """
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        given = getattr(namespace, "_many_structures_options", [])
+        if given:
+            msg = "not allowed with argument {}".format(given[0])
+            raise argparse.ArgumentError(self, msg)
+        setattr(namespace, self.dest, values)
+
+
+class _ManyStructuresAction(argparse.Action):
+    """Store an option that applies only to multiple crystal structures.
+
+    The option is rejected if a single crystal structure (-i) is specified,
+    instead of being silently ignored.
+    """
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        if getattr(namespace, "crystal_structure", None) is not None:
+            msg = "not allowed with argument -i/--crystal-structure"
+            raise argparse.ArgumentError(self, msg)
+        setattr(namespace, self.dest, values)
+        given = getattr(namespace, "_many_structures_options", [])
+        given.append("/".join(self.option_strings))
+        setattr(namespace, "_many_structures_options", given)
+
+
+def _get_structure_path_name(path):
+    """Path of a structure file without extension, as part of a file name.
+
+    Relative to the current directory if under it (else absolute), with the
+    directory separators replaced by "_", e.g. "bulk_fe_POSCAR" for
+    "bulk/fe/POSCAR".
+    """
+    name = os.path.relpath(os.path.splitext(path)[0])
+    if name.startswith(os.pardir):
+        name = os.path.abspath(name)
+    parts = name.replace(os.altsep or os.sep, os.sep).split(os.sep)
+    return "_".join(p for p in parts if p)
 
 
 def _get_default_parser():
@@ -14,22 +70,33 @@ def _get_default_parser():
 
 def build_pwx_parser(parser):
     """Adds pw.x arguments to the input `argparse.ArgumentParser` object."""
-    # Required:
+    # Required (one of):
+    structures_group = parser.add_mutually_exclusive_group(required=True)
     crystal_structure = "(REQUIRED) File with the input crystal structure"
-    parser.add_argument(
+    structures_group.add_argument(
         "-i",
         "--crystal-structure",
         type=read_crystal_structure,
+        action=_SingleStructureAction,
         help=crystal_structure,
-        required=True,
+    )
+
+    crystal_structures = """(REQUIRED, if not -i) Files, directories, or
+    glob patterns with input crystal structures. Every frame in multi-frame
+    files (e.g. trajectories, extxyz) is used. One input file is written per
+    crystal structure."""
+    structures_group.add_argument(
+        "-I", "--crystal-structures", nargs="+", help=crystal_structures,
     )
 
     # Optional:
-    calculation_presets = "Preset group of tags and default values to use"
+    calculation_presets = """Preset group of tags and default values to use
+    (built-in: scf, relax, vc-relax; or site-specific presets in the
+    directories in DFTINPUTGEN_PRESETS_PATH)"""
     parser.add_argument(
         "-pre",
         "--calculation-presets",
-        choices=["scf", "relax", "vc-relax"],
+        type=_get_calculation_presets,
         default=None,
         help=calculation_presets,
     )
@@ -67,9 +134,121 @@ def build_pwx_parser(parser):
     pwx_input_file = "Name of the pw.x input file"
     parser.add_argument("-o", "--pwx-input-file", help=pwx_input_file)
 
+    auto_cutoffs = """Use the kinetic energy cutoffs suggested by the
+    pseudopotentials of all species (unless specified in custom settings)"""
+    parser.add_argument(
+        "--auto-cutoffs", action="store_true", help=auto_cutoffs
+    )
+
+    supercell = """Generate input for a supercell of the crystal
+    structure(s): number of repetitions of the cell along all lattice
+    vectors (N), along each (N1 N2 N3), or a 3x3 transformation matrix (9
+    integers, row by row)"""
+    parser.add_argument("--supercell", nargs="+", type=int, help=supercell)
+
+    # Optional, with multiple input crystal structures (-I) only:
+    index = """Frames to read from each crystal structure file, e.g. ":"
+    (all), "-1" (last), "::10" (every 10th)"""
+    parser.add_argument(
+        "--index", default=":", action=_ManyStructuresAction, help=index
+    )
+
+    output_template = """Template for names of the pw.x input files.
+    Available fields: {path} (path to the structure file, relative to the
+    current directory if under it, without extension, and with "_" for
+    directory separators), {stem} (name of the structure file without
+    extension), {frame} (position of the frame among those read from the
+    file), {index} (position of the structure among all structures),
+    {preset} (calculation presets, or "pwx")"""
+    parser.add_argument(
+        "-t",
+        "--output-template",
+        default="{path}_{frame}_{preset}.in",
+        action=_ManyStructuresAction,
+        help=output_template,
+    )
+
+    jobs = "Number of parallel worker processes"
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        action=_ManyStructuresAction,
+        help=jobs,
+    )
+
+    incremental = """Skip writing input files that are up to date, i.e.
+    generated earlier from the same crystal structure and settings, and not
+    modified since"""
+    parser.add_argument(
+        "--incremental", action="store_true", help=incremental
+    )
+
+    stats = """Write the wall time and number of calls of each phase of input
+    generation, as JSON, to this file"""
+    parser.add_argument("--stats", metavar="STATS_FILE", help=stats)
+
+    strict = """Fail if any calculation settings would not be written to the
+    input files, e.g. misspelled tags, or tags in namelists not written"""
+    parser.add_argument("--strict", action="store_true", help=strict)
+
+    archive = """Write all input files into a single archive at this path
+    instead of a directory (format from the extension: .tar, .tar.gz/.tgz,
+    .tar.bz2, .tar.xz, or .zip), along with an index of archive members
+    ([ARCHIVE].index.json)"""
+    parser.add_argument("--archive", help=archive)
+
+    layout = """Layout of the input files: "flat" (all in the same directory),
+    or "sharded" (each in its own directory, fanned out by a hash of its key,
+    e.g. ab/cd/[KEY]/scf.in)"""
+    parser.add_argument(
+        "--layout", choices=["flat", "sharded"], default="flat", help=layout
+    )
+
+    key_template = """Template for the keys of inputs in a sharded layout,
+    with the same fields as --output-template (default: a hash of the
+    crystal structure and settings)"""
+    parser.add_argument(
+        "--key-template", action=_ManyStructuresAction, help=key_template
+    )
+
+    dedup = """Skip crystal structures that duplicate earlier ones (within
+    tolerances, irrespective of the order of atoms, origin, choice of lattice
+    vectors, and orientation), and write the names of the input files of
+    unique structures and of duplicates, as JSON, to this file"""
+    parser.add_argument(
+        "--dedup",
+        metavar="MAPPING_FILE",
+        action=_ManyStructuresAction,
+        help=dedup,
+    )
+
+
+def _get_calculation_presets(name):
+    """Name of calculation presets from the command line (if registered)."""
+    presets = get_qe_presets()
+    if name not in presets:
+        msg = "invalid choice: {!r} (choose from {})".format(
+            name, ", ".join(repr(p) for p in sorted(presets))
+        )
+        raise argparse.ArgumentTypeError(msg)
+    return name
+
+
+def _get_supercell(supercell):
+    """Supercell from the command line (None, or 1, 3, or 9 integers)."""
+    if supercell is not None and len(supercell) == 9:
+        return [supercell[0:3], supercell[3:6], supercell[6:9]]
+    return supercell
+
 
 def generate_pwx_input_files(args):
-    """Write input files for the input crystal structure."""
+    """Write input files for the input crystal structure(s)."""
+    if getattr(args, "crystal_structures", None):
+        generate_many_pwx_input_files(args)
+        return
+    stats = GenerationStats() if args.stats else None
     pwig = PwxInputGenerator(
         crystal_structure=args.crystal_structure,
         calculation_presets=args.calculation_presets,
@@ -78,8 +257,115 @@ def generate_pwx_input_files(args):
         specify_potentials=args.specify_potentials,
         write_location=args.write_location,
         pwx_input_file=args.pwx_input_file,
+        incremental=getattr(args, "incremental", False),
+        stats=stats,
+        layout=args.layout,
+        supercell=_get_supercell(args.supercell),
+        auto_cutoffs=args.auto_cutoffs,
+    )
+    if args.strict:
+        pwig.validate_calculation_settings()
+    if args.archive:
+        with ArchiveTarget(args.archive) as target:
+            pwig.output_target = target
+            pwig.write_input_files()
+    else:
+        pwig.write_input_files()
+    if stats is not None:
+        stats.dump(args.stats)
+
+
+def generate_many_pwx_input_files(args):
+    """Write input files for all crystal structures in the input files."""
+    read_errors = []
+    names = []
+    deduplicator = StructureDeduplicator() if args.dedup else None
+
+    def _iter_structures():
+        index = 0
+        preset = args.calculation_presets or "pwx"
+        for path in expand_structure_paths(args.crystal_structures):
+            try:
+                frames = read_crystal_structures(path, index=args.index)
+            except Exception as err:
+                read_errors.append((path, err))
+                continue
+            stem = os.path.splitext(os.path.basename(path))[0]
+            path_name = _get_structure_path_name(path)
+            for frame, crystal_structure in enumerate(frames):
+                fields = dict(
+                    path=path_name,
+                    stem=stem,
+                    frame=frame,
+                    index=index,
+                    preset=preset,
+                )
+                index += 1
+                name = args.output_template.format(**fields)
+                if deduplicator is not None:
+                    if deduplicator.add(crystal_structure, name) != name:
+                        continue
+                names.append(name)
+                key = None
+                if args.key_template:
+                    key = args.key_template.format(**fields)
+                yield crystal_structure, name, key
+
+    write_location = args.write_location or os.getcwd()
+    stats = GenerationStats() if args.stats else None
+    output_target = None
+    if args.archive:
+        output_target = ArchiveTarget(args.archive)
+        write_location = None
+    structures, filenames, keys = itertools.tee(_iter_structures(), 3)
+    try:
+        results = generate_many(
+            (s for s, _, _ in structures),
+            calculation_presets=args.calculation_presets,
+            custom_sett_file=args.custom_settings_file,
+            custom_sett_dict=args.custom_settings_dict,
+            specify_potentials=args.specify_potentials,
+            write_location=write_location,
+            filenames=(f for _, f, _ in filenames),
+            max_workers=args.jobs,
+            incremental=args.incremental,
+            stats=stats,
+            strict=args.strict,
+            output_target=output_target,
+            layout=args.layout,
+            keys=(k for _, _, k in keys),
+            supercell=_get_supercell(args.supercell),
+            auto_cutoffs=args.auto_cutoffs,
+        )
+    finally:
+        if output_target is not None:
+            output_target.close()
+    if stats is not None:
+        stats.dump(args.stats)
+    if deduplicator is not None:
+        deduplicator.dump(args.dedup)
+
+    written = [r for r in results if r.error is None and r.written]
+    skipped = [r for r in results if r.error is None and not r.written]
+    failed = [r for r in results if r.error is not None]
+    msg = "Wrote {} pw.x input file(s) in {}".format(
+        len(written), args.archive or write_location
     )
-    pwig.write_input_files()
+    if skipped:
+        msg += " ({} up to date)".format(len(skipped))
+    if deduplicator is not None and deduplicator.duplicates:
+        msg += " ({} duplicate(s) skipped)".format(
+            len(deduplicator.duplicates)
+        )
+    print(msg)
+    for path, err in read_errors:
+        msg = 'Failed to read crystal structure(s) from "{}": {}'
+        print(msg.format(path, err), file=sys.stderr)
+    for r in failed:
+        msg = 'Failed to generate "{}": {}'
+        print(msg.format(names[r.index], r.error), file=sys.stderr)
+    if read_errors or failed:
+        sys.exit(1)
 
 
 def run_demo(*sys_args):
@@ -0,0 +1,116 @@
+"""Layouts of input files in directories, for very large campaigns."""
+
+import os
+import hashlib
+
+
+__all__ = ["Layout", "FlatLayout", "ShardedLayout", "get_layout"]
+
+
+class Layout(object):
+    """Base class for layouts of input files under a directory.
+
+    A layout maps the name of an input file, and a key identifying the
+    input (e.g. a hash of the crystal structure and settings, or a
+    user-specified id), to a path relative to the directory written to.
+    """
+
+    # whether paths depend on the key of the input
+    keyed = False
+
+    def __init__(self):
+        # directories already created (or known to exist)
+        self._created = set()
+
+    def relpath(self, key, filename):
+        """Path of an input file relative to the directory written to."""
+        raise NotImplementedError
+
+    def lookup(self, write_location, key, filename=None):
+        """Path to the directory (or file) of the input with the key `key`."""
+        path = os.path.join(write_location, self.relpath(key, filename or ""))
+        return path.rstrip(os.sep) if filename is None else path
+
+    def make_dirs(self, write_location, relpaths):
+        """Create the parent directories of many input files at once.
+
+        Every directory is created only once (including its parents), in
+        sorted order, and directories created earlier are not checked again.
+        """
+        dirnames = set()
+        for relpath in relpaths:
+            dirname = os.path.dirname(os.path.join(write_location, relpath))
+            if dirname and dirname not in self._created:
+                dirnames.add(dirname)
+        for dirname in sorted(dirnames):
+            os.makedirs(dirname, exist_ok=True)
+            self._created.add(dirname)
+
+
+class FlatLayout(Layout):
+    """All input files directly in the directory written to."""
+
+    def relpath(self, key, filename):
+        """The file name itself (keys are not used)."""
+        return filename
+
+
+class ShardedLayout(Layout):
+    """Input files fanned out into sharded subdirectories.
+
+    The input with the key `key` is written to
+    "[shard 1]/[shard 2]/.../[key]/[filename]", e.g. "ab/cd/[key]/scf.in",
+    where the shards are taken from the SHA-256 hash of the key (so that
+    inputs are spread evenly over the shards, whatever the keys are). With
+    the default 2 levels of 2 hex characters each, there are at most 256
+    subdirectories in any directory, for up to ~10^7 inputs.
+    """
+
+    keyed = True
+
+    def __init__(self, levels=2, width=2):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        levels: int, optional
+            Number of levels of shard directories.
+
+            Default: 2
+
+        width: int, optional
+            Number of hex characters in the name of each shard directory.
+
+            Default: 2
+
+        """
+        super(ShardedLayout, self).__init__()
+        self.levels = levels
+        self.width = width
+
+    def shards(self, key):
+        """Names of the shard directories for the key `key`."""
+        digest = hashlib.sha256(str(key).encode()).hexdigest()
+        ends = range(self.width, (self.levels + 1) * self.width, self.width)
+        return [digest[end - self.width:end] for end in ends]
+
+    def relpath(self, key, filename):
+        """Sharded path of an input file, e.g. "ab/cd/[key]/scf.in"."""
+        key = str(key)
+        if not key or os.sep in key or key in (".", ".."):
+            msg = 'Invalid key "{}" for a sharded layout'.format(key)
+            raise ValueError(msg)
+        return os.path.join(*(self.shards(key) + [key, filename]))
+
+
+def get_layout(layout):
+    """Get a layout from its name ("flat" or "sharded"), or as is."""
+    if layout is None or layout == "flat":
+        return FlatLayout()
+    if layout == "sharded":
+        return ShardedLayout()
+    if isinstance(layout, Layout):
+        return layout
+    msg = 'Unknown layout "{}"'.format(layout)
+    raise ValueError(msg)
@@ -0,0 +1,147 @@
+"""Manifest of generated input files, for incremental regeneration."""
+
+import os
+import json
+
+
+__all__ = ["MANIFEST_FILENAME", "Manifest"]
+
+
+# name of the manifest file in each directory input files are written to
+MANIFEST_FILENAME = ".dftinputgen_manifest.json"
+
+
+class Manifest(object):
+    """Record of input files written to a directory, with content hashes.
+
+    For every input file written (relative path), the manifest records a
+    hash of everything the input was generated from (`input_hash`), a hash
+    of the written content (`output_hash`), and the size and modification
+    time of the file when it was written.
+
+    A file is considered up to date if its input hash is unchanged, and the
+    file on disk has not been modified (or deleted) since it was written.
+
+    A manifest can be kept open for a directory while writing many files to
+    it (see `open`), and used as a context manager, to be saved on exit.
+    """
+
+    # manifests kept open, by absolute path of their directory
+    _open_manifests = {}
+
+    def __init__(self, write_location, entries=None):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        write_location: str
+            Path to the directory the input files are written to.
+
+        entries: dict, optional
+            Records of files written, as {filename: {"input_hash": ...,
+            "output_hash": ..., "size": ..., "mtime_ns": ...}}.
+
+            Default: {}
+
+        """
+        self.write_location = write_location
+        self.entries = dict(entries or {})
+
+    @property
+    def path(self):
+        """Path to the manifest file."""
+        return os.path.join(self.write_location, MANIFEST_FILENAME)
+
+    @classmethod
+    def load(cls, write_location):
+        """Load the manifest from a directory (empty if there is none)."""
+        manifest = cls(write_location)
+        if os.path.isfile(manifest.path):
+            with open(manifest.path, "r") as fr:
+                manifest.entries = json.load(fr)
+        return manifest
+
+    @classmethod
+    def open(cls, write_location):
+        """Load the manifest of a directory, and keep it open until closed.
+
+        While a manifest is open, input generators writing incrementally to
+        its directory check and record files in it, instead of loading and
+        saving the manifest from disk for every file. Use as a context
+        manager, e.g.::
+
+            with Manifest.open(write_location):
+                for pwig in generators:
+                    pwig.write_input_files()
+
+        """
+        manifest = cls.load(write_location)
+        cls._open_manifests[manifest._key] = manifest
+        return manifest
+
+    @classmethod
+    def get_open(cls, write_location):
+        """Manifest kept open for a directory (None if there is none)."""
+        return cls._open_manifests.get(os.path.abspath(write_location))
+
+    @property
+    def _key(self):
+        return os.path.abspath(self.write_location)
+
+    def close(self):
+        """Save the manifest, and stop keeping it open (if it is)."""
+        self.save()
+        if self._open_manifests.get(self._key) is self:
+            del self._open_manifests[self._key]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def save(self):
+        """Write the manifest to disk (atomically replacing any old one)."""
+        tmp_path = "{}.part".format(self.path)
+        with open(tmp_path, "w") as fw:
+            json.dump(self.entries, fw, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def _relpath(self, filename):
+        path = os.path.join(self.write_location, filename)
+        return os.path.relpath(path, self.write_location)
+
+    def get(self, filename):
+        """Manifest entry for a file (None if the file was not recorded)."""
+        return self.entries.get(self._relpath(filename))
+
+    def is_current(self, filename, input_hash):
+        """Is the file up to date with respect to the specified input hash."""
+        entry = self.get(filename)
+        if entry is None or entry["input_hash"] != input_hash:
+            return False
+        try:
+            stat = os.stat(os.path.join(self.write_location, filename))
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime_ns) == (
+            entry["size"],
+            entry["mtime_ns"],
+        )
+
+    def add(self, filename, entry):
+        """Add the entry for a file, e.g. one recorded in another process."""
+        self.entries[self._relpath(filename)] = entry
+
+    def record(self, filename, input_hash, output_hash):
+        """Record a file just written, and return the manifest entry."""
+        stat = os.stat(os.path.join(self.write_location, filename))
+        entry = {
+            "input_hash": input_hash,
+            "output_hash": output_hash,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+        self.add(filename, entry)
+        return entry
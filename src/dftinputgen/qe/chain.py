@@ -0,0 +1,371 @@
+"""Generate chained pw.x inputs that restart each step from the last one."""
+
+import os
+import json
+import collections
+
+from dftinputgen.targets import DirectoryTarget
+from dftinputgen.qe.settings.calculation_presets import get_qe_presets
+from dftinputgen.qe.pwx import PwxInputGenerator
+from dftinputgen.qe.pwx import PwxInputGeneratorError
+
+
+__all__ = ["PwxChain", "PwxChainError", "ChainStep", "DEFAULT_STEPS"]
+
+
+# steps of a typical relaxation workflow (names of calculation presets)
+DEFAULT_STEPS = ("relax", "vc-relax", "scf")
+
+# tags shared by all steps, so that they read/write the same files
+_SHARED_TAGS = ("prefix", "outdir")
+_DEFAULT_OUTDIR = "./out"
+
+# settings that must be the same in two steps to restart from the charge
+# density (potential) or wavefunctions of the previous step
+_POTENTIAL_TAGS = ("nspin", "noncolin", "lspinorb")
+_WAVEFUNCTION_TAGS = (
+    "nspin",
+    "noncolin",
+    "lspinorb",
+    "ecutwfc",
+    "nbnd",
+    "occupations",
+    "kpoints",
+)
+
+# calculations that change the crystal structure
+_STRUCTURE_CHANGING = ("relax", "vc-relax", "md", "vc-md")
+
+
+class PwxChainError(PwxInputGeneratorError):
+    """Base class for errors in setting up chained calculations."""
+
+    pass
+
+
+ChainStep = collections.namedtuple(
+    "ChainStep",
+    ["name", "generator", "depends_on", "restart", "structure_from"],
+)
+ChainStep.__doc__ = """One step in a chain of pw.x calculations.
+
+`name` is the name of the calculation presets of the step, `generator` the
+:class:`PwxInputGenerator` for the step, `depends_on` the name of the
+previous step (None for the first step), and `restart` the settings used to
+restart from the files written by the previous step (e.g.
+{"startingpot": "file", "startingwfc": "file"}). `structure_from` is the name
+of the previous step if it changes the crystal structure (e.g. "relax"),
+i.e. if the crystal structure in the input should be updated from the
+output of that step before running this one; else None.
+"""
+
+
+def _get_ecutrho(calc_sett):
+    ecutwfc = calc_sett.get("ecutwfc")
+    return calc_sett.get("ecutrho", None if ecutwfc is None else 4 * ecutwfc)
+
+
+def _get_restart_settings(previous_sett, calc_sett):
+    """Settings to restart from the files written with `previous_sett`.
+
+    The charge density can be read if the spin treatment and density cutoff
+    are the same; the wavefunctions if, in addition, the wavefunction cutoff,
+    the number of bands, and the k-points are the same, and the structure
+    was not changed by the previous calculation (e.g. "relax").
+    """
+    restart = {}
+
+    def _same(tags):
+        return all(previous_sett.get(t) == calc_sett.get(t) for t in tags)
+
+    if not _same(_POTENTIAL_TAGS):
+        return restart
+    if _get_ecutrho(previous_sett) != _get_ecutrho(calc_sett):
+        return restart
+    restart["startingpot"] = "file"
+    # (wavefunctions do not match the structure after it is relaxed)
+    if previous_sett.get("calculation") in _STRUCTURE_CHANGING:
+        return restart
+    if _same(_WAVEFUNCTION_TAGS):
+        restart["startingwfc"] = "file"
+    return restart
+
+
+class PwxChain(object):
+    """Chain of pw.x calculations on the same crystal structure.
+
+    Generates the inputs for a sequence of calculations run one after the
+    other, e.g. "relax" -> "vc-relax" -> "scf", such that each step starts
+    from the charge density (`startingpot`) and wavefunctions
+    (`startingwfc`) written by the previous step, instead of from scratch.
+    All steps use the same `prefix` and `outdir`, and the restart settings
+    are only used where the settings of consecutive steps are compatible.
+
+    The order of the steps and the files they depend on can be written as a
+    JSON manifest along with the input files (see `write_inputs`).
+    """
+
+    def __init__(
+        self,
+        crystal_structure,
+        steps=None,
+        custom_sett_file=None,
+        custom_sett_dict=None,
+        step_settings=None,
+        prefix=None,
+        outdir=None,
+        **kwargs
+    ):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        crystal_structure: :class:`ase.Atoms` object
+            Crystal structure to generate the chain of inputs for.
+
+        steps: list of str, optional
+            Names of the calculation presets of each step, in order.
+
+            Default: ["relax", "vc-relax", "scf"]
+
+        custom_sett_file: str, optional
+            Location of a JSON file with custom calculation settings for all
+            steps.
+
+        custom_sett_dict: dict, optional
+            Dictionary with custom calculation settings for all steps.
+
+        step_settings: dict, optional
+            Custom calculation settings for individual steps, as a
+            dictionary of step name -> settings (which override those in
+            `custom_sett_file` and `custom_sett_dict`), e.g.
+            {"scf": {"degauss": 0.01}}.
+
+        prefix: str, optional
+            `prefix` of the files written by pw.x, the same for all steps.
+
+            Default: `prefix` in the custom settings (`custom_sett_file` or
+            `custom_sett_dict`), if any, else the chemical formula and a
+            hash of the crystal structure, e.g. "Fe2O2_1a2b3c4d".
+
+        outdir: str, optional
+            Directory for the files written by pw.x (`outdir`), the same for
+            all steps.
+
+            Default: `outdir` in the custom settings, if any, else "./out".
+
+        **kwargs:
+            Other arguments to :class:`PwxInputGenerator` for every step,
+            e.g. `specify_potentials`, `write_location`, `output_target`,
+            or `supercell`.
+
+        """
+        self._steps = tuple(DEFAULT_STEPS if steps is None else steps)
+        self._validate_steps(self._steps)
+        step_settings = dict(step_settings or {})
+        for name, settings in step_settings.items():
+            if name not in self._steps:
+                msg = 'Settings for unknown step "{}"'.format(name)
+                raise PwxChainError(msg)
+            shared = [tag for tag in _SHARED_TAGS if tag in settings]
+            if shared:
+                msg = "[{}] must be the same for all steps".format(
+                    ", ".join(shared)
+                )
+                raise PwxChainError(msg)
+        self._crystal_structure = crystal_structure
+        self._custom_sett_file = custom_sett_file
+        self._custom_sett_dict = dict(custom_sett_dict or {})
+        self._step_settings = step_settings
+        self._kwargs = kwargs
+        self._prefix = prefix
+        self._outdir = outdir
+        self._base_generator = None
+        self._chain = None
+
+    @staticmethod
+    def _validate_steps(steps):
+        if not steps:
+            msg = "No steps specified"
+            raise PwxChainError(msg)
+        presets = get_qe_presets()
+        for name in steps:
+            if name not in presets:
+                msg = 'Unknown calculation presets "{}"'.format(name)
+                raise PwxChainError(msg)
+        if len(set(steps)) < len(steps):
+            msg = "Steps must be unique: [{}]".format(", ".join(steps))
+            raise PwxChainError(msg)
+
+    @property
+    def step_names(self):
+        """Names of the calculation presets of each step, in order."""
+        return self._steps
+
+    @property
+    def outdir(self):
+        """Directory for the files written by pw.x, for all steps."""
+        if self._outdir is None:
+            calc_sett = self._get_base_generator().calculation_settings
+            self._outdir = calc_sett.get("outdir") or _DEFAULT_OUTDIR
+        return self._outdir
+
+    @property
+    def prefix(self):
+        """Prefix of the files written by pw.x, for all steps."""
+        if self._prefix is None:
+            calc_sett = self._get_base_generator().calculation_settings
+            self._prefix = calc_sett.get("prefix")
+        if self._prefix is None:
+            self._prefix = self._get_default_prefix()
+        return self._prefix
+
+    def _get_base_generator(self):
+        """Generator of the first step, with the custom settings only."""
+        if self._base_generator is None:
+            self._base_generator = self._make_generator(self._steps[0], {})
+        return self._base_generator
+
+    def _get_default_prefix(self):
+        """Chemical formula and a hash of the structure, e.g. "Fe2O2_1a2b"."""
+        pwig = self._get_base_generator()
+        formula = self._crystal_structure.get_chemical_formula()
+        return "{}_{}".format(formula, pwig.structure_hash[:8])
+
+    def _make_generator(self, name, chain_sett):
+        custom_sett = dict(self._custom_sett_dict)
+        custom_sett.update(chain_sett)
+        custom_sett.update(self._step_settings.get(name, {}))
+        return PwxInputGenerator(
+            crystal_structure=self._crystal_structure,
+            calculation_presets=name,
+            custom_sett_file=self._custom_sett_file,
+            custom_sett_dict=custom_sett,
+            **self._kwargs
+        )
+
+    @property
+    def steps(self):
+        """All steps of the chain, in order, as `ChainStep` objects."""
+        if self._chain is not None:
+            return self._chain
+        shared = {"prefix": self.prefix, "outdir": self.outdir}
+        chain = []
+        previous = None
+        for name in self._steps:
+            pwig = self._make_generator(name, shared)
+            if "input_key" not in self._kwargs:
+                # (all steps in the same directory in keyed layouts)
+                pwig.input_key = self.prefix
+            restart = {}
+            structure_from = None
+            if previous is not None:
+                previous_sett = previous.generator.calculation_settings
+                restart = _get_restart_settings(
+                    previous_sett, pwig.calculation_settings
+                )
+                # restart settings specified by the user take precedence
+                user_tags = set(self._custom_sett_dict)
+                user_tags.update(pwig.custom_sett_from_file or {})
+                user_tags.update(self._step_settings.get(name, {}))
+                restart = {
+                    tag: value
+                    for tag, value in restart.items()
+                    if tag not in user_tags
+                }
+                if restart:
+                    pwig.custom_sett_dict = dict(
+                        pwig.custom_sett_dict, **restart
+                    )
+                calculation = previous_sett.get("calculation")
+                if calculation in _STRUCTURE_CHANGING:
+                    structure_from = previous.name
+            step = ChainStep(
+                name=name,
+                generator=pwig,
+                depends_on=None if previous is None else previous.name,
+                restart=restart,
+                structure_from=structure_from,
+            )
+            chain.append(step)
+            previous = step
+        self._chain = chain
+        return chain
+
+    @property
+    def manifest_dir(self):
+        """Directory of the inputs, relative to the location written to."""
+        return os.path.dirname(self.steps[0].generator.input_path)
+
+    def as_dict(self):
+        """Dependency manifest of the chain, as a JSON-serializable dict.
+
+        For every step: its name, the input file (relative to
+        `manifest_dir`), the steps it depends on (empty for the first step),
+        the restart settings used, and the step to update the crystal
+        structure from (see `ChainStep`).
+        """
+        steps = []
+        for step in self.steps:
+            input_path = step.generator.input_path
+            depends_on = [step.depends_on] if step.depends_on else []
+            steps.append(
+                {
+                    "name": step.name,
+                    "input": os.path.relpath(input_path, self.manifest_dir),
+                    "depends_on": depends_on,
+                    "restart": step.restart,
+                    "structure_from": step.structure_from,
+                }
+            )
+        return {"prefix": self.prefix, "outdir": self.outdir, "steps": steps}
+
+    def write_inputs(self, write_location=None, manifest_file="chain.json"):
+        """Write the input files of all steps, and the dependency manifest.
+
+        Parameters
+        ----------
+        write_location: str, optional
+            Path to the directory in which to write the input files and the
+            manifest (created if missing).
+
+            Default: the `output_target` of the input generators, i.e.
+            their `write_location` unless an `output_target` is specified.
+
+        manifest_file: str, optional
+            Name of the JSON file to write the dependency manifest to (see
+            `as_dict`), in the same directory as the input files, or None to
+            not write it.
+
+            Default: "chain.json"
+
+        Returns
+        -------
+        Dictionary of step name -> path of the input file written (for
+        other targets, e.g. archives, the name it is written under).
+
+        """
+        if write_location is not None:
+            target = DirectoryTarget(write_location)
+        else:
+            target = self.steps[0].generator.output_target
+        if isinstance(target, DirectoryTarget):
+            if target.write_location is None:
+                msg = "Location to write files not specified"
+                raise PwxChainError(msg)
+            location = target.path(self.manifest_dir)
+            if not os.path.isdir(location):
+                os.makedirs(location)
+        written = collections.OrderedDict()
+        for step in self.steps:
+            pwig = step.generator
+            pwig.write_pwx_input(filename=pwig.input_path, target=target)
+            if isinstance(target, DirectoryTarget):
+                written[step.name] = target.path(pwig.input_path)
+            else:
+                written[step.name] = pwig.input_path
+        if manifest_file is not None:
+            name = os.path.join(self.manifest_dir, manifest_file)
+            target.write(name, [json.dumps(self.as_dict(), indent=2)])
+        return written
@@ -0,0 +1,409 @@
+"""Read existing pw.x input files back into settings and crystal structures."""
+
+import os
+import re
+import six
+import collections
+from concurrent import futures
+
+import numpy as np
+
+from dftinputgen.utils import StructureView
+from dftinputgen.utils import iter_chunks
+from dftinputgen.qe.settings import get_qe_tags
+from dftinputgen.qe.settings import get_qe_tag_index
+from dftinputgen.qe.settings import check_pwx_settings
+from dftinputgen.base import DftInputGeneratorError
+
+
+__all__ = [
+    "PwxInput",
+    "PwxInputParserError",
+    "ParseResult",
+    "parse_pwx_input",
+    "read_pwx_input",
+    "read_many_pwx_inputs",
+]
+
+
+# conversion factor from Bohr to Angstrom (CODATA 2014, as in ASE)
+_BOHR_TO_ANGSTROM = 0.52917721067
+
+# names of cards in pw.x input files -> names used in calculation settings
+_CARD_NAMES = {"K_POINTS": "kpoints"}
+
+_RE_CARD_OPTION = re.compile(r"[{(]?\s*([A-Za-z_]+)\s*[})]?")
+_RE_INT = re.compile(r"^[+-]?\d+$")
+
+
+class PwxInputParserError(DftInputGeneratorError):
+    """Base class for errors in parsing pw.x input files."""
+
+    pass
+
+
+PwxInput = collections.namedtuple("PwxInput", ["settings", "structure"])
+PwxInput.__doc__ = """Contents of a pw.x input file.
+
+`settings` is a dictionary of calculation settings in the same format as the
+settings used by :class:`PwxInputGenerator` (tags and values from every
+namelist, "namelists", "cards", "kpoints", and "pseudo_names"), and
+`structure` a :class:`StructureView` of the crystal structure.
+"""
+
+
+ParseResult = collections.namedtuple(
+    "ParseResult", ["path", "pwx_input", "error"]
+)
+ParseResult.__doc__ = """Outcome of reading one pw.x input file.
+
+`path` is the path to the input file, `pwx_input` the :class:`PwxInput`
+read from it (None on failure), and `error` the exception raised while
+reading the file (None on success).
+"""
+
+
+def _canonical_tag(tag, canonical_tags):
+    """Tag as spelled in the tag tables, e.g. "A" for "a" or "A"."""
+    tag = tag.strip().lower()
+    base, paren, suffix = tag.partition("(")
+    return canonical_tags.get(base, base) + paren + suffix
+
+
+def _strip_comment(line):
+    """Remove "!"/"#" comments (outside of quoted strings) from a line."""
+    if "!" not in line and "#" not in line:
+        return line
+    quote = None
+    for i, char in enumerate(line):
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char in "!#":
+            return line[:i]
+    return line
+
+
+def _in_quotes(line, position):
+    """Is the character at `position` in a line inside a quoted string."""
+    prefix = line[:position]
+    return prefix.count("'") % 2 == 1 or prefix.count('"') % 2 == 1
+
+
+def _split_assignments(line):
+    """Split a line with comma-separated `tag = value` pairs."""
+    if "," not in line:
+        return [line]
+    pieces = []
+    quote = None
+    start = 0
+    for i, char in enumerate(line):
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == ",":
+            pieces.append(line[start:i])
+            start = i + 1
+    pieces.append(line[start:])
+    return [p for p in pieces if p.strip()]
+
+
+def _parse_qe_value(val):
+    """Convert the value of a QE tag from a string (inverse of formatting)."""
+    val = val.strip()
+    if val[:1] in ("'", '"') and val[-1:] == val[:1]:
+        return val[1:-1]
+    low = val.lower()
+    if low in (".true.", ".t."):
+        return True
+    if low in (".false.", ".f."):
+        return False
+    if _RE_INT.match(val):
+        return int(val)
+    try:
+        return float(low.replace("d", "e"))
+    except ValueError:
+        return val
+
+
+def _parse_card_option(header):
+    """Option of a card, e.g. "crystal" from "ATOMIC_POSITIONS {crystal}"."""
+    parts = header.split(None, 1)
+    if len(parts) < 2:
+        return None
+    match = _RE_CARD_OPTION.match(parts[1].strip())
+    return match.group(1).lower() if match else None
+
+
+def _get_alat(settings):
+    """Lattice parameter (in Angstrom) from `celldm(1)` or `A`."""
+    if "celldm(1)" in settings:
+        return settings["celldm(1)"] * _BOHR_TO_ANGSTROM
+    if "A" in settings:
+        return settings["A"]
+    msg = 'Lattice parameter ("celldm(1)" or "A") not specified'
+    raise PwxInputParserError(msg)
+
+
+def _scale_vectors(vectors, units, settings):
+    """Convert lattice vectors or positions in `units` to Angstrom."""
+    if units in (None, "angstrom"):
+        return vectors
+    if units == "bohr":
+        return vectors * _BOHR_TO_ANGSTROM
+    if units == "alat":
+        return vectors * _get_alat(settings)
+    msg = 'Unsupported units "{}"'.format(units)
+    raise PwxInputParserError(msg)
+
+
+def _parse_kpoints(option, rows):
+    """k-points settings from the K_POINTS card."""
+    scheme = option or "tpiba"
+    if scheme == "gamma":
+        return {"scheme": "gamma"}
+    if scheme == "automatic":
+        values = [int(v) for v in " ".join(rows).split()]
+        return {"scheme": "automatic", "grid": values[:3], "shift": values[3:]}
+    # explicit list of k-points: number of points, then one point per row
+    points = [[float(v) for v in row.split()] for row in rows[1:]]
+    return {"scheme": scheme, "points": points}
+
+
+def parse_pwx_input(lines):
+    """Parse the contents of a pw.x input file.
+
+    The input is read line by line in a single pass, so that it can be
+    streamed from an open file.
+
+    Parameters
+    ----------
+    lines: iterable of str
+        Lines of the pw.x input, e.g. an open file object.
+
+    Returns
+    -------
+    :class:`PwxInput` with the calculation settings and the crystal
+    structure.
+
+    Raises `PwxInputParserError` if the input is malformed (including tags
+    in the wrong namelist, tags assigned more than once, and `nat`/`ntyp`
+    that do not match the number of atoms/species in the cards), contains
+    tags that are unknown or would not be written back (see
+    `check_pwx_settings`), or specifies the crystal structure in a way that
+    is not supported (e.g. a Bravais lattice index, `ibrav`, other than 0).
+
+    """
+    pw_tags = get_qe_tags()["pw.x"]
+    known_namelists = set(pw_tags["namelists"])
+    known_cards = set(pw_tags["cards"])
+    tag_index = get_qe_tag_index("pw.x")
+    canonical_tags = {t.lower(): t for t in tag_index}
+    settings = {"namelists": [], "cards": []}
+    card_rows = {}
+    card_options = {}
+    namelist = None
+    card = None
+    for line in lines:
+        line = _strip_comment(line).strip()
+        if not line:
+            continue
+        if namelist is not None:
+            if line == "/":
+                namelist = None
+                continue
+            # (a namelist can also end on the same line as an assignment)
+            end = line.endswith("/") and not _in_quotes(line, len(line) - 1)
+            if end:
+                line = line[:-1]
+            for assignment in _split_assignments(line):
+                tag, sep, val = assignment.partition("=")
+                if not sep:
+                    msg = 'Cannot parse "{}" in &{}'.format(
+                        assignment.strip(), namelist.upper()
+                    )
+                    raise PwxInputParserError(msg)
+                tag = _canonical_tag(tag, canonical_tags)
+                # (unknown tags are reported with the other settings below)
+                entry = tag_index.get(tag.partition("(")[0])
+                if entry is not None and entry[0] != namelist:
+                    msg = 'Tag "{}" in &{} belongs to &{}'.format(
+                        tag, namelist.upper(), entry[0].upper()
+                    )
+                    raise PwxInputParserError(msg)
+                if tag in settings:
+                    msg = 'Tag "{}" assigned more than once'.format(tag)
+                    raise PwxInputParserError(msg)
+                settings[tag] = _parse_qe_value(val)
+            if end:
+                namelist = None
+            continue
+        if line.startswith("&"):
+            namelist = line[1:].split()[0].lower()
+            if namelist not in known_namelists:
+                msg = 'Unknown namelist "&{}"'.format(namelist.upper())
+                raise PwxInputParserError(msg)
+            settings["namelists"].append(namelist)
+            card = None
+            continue
+        header = line.split(None, 1)[0].upper()
+        name = _CARD_NAMES.get(header, header.lower())
+        if name in known_cards:
+            card = name
+            settings["cards"].append(card)
+            card_options[card] = _parse_card_option(line)
+            card_rows[card] = []
+            continue
+        if card is None:
+            msg = 'Cannot parse "{}" outside of a namelist or card'
+            raise PwxInputParserError(msg.format(line))
+        card_rows[card].append(line)
+
+    check = check_pwx_settings(settings)
+    if not check.ok:
+        msg = "Invalid pw.x input: {}".format("; ".join(check.messages()))
+        raise PwxInputParserError(msg)
+
+    unsupported = set(card_rows) - {
+        "atomic_species",
+        "atomic_positions",
+        "kpoints",
+        "cell_parameters",
+    }
+    if unsupported:
+        msg = "Parsing the {} card(s) is not supported".format(
+            ", ".join(c.upper() for c in sorted(unsupported))
+        )
+        raise PwxInputParserError(msg)
+
+    # e.g. truncated input files
+    for tag, card in [("nat", "atomic_positions"), ("ntyp", "atomic_species")]:
+        n_rows = len(card_rows.get(card, []))
+        if tag in settings and settings[tag] != n_rows:
+            msg = "{} = {}, but {} row(s) in {}".format(
+                tag, settings[tag], n_rows, card.upper()
+            )
+            raise PwxInputParserError(msg)
+
+    pseudo_names = {}
+    for row in card_rows.get("atomic_species", []):
+        fields = row.split()
+        if len(fields) > 2 and fields[2] != "None":
+            pseudo_names[fields[0]] = fields[2]
+    if pseudo_names:
+        settings["pseudo_names"] = pseudo_names
+
+    if "kpoints" in card_rows:
+        settings["kpoints"] = _parse_kpoints(
+            card_options["kpoints"], card_rows["kpoints"]
+        )
+
+    if settings.get("ibrav", 0) != 0 or "cell_parameters" not in card_rows:
+        msg = "Only crystal structures with CELL_PARAMETERS are supported"
+        raise PwxInputParserError(msg)
+    cell = np.array(
+        [row.split()[:3] for row in card_rows["cell_parameters"]], dtype=float
+    )
+    if cell.shape != (3, 3):
+        msg = "Expected 3 lattice vectors in CELL_PARAMETERS"
+        raise PwxInputParserError(msg)
+    cell = _scale_vectors(cell, card_options["cell_parameters"], settings)
+
+    rows = [row.split() for row in card_rows.get("atomic_positions", [])]
+    symbols = [row[0] for row in rows]
+    positions = np.array([row[1:4] for row in rows], dtype=float)
+    positions = positions.reshape(-1, 3)
+    option = card_options.get("atomic_positions") or "alat"
+    if option != "crystal":
+        cartesian = _scale_vectors(positions, option, settings)
+        positions = np.linalg.solve(cell.T, cartesian.T).T
+    species, species_indices = np.unique(symbols, return_inverse=True)
+    structure = StructureView(
+        species=species.tolist(),
+        species_indices=species_indices.reshape(-1),
+        scaled_positions=positions,
+        cell=cell,
+    )
+    return PwxInput(settings, structure)
+
+
+def read_pwx_input(path):
+    """Read a pw.x input file (see `parse_pwx_input`)."""
+    with open(path, "r") as fr:
+        return parse_pwx_input(fr)
+
+
+def _read_chunk(paths):
+    results = []
+    for path in paths:
+        try:
+            results.append(ParseResult(path, read_pwx_input(path), None))
+        except Exception as err:
+            results.append(ParseResult(path, None, err))
+    return results
+
+
+def _iter_input_paths(paths, pattern):
+    """Expand directories (recursively) into pw.x input files."""
+    if isinstance(paths, six.string_types):
+        paths = [paths]
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if re.match(pattern, filename):
+                    yield os.path.join(dirpath, filename)
+
+
+def read_many_pwx_inputs(
+    paths, pattern=r".*\.in$", max_workers=None, chunksize=256
+):
+    """Read many pw.x input files in parallel, e.g. to audit a campaign.
+
+    Errors are not raised, but reported for each file in the results.
+
+    Parameters
+    ----------
+    paths: str or iterable of str
+        Paths to pw.x input files, or directories to scan (recursively) for
+        input files.
+
+    pattern: str, optional
+        Regular expression that names of input files in directories must
+        match.
+
+        Default: r".*\\.in$"
+
+    max_workers: int, optional
+        Number of worker processes. If 1, files are read serially in the
+        current process.
+
+        Default: number of processors on the machine.
+
+    chunksize: int, optional
+        Number of files sent to a worker at a time.
+
+        Default: 256
+
+    Returns
+    -------
+    List of :class:`ParseResult` objects, one per input file, in the order
+    of `paths` (and sorted by name within each directory).
+
+    """
+    items = _iter_input_paths(paths, pattern)
+    if max_workers == 1:
+        return _read_chunk(items)
+    results = []
+    with futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        chunks = iter_chunks(items, chunksize)
+        for chunk_results in executor.map(_read_chunk, chunks):
+            results.extend(chunk_results)
+    return results
@@ -0,0 +1,102 @@
+"""Match chemical species to pseudopotential files in directories."""
+
+import os
+import six
+import threading
+
+from dftinputgen.utils import get_elem_symbol
+from dftinputgen.base import DftInputGeneratorError
+
+
+__all__ = ["PseudoResolver", "PseudoResolverError", "PSEUDO_RESOLVER"]
+
+
+class PseudoResolverError(DftInputGeneratorError):
+    """Base class for errors in matching pseudopotentials to species."""
+
+    pass
+
+
+def _elem_from_fname(fname):
+    """Element (lowercase) from a pseudo file name, e.g. "fe_pbe_v1.UPF"."""
+    bname = os.path.basename(fname)
+    return bname.partition(".")[0].partition("_")[0].lower()
+
+
+class PseudoResolver(object):
+    """Match elements to pseudopotential (*.UPF) files in directories.
+
+    The contents of every directory are listed only once, into an index of
+    element -> name of the *first matching* pseudopotential file. The index
+    is rebuilt only if the modification time of the directory changes (i.e.
+    files are added, removed, or renamed).
+
+    A single resolver can be shared across input generators and threads.
+    """
+
+    def __init__(self):
+        # absolute path of a directory -> (mtime, element -> file name)
+        self._indices = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Discard all cached directory indices."""
+        with self._lock:
+            self._indices.clear()
+
+    def index(self, pseudo_dir):
+        """Index of lowercase element -> pseudo file name in `pseudo_dir`.
+
+        Raises `PseudoResolverError` if the directory contents cannot be
+        listed.
+        """
+        path = os.path.abspath(os.path.expanduser(pseudo_dir))
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            with self._lock:
+                cached = self._indices.get(path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+            pseudo_dir_files = os.listdir(path)
+        except OSError:
+            msg = 'Failed to list contents in "{}"'.format(pseudo_dir)
+            raise PseudoResolverError(msg)
+        index = {}
+        # match pseudo iff a *.UPF filename matches element symbol
+        for p in pseudo_dir_files:
+            if os.path.splitext(p)[-1].lower() == ".upf":
+                index.setdefault(_elem_from_fname(p), p)
+        with self._lock:
+            self._indices[path] = (mtime, index)
+        return index
+
+    def resolve(self, species, pseudo_dirs):
+        """Name of the pseudopotential file to use for a chemical species.
+
+        Parameters
+        ----------
+        species: str
+            Chemical species label, e.g. "Fe" or "Fe1".
+
+        pseudo_dirs: str or list of str
+            Directory, or directories in decreasing order of priority, in
+            which to look for pseudopotential files.
+
+        Returns
+        -------
+        Name of the first matching file in the highest priority directory
+        that contains a match, or None if no match is found.
+
+        """
+        if isinstance(pseudo_dirs, six.string_types):
+            pseudo_dirs = [pseudo_dirs]
+        elem_low = get_elem_symbol(species).lower()
+        for pseudo_dir in pseudo_dirs:
+            pseudo_name = self.index(pseudo_dir).get(elem_low)
+            if pseudo_name is not None:
+                return pseudo_name
+        return None
+
+
+# resolver shared by all input generators
+PSEUDO_RESOLVER = PseudoResolver()
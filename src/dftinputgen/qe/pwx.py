@@ -1,17 +1,43 @@
 import os
 import six
+import json
+import hashlib
 import itertools
 
-from dftinputgen.data import STANDARD_ATOMIC_WEIGHTS
-from dftinputgen.utils import get_elem_symbol
+import numpy as np
+
+from dftinputgen.data import get_standard_atomic_weights
+from dftinputgen.utils import StructureView
+from dftinputgen.utils import SupercellView
+from dftinputgen.utils import get_supercell_matrix
 from dftinputgen.utils import get_kpoint_grid_from_spacing
-from dftinputgen.qe.settings import QE_TAGS
-from dftinputgen.qe.settings.calculation_presets import QE_PRESETS
+from dftinputgen.qe.settings import get_qe_tags
+from dftinputgen.qe.settings import get_qe_tag_index
+from dftinputgen.qe.settings import check_pwx_settings
+from dftinputgen.qe.settings.calculation_presets import get_qe_presets
+from dftinputgen.qe.pseudos import PSEUDO_RESOLVER
+from dftinputgen.qe.pseudos import PseudoResolverError
+from dftinputgen.qe.upf import UpfError
+from dftinputgen.qe.upf import UPF_HEADER_CACHE
+from dftinputgen.qe.upf import get_suggested_cutoffs
 
+from dftinputgen import __version__
+from dftinputgen.stats import NULL_STATS
+from dftinputgen.manifest import Manifest
+from dftinputgen.layouts import FlatLayout
+from dftinputgen.layouts import get_layout
+from dftinputgen.targets import DirectoryTarget
 from dftinputgen.base import DftInputGenerator
 from dftinputgen.base import DftInputGeneratorError
 
 
+# number of atoms to render at a time when streaming the ATOMIC_POSITIONS card
+_ATOMS_PER_CHUNK = 10000
+
+# number of hex characters of `input_hash` used as the default input key
+_INPUT_KEY_LENGTH = 16
+
+
 def _qe_val_formatter(val):
     """Format values for QE tags into strings."""
     if isinstance(val, bool):
@@ -22,12 +48,339 @@ def _qe_val_formatter(val):
         return str(val)
 
 
+def _qe_block_formatter(row_fmt, values, labels=None):
+    """Format rows of numbers (optionally labeled) into a block of lines.
+
+    Equivalent to formatting each row with `row_fmt` (a printf-style format)
+    and joining the lines with newlines, but the whole block is rendered in a
+    single formatting call instead of a Python-level loop over the rows.
+
+    Parameters
+    ----------
+    row_fmt: str
+        printf-style format for a row, e.g. "%-4s  %12.8f  %12.8f  %12.8f".
+
+    values: (N, M) array-like of floats
+        Values in each row.
+
+    labels: sequence of N str, optional
+        Label to prefix each row with (the first field in `row_fmt`).
+
+    """
+    values = np.asarray(values, dtype=float)
+    if labels is None:
+        fields = values
+    else:
+        fields = np.empty((values.shape[0], values.shape[1] + 1), dtype=object)
+        fields[:, 0] = labels
+        fields[:, 1:] = values
+    block_fmt = "\n".join([row_fmt] * fields.shape[0])
+    return block_fmt % tuple(fields.ravel().tolist())
+
+
+def _get_tag_indices(tag):
+    """Sort key of the indices of an indexed tag, e.g. "Hubbard_J(1,2)"."""
+    indices = tag.partition("(")[2].rstrip(")").split(",")
+    return tuple(
+        (0, int(index), "") if index.strip().isdigit() else (1, 0, index)
+        for index in indices
+    )
+
+
+def _group_tags_by_namelist(tags):
+    """Group pw.x namelist tags by namelist, in the order they are written.
+
+    Uses the reverse index of tag -> (namelist, position), so that only the
+    input `tags` (e.g. keys of the calculation settings) are looked at.
+    Indexed forms of tags (e.g. "starting_magnetization(1)") are written
+    at the position of the tag, in the order of their indices. Anything
+    that is not a namelist tag is ignored.
+    """
+    index = get_qe_tag_index("pw.x")
+    groups = {}
+    for tag in tags:
+        entry = index.get(tag)
+        order = ()
+        if entry is None and "(" in tag:
+            entry = index.get(tag.partition("(")[0])
+            order = _get_tag_indices(tag)
+        if entry is not None:
+            groups.setdefault(entry[0], set()).add((entry[1], order, tag))
+    return {
+        namelist: [tag for _, _, tag in sorted(group)]
+        for namelist, group in groups.items()
+    }
+
+
+def _kpoints_card_as_str(kpoints_sett, structure_view, grid=None):
+    """Format the pw.x K_POINTS card from k-points settings.
+
+    If the "automatic" scheme specifies a k-spacing instead of a grid, the
+    grid is calculated for the crystal structure (unless precomputed and
+    passed in as `grid`).
+    """
+    scheme = kpoints_sett.get("scheme")
+    if scheme not in ["gamma", "automatic"]:
+        raise NotImplementedError
+    if scheme == "gamma":
+        return "K_POINTS {gamma}"
+    lines = ["K_POINTS {automatic}"]
+    shift = kpoints_sett["shift"]
+    if not grid:
+        grid = kpoints_sett.get("grid", [])
+    if not grid:
+        grid = get_kpoint_grid_from_spacing(
+            structure_view, kpoints_sett["spacing"]
+        )
+    lines.append("{} {} {} {} {} {}".format(*itertools.chain(grid, shift)))
+    return "\n".join(lines)
+
+
 class PwxInputGeneratorError(DftInputGeneratorError):
     """Base class for pw.x input files generation errors."""
 
     pass
 
 
+def _get_pseudo_name(species, pseudo_dir):
+    """Match chemical species::pseudopotential in a given directory."""
+    try:
+        return PSEUDO_RESOLVER.resolve(species, pseudo_dir)
+    except PseudoResolverError as err:
+        raise PwxInputGeneratorError(str(err))
+
+
+def _match_pseudo_names(species, calc_sett):
+    """Match every chemical species to a pseudopotential (or raise)."""
+    # 1. check if pseudo names are provided in input calculation settings
+    # (only for the species in the structure)
+    input_pseudo_names = calc_sett.get("pseudo_names", {})
+    pseudo_names = {sp: input_pseudo_names.get(sp) for sp in species}
+    # 2. if pseudos for all species were input, nothing more to be done.
+    if None not in set(pseudo_names.values()):
+        return pseudo_names
+    # 3. for species that are missing pseudos, try matching psp files in
+    # the `pseudo_dir` directory (raise error if directory not specified)
+    pseudo_dir = calc_sett.get("pseudo_dir")
+    if not pseudo_dir:
+        msg = "Pseudopotential directory not specified"
+        raise PwxInputGeneratorError(msg)
+    matched_pseudo_names = {
+        sp: _get_pseudo_name(sp, pseudo_dir) for sp in species
+    }
+    # 4. overwrite with any user-specified pseudos
+    for sp in pseudo_names:
+        if pseudo_names[sp] is None:
+            pseudo_names[sp] = matched_pseudo_names.get(sp)
+    # 5. finally, if any species is missing pseudo, raise error
+    missing_pseudos = [k for k, v in pseudo_names.items() if v is None]
+    if missing_pseudos:
+        msg = "Failed to find potential for [{}]".format(
+            ", ".join(missing_pseudos)
+        )
+        raise PwxInputGeneratorError(msg)
+    return pseudo_names
+
+
+def _atomic_species_card_as_str(species, pseudo_names):
+    """Format the pw.x ATOMIC_SPECIES card for the species in order."""
+    atomic_weights = get_standard_atomic_weights()
+    lines = ["ATOMIC_SPECIES"]
+    for sp in species:
+        lines.append(
+            "{:4s}  {:12.8f}  {}".format(
+                sp,
+                atomic_weights[sp]["standard_atomic_weight"],
+                pseudo_names[sp],
+            )
+        )
+    return "\n".join(lines)
+
+
+def _iter_atomic_positions_card(structure_view, stats=NULL_STATS):
+    """Yield the ATOMIC_POSITIONS card in chunks of `_ATOMS_PER_CHUNK`."""
+    yield "ATOMIC_POSITIONS {crystal}"
+    for symbols, positions in structure_view.iter_blocks(_ATOMS_PER_CHUNK):
+        with stats.phase("render_cards"):
+            block = _qe_block_formatter(
+                "%-4s  %12.8f  %12.8f  %12.8f", positions, labels=symbols
+            )
+        yield "\n"
+        yield block
+
+
+def _cell_parameters_card_as_str(cell):
+    """Format the pw.x CELL_PARAMETERS card (lattice vectors, in angstrom)."""
+    lines = ["CELL_PARAMETERS {angstrom}"]
+    lines.append(_qe_block_formatter("%12.8f  %12.8f  %12.8f", cell))
+    return "\n".join(lines)
+
+
+def _get_cards(calc_sett):
+    """Names of the pw.x cards specified in the settings, in order."""
+    cards = calc_sett.get("cards", [])
+    return [c for c in get_qe_tags()["pw.x"]["cards"] if c in cards]
+
+
+def _iter_card(
+    card, structure_view, calc_sett, specify_potentials, stats=NULL_STATS
+):
+    """Yield the specified pw.x card as one or more chunks of text.
+
+    The one place cards are rendered, for input generators, sweeps, and
+    renderers alike.
+    """
+    if card == "atomic_positions":
+        for chunk in _iter_atomic_positions_card(structure_view, stats):
+            yield chunk
+        return
+    with stats.phase("render_cards"):
+        if card == "atomic_species":
+            species = structure_view.species
+            with stats.phase("pseudo_resolution"):
+                if specify_potentials:
+                    pseudo_names = _match_pseudo_names(species, calc_sett)
+                else:
+                    pseudo_names = {sp: None for sp in species}
+            chunk = _atomic_species_card_as_str(species, pseudo_names)
+        elif card == "kpoints":
+            kpoints_sett = calc_sett.get("kpoints", {})
+            with stats.phase("kpoints_card"):
+                chunk = _kpoints_card_as_str(kpoints_sett, structure_view)
+        elif card == "cell_parameters":
+            chunk = _cell_parameters_card_as_str(structure_view.cell)
+        else:
+            msg = 'Card "{}" is not supported'.format(card.upper())
+            raise PwxInputGeneratorError(msg)
+    yield chunk
+
+
+def _update_structure_hash(hasher, structure_view):
+    """Feed everything that determines a structure view to a hasher."""
+    hasher.update(json.dumps(structure_view.species).encode())
+    for array in structure_view.hash_arrays():
+        little_endian = array.dtype.newbyteorder("<")
+        hasher.update(array.astype(little_endian).tobytes())
+
+
+def _validate_calculation_settings(calc_sett):
+    """Raise an error if any settings would not be written to the input."""
+    check = check_pwx_settings(calc_sett)
+    if not check.ok:
+        msg = "Invalid calculation settings: {}".format(
+            "; ".join(check.messages())
+        )
+        raise PwxInputGeneratorError(msg)
+
+
+class PwxRenderPlan(object):
+    """Pre-rendered pw.x namelists for a fixed set of calculation settings.
+
+    All namelists depend only on the calculation settings, except for tags
+    determined from the crystal structure (`nat`, `ntyp`). A render plan
+    renders the namelists once, leaving slots for the structure-derived
+    tags, so that the text can be reused across crystal structures (e.g. by
+    assigning the same plan to multiple `PwxInputGenerator` objects with
+    identical settings).
+
+    Slots can also be left for other tags whose values vary (e.g. across a
+    parameter sweep), to be filled in at rendering time.
+    """
+
+    # tags whose values are determined from the crystal structure
+    structure_tags = ("nat", "ntyp")
+
+    def __init__(
+        self,
+        calculation_settings,
+        specify_potentials=False,
+        variable_tags=None,
+    ):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        calculation_settings: dict
+            Dictionary of all calculation settings (values of any structure
+            dependent tags, if present, are ignored).
+
+        specify_potentials: bool, optional
+            Whether pseudopotentials are to be specified for the species.
+            (A `pseudo_dir` is required in the settings if so.)
+
+            Default: False
+
+        variable_tags: iterable of str, optional
+            Namelist tags to leave slots for, whether or not they are in
+            `calculation_settings`. Their values are to be specified when
+            rendering (see `namelists_as_str`).
+
+            Default: None (only structure-dependent tags are slots)
+
+        """
+        self._specify_potentials = bool(specify_potentials)
+        self._variable_tags = tuple(variable_tags or ())
+        self._template = self._compile(calculation_settings)
+
+    @property
+    def specify_potentials(self):
+        """Were potentials to be specified when compiling the plan."""
+        return self._specify_potentials
+
+    @property
+    def variable_tags(self):
+        """Tags (other than structure-dependent ones) left as slots."""
+        return self._variable_tags
+
+    def _compile(self, calc_sett):
+        """Render namelists into a template with slots for structure tags."""
+        slot_tags = set(self.structure_tags).union(self.variable_tags)
+        tags_by_namelist = _group_tags_by_namelist(
+            itertools.chain(calc_sett, slot_tags)
+        )
+        blocks = []
+        for namelist in get_qe_tags()["pw.x"]["namelists"]:
+            if namelist not in calc_sett.get("namelists", []):
+                continue
+            if namelist.lower() == "control":
+                if not calc_sett.get("pseudo_dir") and self.specify_potentials:
+                    msg = "Pseudopotentials directory not specified"
+                    raise PwxInputGeneratorError(msg)
+            lines = ["&{}".format(namelist.upper())]
+            for tag in tags_by_namelist.get(namelist, []):
+                if tag in slot_tags:
+                    lines.append("    {0} = {{{0}}}".format(tag))
+                else:
+                    line = "    {} = {}".format(
+                        tag, _qe_val_formatter(calc_sett[tag])
+                    )
+                    lines.append(line.replace("{", "{{").replace("}", "}}"))
+            lines.append("/")
+            blocks.append("\n".join(lines))
+        return "\n".join(blocks)
+
+    def namelists_as_str(self, parameters_from_structure, values=None):
+        """All pw.x namelists as one formatted string, for a structure.
+
+        Parameters
+        ----------
+        parameters_from_structure: dict
+            Values of the structure-dependent tags, e.g. {"nat": 4, "ntyp": 2}.
+
+        values: dict, optional
+            Values of all `variable_tags`.
+
+        """
+        slots = {
+            tag: _qe_val_formatter(parameters_from_structure[tag])
+            for tag in self.structure_tags
+        }
+        for tag in self.variable_tags:
+            slots[tag] = _qe_val_formatter(values[tag])
+        return self._template.format(**slots)
+
+
 class PwxInputGenerator(DftInputGenerator):
     """Base class to generate input files for pw.x."""
 
@@ -41,6 +394,13 @@ class PwxInputGenerator(DftInputGenerator):
         write_location=None,
         pwx_input_file=None,
         overwrite_files=None,
+        incremental=None,
+        stats=None,
+        output_target=None,
+        layout=None,
+        input_key=None,
+        supercell=None,
+        auto_cutoffs=None,
         **kwargs
     ):
         """
@@ -118,6 +478,67 @@ class PwxInputGenerator(DftInputGenerator):
 
             Default: True
 
+        incremental: bool, optional
+            Whether to skip writing input files that are already up to date,
+            i.e. were generated from identical crystal structure, settings,
+            and pseudopotentials, and have not been modified since. A
+            manifest of written files and hashes of their inputs is kept in
+            each directory written to (see :class:`Manifest`; to write many
+            files to a directory, keep its manifest open with
+            `Manifest.open`).
+
+            Default: False
+
+        stats: :class:`GenerationStats`, optional
+            Object to record the wall time and number of calls of each phase
+            of input generation in (see :class:`DftInputGenerator`).
+
+            Default: None (nothing is recorded)
+
+        output_target: :class:`OutputTarget`, optional
+            Where to write the input files to, e.g. an
+            :class:`ArchiveTarget` to write them into a tar/zip archive.
+
+            Default: None (files in `write_location`)
+
+        layout: str or :class:`Layout`, optional
+            How to lay out input files under `write_location` (or in the
+            output target): "flat", or "sharded" to write each input into
+            its own subdirectory, fanned out by a hash of `input_key`, e.g.
+            "ab/cd/[input_key]/scf.in" (see :class:`ShardedLayout`).
+
+            Default: "flat"
+
+        input_key: str, optional
+            Key identifying the input, used to place it in keyed layouts.
+
+            Default: first 16 characters of `input_hash` (i.e. derived from
+            the crystal structure and calculation settings).
+
+        supercell: int, sequence of 3 ints, or (3, 3) array of ints, optional
+            Generate input for a supercell of `crystal_structure`, given by
+            the number of repetitions of the cell (along each lattice
+            vector), or a transformation matrix (see
+            `get_supercell_matrix`), instead of building it with, e.g.,
+            `crystal_structure.repeat()`. The supercell is never built in
+            memory: `nat` is calculated from the cell, and the atomic
+            positions are rendered one tile at a time (see
+            :class:`SupercellView`).
+
+            Default: None (input for `crystal_structure` itself)
+
+        auto_cutoffs: bool, optional
+            Whether to use the kinetic energy cutoffs (`ecutwfc`,
+            `ecutrho`) suggested in the headers of the pseudopotentials of
+            all species (see `get_suggested_cutoffs`) instead of those in
+            `calculation_presets`. Cutoffs specified in `custom_sett_file`
+            or `custom_sett_dict` always take precedence (a suggested
+            `ecutrho` is raised to at least 4 x the `ecutwfc` used).
+            Pseudopotentials are matched to species as described for
+            `specify_potentials`.
+
+            Default: False
+
         **kwargs:
             Arbitrary keyword arguments.
 
@@ -126,6 +547,12 @@ class PwxInputGenerator(DftInputGenerator):
         # TODO(@hegdevinayi): Add default magnetism schemes (ferro/AFM G-type)
         # TODO(@hegdevinayi): Consider allowing psp location via config file
 
+        self._render_plan = None
+        self._auto_cutoffs = bool(auto_cutoffs)
+        self._supercell = None
+        if supercell is not None:
+            self._supercell = get_supercell_matrix(supercell)
+
         super(PwxInputGenerator, self).__init__(
             crystal_structure=crystal_structure,
             calculation_presets=calculation_presets,
@@ -133,23 +560,104 @@ class PwxInputGenerator(DftInputGenerator):
             custom_sett_dict=custom_sett_dict,
             write_location=write_location,
             overwrite_files=overwrite_files,
+            stats=stats,
         )
 
-        self._parameters_from_structure = self._get_parameters_from_structure()
-        self._calculation_settings = self._get_calculation_settings()
-
         self._specify_potentials = False
         self.specify_potentials = specify_potentials
 
         self._pwx_input_file = self._get_default_pwx_input_file()
         self.pwx_input_file = pwx_input_file
 
+        self._incremental = False
+        self.incremental = incremental
+
+        self._output_target = None
+        self.output_target = output_target
+
+        self._layout = FlatLayout()
+        self.layout = layout
+
+        self._input_key = None
+        self.input_key = input_key
+
     def _set_crystal_structure(self, crystal_structure):
+        # the render plan does not depend on the crystal structure (unless
+        # the cutoffs depend on its species): keep it
+        render_plan = self._render_plan
         super(PwxInputGenerator, self)._set_crystal_structure(
             crystal_structure
         )
+        if not self.auto_cutoffs:
+            self._render_plan = render_plan
+        self._set_structure_view()
+
+    def _set_structure_view(self):
+        view = StructureView.from_atoms(self.crystal_structure)
+        if self.supercell is not None:
+            view = SupercellView(view, self.supercell)
+        self._structure_view = view
         self._parameters_from_structure = self._get_parameters_from_structure()
 
+    def _invalidate_calculation_settings(self):
+        super(PwxInputGenerator, self)._invalidate_calculation_settings()
+        self._render_plan = None
+
+    @property
+    def render_plan(self):
+        """:class:`PwxRenderPlan` used to render the pw.x namelists.
+
+        The plan is compiled from `calculation_settings` on first use, and
+        discarded whenever the settings (except the crystal structure)
+        change. A plan compiled once can be assigned to other generators
+        that use identical settings, to skip compiling it again.
+        """
+        plan = self._render_plan
+        # (plans with slots for other tags need values for all of them)
+        stale = plan is None or not set(plan.variable_tags).issubset(
+            self.calculation_settings
+        )
+        if stale or plan.specify_potentials != self.specify_potentials:
+            plan = PwxRenderPlan(
+                self.calculation_settings,
+                specify_potentials=self.specify_potentials,
+            )
+            self._render_plan = plan
+        return plan
+
+    @render_plan.setter
+    def render_plan(self, render_plan):
+        self._render_plan = render_plan
+
+    @property
+    def structure_view(self):
+        """Compact :class:`StructureView` of the input crystal structure.
+
+        Created once when `crystal_structure` is set, and used to generate
+        all structure-dependent namelists and cards.
+        """
+        return self._structure_view
+
+    @property
+    def supercell(self):
+        """(3, 3) transformation matrix of the supercell to generate input for.
+
+        None if input is generated for the input crystal structure itself.
+        """
+        return self._supercell
+
+    @supercell.setter
+    def supercell(self, supercell):
+        if supercell is not None:
+            supercell = get_supercell_matrix(supercell)
+        self._supercell = supercell
+        # (the settings include the structure-dependent `nat`, but the
+        # render plan does not depend on them)
+        render_plan = self._render_plan
+        self._invalidate_calculation_settings()
+        self._render_plan = render_plan
+        self._set_structure_view()
+
     @property
     def parameters_from_structure(self):
         """DFT parameters auto-determined for the input crystal structure."""
@@ -165,6 +673,17 @@ class PwxInputGenerator(DftInputGenerator):
         if specify_potentials is not None:
             self._specify_potentials = specify_potentials
 
+    @property
+    def auto_cutoffs(self):
+        """Should cutoffs suggested by the pseudopotentials be used."""
+        return self._auto_cutoffs
+
+    @auto_cutoffs.setter
+    def auto_cutoffs(self, auto_cutoffs):
+        if auto_cutoffs is not None:
+            self._auto_cutoffs = bool(auto_cutoffs)
+            self._invalidate_calculation_settings()
+
     @property
     def pwx_input_file(self):
         """Name of the pw.x input file to write to."""
@@ -175,6 +694,64 @@ class PwxInputGenerator(DftInputGenerator):
         if pwx_input_file is not None:
             self._pwx_input_file = pwx_input_file
 
+    @property
+    def incremental(self):
+        """Should up-to-date input files be skipped when writing."""
+        return self._incremental
+
+    @incremental.setter
+    def incremental(self, incremental):
+        if incremental is not None:
+            self._incremental = incremental
+
+    @property
+    def output_target(self):
+        """:class:`OutputTarget` to write input files to.
+
+        A :class:`DirectoryTarget` for `write_location` unless specified.
+        """
+        if self._output_target is None:
+            return DirectoryTarget(self.write_location)
+        return self._output_target
+
+    @output_target.setter
+    def output_target(self, output_target):
+        self._output_target = output_target
+
+    @property
+    def layout(self):
+        """:class:`Layout` of input files under the location written to."""
+        return self._layout
+
+    @layout.setter
+    def layout(self, layout):
+        if layout is not None:
+            self._layout = get_layout(layout)
+
+    @property
+    def input_key(self):
+        """Key identifying the input in keyed layouts.
+
+        The user-specified key if any, else derived from `input_hash`.
+        """
+        if self._input_key is None:
+            return self.input_hash[:_INPUT_KEY_LENGTH]
+        return self._input_key
+
+    @input_key.setter
+    def input_key(self, input_key):
+        self._input_key = input_key
+
+    @property
+    def input_path(self):
+        """Path of the pw.x input file relative to the location written to.
+
+        Given by the `layout`, e.g. "ab/cd/[input_key]/scf.in" for a sharded
+        layout, or just `pwx_input_file` for a flat one.
+        """
+        key = self.input_key if self.layout.keyed else None
+        return self.layout.relpath(key, self.pwx_input_file)
+
     def _get_default_pwx_input_file(self):
         if self.calculation_presets is None:
             return "pwx.in"
@@ -192,85 +769,118 @@ class PwxInputGenerator(DftInputGenerator):
         number of types of species.
         """
         return {
-            "nat": len(self.crystal_structure),
-            "ntyp": len(set(self.crystal_structure.get_chemical_symbols())),
+            "nat": len(self.structure_view),
+            "ntyp": len(self.structure_view.species),
         }
 
     @staticmethod
     def _get_pseudo_name(species, pseudo_dir):
         """Match chemical species::pseudopotential in a given directory."""
-        # filler for black/flake8 compatibility
-        # empty line after docstring relaxed in pydocstyle>5.0
-        # this will have to stay due to py2 (pydocstyle ceil = 3.0.0)
-        def _elem_from_fname(fname):
-            bname = os.path.basename(fname)
-            elem = bname.partition(".")[0].partition("_")[0].lower()
-            return elem
-
-        elem_low = get_elem_symbol(species).lower()
-        # match pseudo iff a *.UPF filename matches element symbol in structure
-        # Note: generic except here for py2/py3 compatibility
-        try:
-            pseudo_dir_files = os.listdir(os.path.expanduser(pseudo_dir))
-        except:  # noqa: E722
-            msg = 'Failed to list contents in "{}"'.format(pseudo_dir)
-            raise PwxInputGeneratorError(msg)
-        for p in pseudo_dir_files:
-            ext = os.path.splitext(p)[-1].lower()
-            if _elem_from_fname(p) == elem_low and ext == ".upf":
-                return os.path.basename(p)
+        return _get_pseudo_name(species, pseudo_dir)
 
     def _get_pseudo_names(self):
         """Get names of pseudopotentials to use for each chemical species."""
-        species = sorted(set(self.crystal_structure.get_chemical_symbols()))
-        pseudo_names = {sp: None for sp in species}
         if not self.specify_potentials:
-            return pseudo_names
-        # 1. check if pseudo names are provided in input calculation settings
-        input_pseudo_names = self.calculation_settings.get("pseudo_names", {})
-        pseudo_names.update(input_pseudo_names)
-        # 2. if pseudos for all species were input, nothing more to be done.
-        if None not in set(pseudo_names.values()):
-            return pseudo_names
-        # 3. for species that are missing pseudos, try matching psp files in
-        # the `pseudo_dir` directory (raise error if directory not specified)
-        pseudo_dir = self.calculation_settings.get("pseudo_dir")
+            return {sp: None for sp in self.structure_view.species}
+        return self._match_pseudo_names(self.calculation_settings)
+
+    def _match_pseudo_names(self, calc_sett):
+        """Match every chemical species to a pseudopotential (or raise)."""
+        return _match_pseudo_names(self.structure_view.species, calc_sett)
+
+    def _get_pseudo_headers(self, calc_sett):
+        """Headers of the pseudopotential files of every chemical species."""
+        pseudo_dir = calc_sett.get("pseudo_dir")
         if not pseudo_dir:
             msg = "Pseudopotential directory not specified"
             raise PwxInputGeneratorError(msg)
-        matched_pseudo_names = {
-            sp: self._get_pseudo_name(sp, pseudo_dir) for sp in species
-        }
-        # 4. overwrite with any user-specified pseudos
-        for sp in pseudo_names:
-            if pseudo_names[sp] is None:
-                pseudo_names[sp] = matched_pseudo_names.get(sp)
-        # 5. finally, if any species is missing pseudo, raise error
-        missing_pseudos = [k for k, v in pseudo_names.items() if v is None]
-        if missing_pseudos:
-            msg = "Failed to find potential for [{}]".format(
-                ", ".join(missing_pseudos)
+        if not isinstance(pseudo_dir, six.string_types):
+            # (written as is into the CONTROL namelist)
+            msg = "Expected pseudo_dir of type str; found {}".format(
+                type(pseudo_dir)
             )
             raise PwxInputGeneratorError(msg)
-        return pseudo_names
+        pseudo_names = self._match_pseudo_names(calc_sett)
+        headers = {}
+        try:
+            for sp in self.structure_view.species:
+                path = os.path.join(
+                    os.path.expanduser(pseudo_dir), pseudo_names[sp]
+                )
+                try:
+                    headers[sp] = UPF_HEADER_CACHE.get(path)
+                except UpfError as err:
+                    raise PwxInputGeneratorError(str(err))
+        finally:
+            # new headers are saved to disk once for all species
+            UPF_HEADER_CACHE.flush()
+        return headers
+
+    @property
+    def pseudo_headers(self):
+        """Headers of the pseudopotentials to use for each chemical species.
+
+        Dictionary of chemical species and :class:`UpfHeader` objects, e.g.
+        to get the number of valence electrons of each species from the
+        pseudopotentials (`z_valence`). Headers are cached on disk, by the
+        hash of the pseudopotential files (see :class:`UpfHeaderCache`).
+        """
+        return self._get_pseudo_headers(self.calculation_settings)
 
     @property
     def calculation_settings(self):
-        """Dictionary of all calculation settings to use as input pw.x."""
-        return self._get_calculation_settings()
+        """Dictionary of all calculation settings to use as input pw.x.
+
+        The settings are aggregated once and cached until any of the inputs
+        they depend on is changed (see `calculation_settings_version`).
+
+        NB: the returned dictionary is shared; do not modify it in place.
+        Use `custom_sett_dict` to change settings instead.
+        """
+        if self._calculation_settings is None:
+            with self.stats.phase("settings_merge"):
+                calc_sett = self._get_calculation_settings()
+            self._calculation_settings = calc_sett
+            self._calculation_settings_version += 1
+        return self._calculation_settings
 
     def _get_calculation_settings(self):
         """Load all calculation settings: user-input and auto-determined."""
         calc_sett = {}
         if self.calculation_presets is not None:
-            calc_sett.update(QE_PRESETS[self.calculation_presets])
+            calc_sett.update(get_qe_presets()[self.calculation_presets])
         if self.custom_sett_from_file is not None:
             calc_sett.update(self.custom_sett_from_file)
-        if self.custom_sett_dict is not None:
-            calc_sett.update(self.custom_sett_dict)
+        # (the settings as set, without copying shared, frozen settings)
+        custom_sett_dict = self._custom_sett_dict
+        calc_sett.update(custom_sett_dict)
+        if self.auto_cutoffs:
+            # custom cutoffs take precedence over the suggested ones
+            custom_tags = set(self.custom_sett_from_file or {}).union(
+                custom_sett_dict
+            )
+            headers = self._get_pseudo_headers(calc_sett)
+            cutoffs = get_suggested_cutoffs(headers.values())
+            for tag, cutoff in cutoffs.items():
+                if tag not in custom_tags:
+                    calc_sett[tag] = cutoff
+            # suggested `ecutrho` is at least 4 x the `ecutwfc` used
+            ecutwfc = calc_sett.get("ecutwfc")
+            if "ecutrho" in cutoffs and "ecutrho" not in custom_tags:
+                if ecutwfc is not None:
+                    calc_sett["ecutrho"] = max(cutoffs["ecutrho"], 4 * ecutwfc)
         calc_sett.update(self.parameters_from_structure)
         return calc_sett
 
+    def validate_calculation_settings(self):
+        """Check that every calculation setting is written to the input.
+
+        Raises `PwxInputGeneratorError` listing all settings that are not
+        pw.x tags (e.g. misspelled tags), or are tags in namelists that are
+        not written (see `check_pwx_settings`).
+        """
+        _validate_calculation_settings(self.calculation_settings)
+
     def _namelist_to_str(self, namelist):
         """Convert (tags, values) from a namelist into a formatted string."""
         if namelist.lower() == "control":
@@ -279,9 +889,8 @@ class PwxInputGenerator(DftInputGenerator):
                     msg = "Pseudopotentials directory not specified"
                     raise PwxInputGeneratorError(msg)
         lines = ["&{}".format(namelist.upper())]
-        for tag in QE_TAGS["pw.x"]["namelist_tags"][namelist]:
-            if tag not in self.calculation_settings:
-                continue
+        tags_by_namelist = _group_tags_by_namelist(self.calculation_settings)
+        for tag in tags_by_namelist.get(namelist, []):
             lines.append(
                 "    {} = {}".format(
                     tag, _qe_val_formatter(self.calculation_settings.get(tag)),
@@ -293,66 +902,35 @@ class PwxInputGenerator(DftInputGenerator):
     @property
     def all_namelists_as_str(self):
         """All pw.x namelists as one formatted string."""
-        blocks = []
-        for namelist in QE_TAGS["pw.x"]["namelists"]:
-            if namelist in self.calculation_settings.get("namelists", []):
-                blocks.append(self._namelist_to_str(namelist))
-        return "\n".join(blocks)
+        with self.stats.phase("render_namelists"):
+            plan = self.render_plan
+            values = {
+                tag: self.calculation_settings[tag]
+                for tag in plan.variable_tags
+            }
+            return plan.namelists_as_str(
+                self.parameters_from_structure, values=values
+            )
 
     @property
     def atomic_species_card(self):
         """pw.x ATOMIC_SPECIES card as a string."""
-        species = sorted(set(self.crystal_structure.get_chemical_symbols()))
-        pseudo_names = self._get_pseudo_names()
-        lines = ["ATOMIC_SPECIES"]
-        for sp in species:
-            lines.append(
-                "{:4s}  {:12.8f}  {}".format(
-                    sp,
-                    STANDARD_ATOMIC_WEIGHTS[sp]["standard_atomic_weight"],
-                    pseudo_names[sp],
-                )
-            )
-        return "\n".join(lines)
+        return "".join(self._iter_card("atomic_species"))
 
     @property
     def atomic_positions_card(self):
         """pw.x ATOMIC_POSITIONS card as a string."""
-        symbols = self.crystal_structure.get_chemical_symbols()
-        positions = self.crystal_structure.get_scaled_positions()
-        lines = ["ATOMIC_POSITIONS {crystal}"]
-        for s, p in zip(symbols, positions):
-            lines.append("{:4s}  {:12.8f}  {:12.8f}  {:12.8f}".format(s, *p))
-        return "\n".join(lines)
+        return "".join(self._iter_card("atomic_positions"))
 
     @property
     def kpoints_card(self):
         """pw.x KPOINTS card as a string."""
-        kpoints_sett = self.calculation_settings.get("kpoints", {})
-        scheme = kpoints_sett.get("scheme")
-        if scheme not in ["gamma", "automatic"]:
-            raise NotImplementedError
-        if scheme == "gamma":
-            return "K_POINTS {gamma}"
-        elif scheme == "automatic":
-            lines = ["K_POINTS {automatic}"]
-            grid = kpoints_sett.get("grid", [])
-            shift = kpoints_sett["shift"]
-            if not grid:
-                grid = get_kpoint_grid_from_spacing(
-                    self.crystal_structure, kpoints_sett["spacing"],
-                )
-            _l = "{} {} {} {} {} {}".format(*itertools.chain(grid, shift))
-            lines.append(_l)
-        return "\n".join(lines)
+        return "".join(self._iter_card("kpoints"))
 
     @property
     def cell_parameters_card(self):
         """pw.x CELL_PARAMETERS card as a string."""
-        lines = ["CELL_PARAMETERS {angstrom}"]
-        for cv in self.crystal_structure.cell:
-            lines.append("{:12.8f}  {:12.8f}  {:12.8f}".format(*cv))
-        return "\n".join(lines)
+        return "".join(self._iter_card("cell_parameters"))
 
     @property
     def occupations_card(self):
@@ -369,36 +947,188 @@ class PwxInputGenerator(DftInputGenerator):
         """pw.x ATOMIC_FORCES card as a string."""
         raise NotImplementedError
 
+    def _iter_card(self, card):
+        """Yield the specified pw.x card as one or more chunks of text."""
+        return _iter_card(
+            card,
+            self.structure_view,
+            self.calculation_settings,
+            self.specify_potentials,
+            stats=self.stats,
+        )
+
+    def _get_cards(self):
+        """Names of the pw.x cards specified in the settings, in order."""
+        return _get_cards(self.calculation_settings)
+
+    def _iter_cards(self):
+        """Yield each pw.x card specified in the settings as a string."""
+        for card in self._get_cards():
+            yield "".join(self._iter_card(card))
+
     @property
     def all_cards_as_str(self):
         """All pw.x cards as one formatted string."""
-        blocks = []
-        for card in QE_TAGS["pw.x"]["cards"]:
-            if card in self.calculation_settings.get("cards", []):
-                blocks.append(getattr(self, "{}_card".format(card)))
-        return "\n".join(blocks)
+        return "\n".join(self._iter_cards())
+
+    def iter_pwx_input_chunks(self):
+        """Yield the pw.x input (all namelists + cards) in chunks of text.
+
+        The namelists are yielded first, followed by each card, with large
+        cards (e.g. ATOMIC_POSITIONS) split into multiple chunks. The chunks
+        are rendered lazily, and concatenating them gives `pwx_input_as_str`.
+        """
+        yield self.all_namelists_as_str
+        yield "\n"
+        for i, card in enumerate(self._get_cards()):
+            if i:
+                yield "\n"
+            for chunk in self._iter_card(card):
+                yield chunk
 
     @property
     def pwx_input_as_str(self):
         """pw.x input (all namelists + cards) as a formatted string."""
-        return "\n".join([self.all_namelists_as_str, self.all_cards_as_str])
+        return "".join(self.iter_pwx_input_chunks())
+
+    @property
+    def structure_hash(self):
+        """Hash of the crystal structure (or supercell) written to input.
 
-    def write_pwx_input(self, write_location=None, filename=None):
-        """Write the pw.x input file to disk at the specified location."""
-        if self.pwx_input_as_str.strip() == "":
+        Depends only on the chemical species, positions and cell, e.g. to
+        name files shared by calculations on the same structure.
+        """
+        hasher = hashlib.sha256()
+        _update_structure_hash(hasher, self.structure_view)
+        return hasher.hexdigest()
+
+    @property
+    def input_hash(self):
+        """Hash of everything the pw.x input is generated from.
+
+        Includes the crystal structure, the calculation settings, the
+        pseudopotentials used, and the version of `dftinputgen`. Of the
+        `pseudo_names` in the settings, only those of the species in the
+        structure are included (e.g. names resolved for every element in
+        `pseudo_dir` by `generate_many` do not change the hash).
+        """
+        calc_sett = dict(self.calculation_settings)
+        calc_sett.pop("pseudo_names", None)
+        hasher = hashlib.sha256()
+        hasher.update(__version__.encode())
+        _update_structure_hash(hasher, self.structure_view)
+        hasher.update(
+            json.dumps(
+                [calc_sett, self._get_pseudo_names()],
+                sort_keys=True,
+                default=str,
+            ).encode()
+        )
+        return hasher.hexdigest()
+
+    def write_pwx_input(
+        self, write_location=None, filename=None, manifest=None, target=None
+    ):
+        """Write the pw.x input file to the specified location or target.
+
+        The input is streamed to the target chunk by chunk (see
+        `iter_pwx_input_chunks`). Files in directories are written via a
+        temporary file that replaces the target file only once the input has
+        been written completely.
+
+        An existing file in a directory is left as is if `overwrite_files`
+        is False, or if it is up to date and `incremental` is True (or a
+        `manifest` is specified).
+
+        Parameters
+        ----------
+        write_location: str
+            Path to the directory in which to write the input file (if no
+            `target` is specified).
+
+        filename: str
+            Name of the file to write the input in.
+
+        manifest: :class:`Manifest`, optional
+            Manifest to check whether the file is up to date, and to record
+            the file in if written. The caller is responsible for saving it.
+
+            Default: the manifest kept open for `write_location` (see
+            `Manifest.open`), else the one saved in it, if `incremental` is
+            True.
+
+        target: :class:`OutputTarget`, optional
+            Target to write the input file to, e.g. an archive.
+
+            Default: :class:`DirectoryTarget` for `write_location`.
+
+        Returns
+        -------
+        True if the file was written, False if it was skipped.
+
+        """
+        # (the rendered input is checked again below, once it is needed)
+        structure_tags = self.parameters_from_structure
+        if not set(self.calculation_settings) - set(structure_tags):
             msg = "Nothing to write. No input settings found?"
             raise PwxInputGeneratorError(msg)
-        if write_location is None:
-            msg = "Location to write files not specified"
-            raise PwxInputGeneratorError(msg)
+        if target is None:
+            if write_location is None:
+                msg = "Location to write files not specified"
+                raise PwxInputGeneratorError(msg)
+            target = DirectoryTarget(write_location)
         if filename is None:
             msg = "Name of the input file to write into not specified"
             raise PwxInputGeneratorError(msg)
-        with open(os.path.join(write_location, filename), "w") as fw:
-            fw.write(self.pwx_input_as_str)
+        save_manifest = False
+        if isinstance(target, DirectoryTarget):
+            if not self.overwrite_files and target.exists(filename):
+                self.stats.count("files_skipped")
+                return False
+            if manifest is None and self.incremental:
+                manifest = Manifest.get_open(target.write_location)
+                save_manifest = manifest is None
+                if save_manifest:
+                    manifest = Manifest.load(target.write_location)
+            if manifest is not None:
+                # (checked before any of the input is rendered)
+                input_hash = self.input_hash
+                if manifest.is_current(filename, input_hash):
+                    self.stats.count("files_skipped")
+                    return False
+        else:
+            manifest = None
+
+        chunks = self.iter_pwx_input_chunks()
+        # render only as much as needed to check for non-empty input
+        head = []
+        for chunk in chunks:
+            head.append(chunk)
+            if chunk.strip():
+                break
+        else:
+            msg = "Nothing to write. No input settings found?"
+            raise PwxInputGeneratorError(msg)
+        hasher = hashlib.sha256()
+
+        def _hashed_chunks():
+            for chunk in itertools.chain(head, chunks):
+                hasher.update(chunk.encode())
+                yield chunk
+
+        with self.stats.phase("write"):
+            target.write(filename, _hashed_chunks())
+        self.stats.count("files_written")
+        if manifest is not None:
+            manifest.record(filename, input_hash, hasher.hexdigest())
+            if save_manifest:
+                manifest.save()
+        return True
 
     def write_input_files(self):
         """Write pw.x input files to the user-specified location/file."""
-        self.write_pwx_input(
-            write_location=self.write_location, filename=self.pwx_input_file,
-        )
+        target = self.output_target
+        filename = self.input_path
+        if self.layout.keyed and isinstance(target, DirectoryTarget):
+            self.layout.make_dirs(target.write_location, [filename])
+        return self.write_pwx_input(filename=filename, target=target)
@@ -0,0 +1,196 @@
+"""Render pw.x input from a crystal structure and settings, without state."""
+
+import copy
+
+from dftinputgen.utils import StructureView
+from dftinputgen.utils import SupercellView
+from dftinputgen.utils import get_supercell_matrix
+from dftinputgen.qe.pwx import PwxRenderPlan
+from dftinputgen.qe.pwx import PwxInputGeneratorError
+from dftinputgen.qe.pwx import _get_cards
+from dftinputgen.qe.pwx import _iter_card
+
+
+__all__ = ["PwxRenderer", "render_pwx"]
+
+
+def _get_structure_view(crystal_structure, supercell=None):
+    """Compact view of an `ase.Atoms` object (or a view, as is)."""
+    if isinstance(crystal_structure, StructureView):
+        view = crystal_structure
+    else:
+        view = StructureView.from_atoms(crystal_structure)
+    if supercell is not None:
+        view = SupercellView(view, get_supercell_matrix(supercell))
+    return view
+
+
+class PwxRenderer(object):
+    """Render pw.x input files for a fixed set of calculation settings.
+
+    The settings are copied and compiled once, when the renderer is
+    created (see :class:`PwxRenderPlan`); `render` then only renders the
+    structure-dependent parts of the input. A renderer is never modified
+    after it is created, and `render` has no side effects, so a single
+    renderer can be used from any number of threads (or tasks) at once,
+    without locking.
+
+    Unlike :class:`PwxInputGenerator`, presets and custom settings are not
+    merged: `calculation_settings` are all the settings to use.
+    """
+
+    def __init__(
+        self,
+        calculation_settings,
+        specify_potentials=False,
+        variable_tags=None,
+    ):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        calculation_settings: dict
+            Dictionary of all calculation settings, e.g. the presets for a
+            calculation updated with any custom settings. Values of tags
+            determined from the crystal structure (`nat`, `ntyp`), if
+            present, are ignored.
+
+        specify_potentials: bool, optional
+            Whether pseudopotentials are to be specified for the species.
+            (Either `pseudo_names` for all species or a `pseudo_dir` is
+            required in the settings if so.)
+
+            Default: False
+
+        variable_tags: iterable of str, optional
+            Namelist tags whose values can be specified for each input (see
+            `render`), e.g. the tags varied in a parameter sweep.
+
+            Default: None
+
+        """
+        # (a copy, so that later changes to the input do not affect output)
+        self._calculation_settings = copy.deepcopy(dict(calculation_settings))
+        self._specify_potentials = bool(specify_potentials)
+        self._plan = PwxRenderPlan(
+            self._calculation_settings,
+            specify_potentials=self._specify_potentials,
+            variable_tags=variable_tags,
+        )
+        self._cards = tuple(_get_cards(self._calculation_settings))
+
+    @property
+    def calculation_settings(self):
+        """Calculation settings the renderer was compiled for (a copy)."""
+        return copy.deepcopy(self._calculation_settings)
+
+    @property
+    def specify_potentials(self):
+        """Are pseudopotentials specified for each chemical species."""
+        return self._specify_potentials
+
+    @property
+    def variable_tags(self):
+        """Tags whose values can be specified for each input."""
+        return self._plan.variable_tags
+
+    def _get_values(self, values):
+        """Values of the variable tags (by default, those in the settings)."""
+        calc_sett = self._calculation_settings
+        slot_values = {
+            tag: calc_sett[tag]
+            for tag in self.variable_tags
+            if tag in calc_sett
+        }
+        slot_values.update(values or {})
+        missing = [tag for tag in self.variable_tags if tag not in slot_values]
+        if missing:
+            msg = "Values not specified for [{}]".format(", ".join(missing))
+            raise PwxInputGeneratorError(msg)
+        return slot_values
+
+    def _card_as_str(self, card, structure_view):
+        return "".join(
+            _iter_card(
+                card,
+                structure_view,
+                self._calculation_settings,
+                self.specify_potentials,
+            )
+        )
+
+    def render(self, crystal_structure, supercell=None, values=None):
+        """pw.x input (all namelists + cards) for a crystal structure.
+
+        Parameters
+        ----------
+        crystal_structure: :class:`ase.Atoms` or :class:`StructureView`
+            Crystal structure to render the input for (not modified).
+
+        supercell: int, or (3,) or (3, 3) array-like of ints, optional
+            Render the input for this supercell of `crystal_structure`,
+            without building it (see :class:`PwxInputGenerator`).
+
+        values: dict, optional
+            Values of the `variable_tags` for this input (by default, the
+            values in the calculation settings).
+
+        Returns
+        -------
+        The pw.x input as a string, identical to `pwx_input_as_str` of a
+        :class:`PwxInputGenerator` with the same settings.
+
+        """
+        view = _get_structure_view(crystal_structure, supercell=supercell)
+        parameters_from_structure = {
+            "nat": len(view),
+            "ntyp": len(view.species),
+        }
+        namelists = self._plan.namelists_as_str(
+            parameters_from_structure, values=self._get_values(values)
+        )
+        cards = [self._card_as_str(card, view) for card in self._cards]
+        return "\n".join([namelists, "\n".join(cards)])
+
+
+def render_pwx(
+    crystal_structure,
+    calculation_settings,
+    specify_potentials=False,
+    supercell=None,
+):
+    """pw.x input for a crystal structure and calculation settings.
+
+    A pure function: neither input is modified, and nothing is cached
+    between calls (other than the lookup tables shared by all generators),
+    so it can be called from any thread or task. To render inputs for many
+    crystal structures with the same settings, compile the settings once
+    with :class:`PwxRenderer` instead.
+
+    Parameters
+    ----------
+    crystal_structure: :class:`ase.Atoms` or :class:`StructureView`
+        Crystal structure to render the input for.
+
+    calculation_settings: dict
+        Dictionary of all calculation settings (see :class:`PwxRenderer`),
+        e.g. `get_qe_presets()["scf"]`.
+
+    specify_potentials: bool, optional
+        Whether pseudopotentials are to be specified for the species.
+
+        Default: False
+
+    supercell: int, or (3,) or (3, 3) array-like of ints, optional
+        Render the input for this supercell of `crystal_structure`.
+
+    Returns
+    -------
+    The pw.x input as a string.
+
+    """
+    renderer = PwxRenderer(
+        calculation_settings, specify_potentials=specify_potentials
+    )
+    return renderer.render(crystal_structure, supercell=supercell)
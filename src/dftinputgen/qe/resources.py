@@ -0,0 +1,328 @@
+"""Estimate the computational resources needed for pw.x calculations."""
+
+import functools
+import collections
+
+import numpy as np
+
+from dftinputgen.utils import get_elem_symbol
+from dftinputgen.utils import get_kpoint_grids_from_spacing
+from dftinputgen.qe.pwx import PwxInputGeneratorError
+
+
+__all__ = [
+    "ResourceEstimates",
+    "estimate_resources",
+    "get_valence_electrons",
+]
+
+
+# conversion factor from Bohr to Angstrom (CODATA 2014, as in ASE)
+_BOHR_TO_ANGSTROM = 0.52917721067
+
+# atomic numbers of the noble gases
+_NOBLE_GAS_CORES = (0, 2, 10, 18, 36, 54, 86)
+
+# FFT dimensions are rounded up to products of these primes
+_FFT_PRIMES = (2, 3, 5, 7)
+_MAX_FFT_DIMENSION = 8192
+
+# bytes per double precision complex and real number
+_COMPLEX_BYTES = 16
+_REAL_BYTES = 8
+
+# heuristics for the memory model:
+# dimension of the Davidson subspace in units of the number of bands
+# (`diago_david_ndim` = 2), with psi, H.psi, S.psi each of that size
+_DAVIDSON_NDIM = 2
+_DAVIDSON_ARRAYS = 3
+# number of beta projectors per atom (e.g. s, p, d channels, 2 each)
+_PROJECTORS_PER_ATOM = 8
+# number of real-space arrays on the dense FFT grid (density, potentials,
+# and work arrays)
+_DENSE_FFT_ARRAYS = 20
+# fewest bands per row/column of the distributed subspace matrices
+_BANDS_PER_LINALG_BLOCK = 100
+
+
+class ResourceEstimates(
+    collections.namedtuple(
+        "ResourceEstimates",
+        [
+            "nat",
+            "nelec",
+            "nbnd",
+            "npw",
+            "ngm",
+            "fft_grid",
+            "nks",
+            "memory",
+            "nk",
+            "nd",
+            "memory_per_process",
+        ],
+    )
+):
+    """Estimated resources for a batch of pw.x calculations.
+
+    Every field is an array with one entry per calculation:
+
+    - `nat`: number of atoms
+    - `nelec`: number of valence electrons
+    - `nbnd`: number of Kohn-Sham bands
+    - `npw`: number of plane waves per k-point (wavefunctions)
+    - `ngm`: number of G-vectors in the dense grid (charge density)
+    - `fft_grid`: (N, 3) dimensions of the dense FFT grid
+    - `nks`: number of k-points (times 2 for spin-polarized calculations),
+      reduced by time-reversal symmetry only, i.e. an upper bound on the
+      number of irreducible k-points
+    - `memory`: estimated memory (in bytes) for a serial run
+    - `nk`: suggested number of k-point pools (`-nk`)
+    - `nd`: suggested number of processes for linear algebra (`-nd`)
+    - `memory_per_process`: estimated memory (in bytes) per process, with
+      the suggested `nk` and `nd`
+
+    The estimates are order-of-magnitude approximations, meant for sizing
+    and packing jobs, not exact predictions.
+    """
+
+    __slots__ = ()
+
+    def __len__(self):
+        return len(self.nat)
+
+    def flags(self, index):
+        """Suggested pw.x parallelization flags, e.g. "-nk 4 -nd 1"."""
+        return "-nk {} -nd {}".format(self.nk[index], self.nd[index])
+
+    def as_dicts(self):
+        """Estimates as a list of JSON-serializable dicts, one per input."""
+        fields = [np.asarray(getattr(self, f)).tolist() for f in self._fields]
+        return [dict(zip(self._fields, values)) for values in zip(*fields)]
+
+
+def get_valence_electrons(symbol):
+    """Number of valence electrons of an element, with a noble gas core.
+
+    A heuristic for when no pseudopotential is available, e.g. 8 for Fe
+    ([Ar] 3d6 4s2) and 6 for O. Pseudopotentials with semicore states have
+    more valence electrons.
+    """
+    from ase.data import atomic_numbers
+
+    z = atomic_numbers[symbol]
+    core = max(n for n in _NOBLE_GAS_CORES if n < z)
+    return z - core
+
+
+def _default_valence(species):
+    return get_valence_electrons(get_elem_symbol(species))
+
+
+@functools.lru_cache(maxsize=1)
+def _get_good_fft_dimensions():
+    """Sorted numbers up to `_MAX_FFT_DIMENSION` with only `_FFT_PRIMES`."""
+    numbers = np.array([1])
+    for prime in _FFT_PRIMES:
+        exponent = int(np.log(_MAX_FFT_DIMENSION) / np.log(prime))
+        powers = prime ** np.arange(exponent + 1)
+        numbers = np.outer(numbers, powers).ravel()
+        numbers = numbers[numbers <= _MAX_FFT_DIMENSION]
+    return np.sort(numbers)
+
+
+def _get_fft_grids(lengths, ecutrho):
+    """Dense FFT grids for lattice vectors of (N, 3) lengths (in Bohr)."""
+    minimum = 2 * np.floor(np.sqrt(ecutrho)[:, None] * lengths / (2 * np.pi))
+    good = _get_good_fft_dimensions()
+    return good[np.searchsorted(good, minimum + 1)]
+
+
+def _count_kpoints(grids, shifts, nspin):
+    """Number of k-points in grids, with time-reversal symmetry only.
+
+    Of the N points in a grid, the t points with k = -k (modulo reciprocal
+    lattice vectors) are their own time-reversed partners, so that there
+    are (N + t) / 2 points that are not equivalent by time reversal.
+    """
+    # points with k = -k along each direction: 0 and 1/2 (if n is even) in
+    # unshifted grids; 1/2 (if n is odd) in shifted grids
+    odd = grids % 2 == 1
+    invariant = np.where(shifts == 0, np.where(odd, 1, 2), np.where(odd, 1, 0))
+    total = np.prod(grids, axis=1)
+    return (total + np.prod(invariant, axis=1)) // 2 * nspin
+
+
+def _get_memory(npw, nbnd, nat, nfft, nks_pool, procs_per_pool, nd):
+    """Estimated memory (in bytes) per process."""
+    wavefunctions = _COMPLEX_BYTES * npw * nbnd
+    davidson = _DAVIDSON_ARRAYS * _DAVIDSON_NDIM * wavefunctions
+    projectors = _COMPLEX_BYTES * npw * _PROJECTORS_PER_ATOM * nat
+    dense = _REAL_BYTES * _DENSE_FFT_ARRAYS * nfft
+    subspace = _COMPLEX_BYTES * _DAVIDSON_ARRAYS * (_DAVIDSON_NDIM * nbnd) ** 2
+    distributed = wavefunctions * nks_pool + davidson + projectors + dense
+    return distributed / procs_per_pool + subspace / nd
+
+
+def _get_settings_arrays(generators, valence_electrons):
+    """Collect the parameters for every generator as arrays."""
+    columns = collections.defaultdict(list)
+    spacing_cells = []
+    spacings = []
+    for i, pwig in enumerate(generators):
+        calc_sett = pwig.calculation_settings
+        view = pwig.structure_view
+        if "ecutwfc" not in calc_sett:
+            msg = '"ecutwfc" not specified (needed to estimate resources)'
+            raise PwxInputGeneratorError(msg)
+        ecutwfc = float(calc_sett["ecutwfc"])
+        columns["ecutwfc"].append(ecutwfc)
+        columns["ecutrho"].append(float(calc_sett.get("ecutrho", 4 * ecutwfc)))
+        columns["cell"].append(view.cell)
+        counts = view.species_counts()
+        columns["nat"].append(int(counts.sum()))
+        valence = [
+            valence_electrons.get(sp, None) or _default_valence(sp)
+            for sp in view.species
+        ]
+        nelec = np.dot(counts, valence) - calc_sett.get("tot_charge", 0)
+        columns["nelec"].append(nelec)
+        columns["nbnd"].append(calc_sett.get("nbnd", 0))
+        columns["smearing"].append(calc_sett.get("occupations") == "smearing")
+        columns["nspin"].append(calc_sett.get("nspin", 1))
+
+        # k-points (no K_POINTS card: only the Gamma point, without tricks)
+        kpoints_sett = calc_sett.get("kpoints", {})
+        scheme = kpoints_sett.get("scheme")
+        grid = [1, 1, 1]
+        shift = [0, 0, 0]
+        if scheme == "automatic":
+            grid = kpoints_sett.get("grid") or [0, 0, 0]
+            shift = kpoints_sett.get("shift", shift)
+            if not kpoints_sett.get("grid"):
+                spacing_cells.append((i, view.cell))
+                spacings.append(kpoints_sett["spacing"])
+        elif scheme not in (None, "gamma"):
+            msg = 'Cannot estimate k-points for the "{}" scheme'.format(scheme)
+            raise PwxInputGeneratorError(msg)
+        columns["gamma_only"].append(scheme == "gamma")
+        columns["grid"].append(grid)
+        columns["shift"].append(shift)
+
+    arrays = {key: np.array(values) for key, values in columns.items()}
+    if spacing_cells:
+        # k-point grids from the k-spacing, for all structures at once
+        indices, cells = zip(*spacing_cells)
+        grids = get_kpoint_grids_from_spacing(np.array(cells), spacings)
+        arrays["grid"][list(indices)] = grids
+    return arrays
+
+
+def estimate_resources(
+    generators, nprocs=1, max_memory_per_process=None, valence_electrons=None
+):
+    """Estimate the resources needed to run pw.x for a batch of inputs.
+
+    Plane-wave counts, FFT grids, and memory are estimated from the cell,
+    the kinetic energy cutoffs (`ecutwfc`, `ecutrho`), the k-point grid, and
+    the number of bands, for all inputs at once.
+
+    Parameters
+    ----------
+    generators: iterable of :class:`PwxInputGenerator` objects
+        Input generators with the crystal structures and settings.
+
+    nprocs: int, optional
+        Number of MPI processes to suggest parallelization flags for.
+
+        Default: 1
+
+    max_memory_per_process: float, optional
+        Memory (in bytes) available per process. If specified, the number of
+        k-point pools is limited such that the estimated memory per process
+        fits (if possible).
+
+    valence_electrons: dict, optional
+        Number of valence electrons for (some of) the chemical species, e.g.
+        `z_valence` from the `pseudo_headers` of the input generators.
+
+        Default: number of electrons outside a noble gas core (see
+        `get_valence_electrons`).
+
+    Returns
+    -------
+    :class:`ResourceEstimates` with arrays of the estimates.
+
+    """
+    settings = _get_settings_arrays(generators, valence_electrons or {})
+    if not len(settings):
+        return ResourceEstimates(*[np.array([])] * 11)
+    cells = settings["cell"] / _BOHR_TO_ANGSTROM
+    volumes = np.abs(np.linalg.det(cells))
+    lengths = np.linalg.norm(cells, axis=2)
+    ecutwfc = settings["ecutwfc"]
+    ecutrho = settings["ecutrho"]
+    # plane waves with |k + G|^2 < cutoff (in Rydberg): V k^3 / (6 pi^2)
+    gamma_factor = np.where(settings["gamma_only"], 0.5, 1.0)
+    npw = np.ceil(volumes * ecutwfc ** 1.5 / (6 * np.pi ** 2) * gamma_factor)
+    ngm = np.ceil(volumes * ecutrho ** 1.5 / (6 * np.pi ** 2) * gamma_factor)
+    npw = npw.astype(int)
+    ngm = ngm.astype(int)
+    fft_grid = _get_fft_grids(lengths, ecutrho)
+    nfft = np.prod(fft_grid, axis=1)
+    nspin = settings["nspin"]
+    nks = _count_kpoints(settings["grid"], settings["shift"], nspin)
+
+    nat = settings["nat"]
+    nelec = settings["nelec"]
+    occupied = np.ceil(nelec / 2.0)
+    nbnd = np.where(
+        settings["smearing"],
+        np.maximum(np.ceil(1.2 * nelec / 2.0), occupied + 4),
+        occupied,
+    )
+    nbnd = np.where(settings["nbnd"] > 0, settings["nbnd"], nbnd).astype(int)
+    memory = _get_memory(npw, nbnd, nat, nfft, nks, 1, 1)
+
+    # candidate numbers of pools: divisors of nprocs, (N, D) arrays
+    divisors = np.array([d for d in range(1, nprocs + 1) if nprocs % d == 0])
+    pools = divisors[np.newaxis]
+    procs_per_pool = nprocs // pools
+    side = np.minimum(
+        np.floor(np.sqrt(procs_per_pool)),
+        np.maximum(1, nbnd[:, None] // _BANDS_PER_LINALG_BLOCK),
+    )
+    linalg = (side ** 2).astype(int)
+    nks_pool = np.ceil(nks[:, None] / pools)
+    candidates = _get_memory(
+        npw[:, None],
+        nbnd[:, None],
+        nat[:, None],
+        nfft[:, None],
+        nks_pool,
+        procs_per_pool,
+        linalg,
+    )
+    # as many pools as possible (up to the number of k-points), that fit in
+    # memory; if none fits, the one with the least memory per process
+    valid = pools <= nks[:, None]
+    fits = valid
+    if max_memory_per_process is not None:
+        fits = valid & (candidates <= max_memory_per_process)
+    rows = np.arange(len(nat))
+    largest = np.where(fits, pools, 0).argmax(axis=1)
+    least = np.where(valid, candidates, np.inf).argmin(axis=1)
+    choice = np.where(fits.any(axis=1), largest, least)
+    return ResourceEstimates(
+        nat=nat,
+        nelec=nelec,
+        nbnd=nbnd,
+        npw=npw,
+        ngm=ngm,
+        fft_grid=fft_grid,
+        nks=nks,
+        memory=memory,
+        nk=divisors[choice],
+        nd=linalg[rows, choice],
+        memory_per_process=candidates[rows, choice],
+    )
@@ -1,12 +1,109 @@
 import json
-import pkg_resources
+import functools
+import collections
+from importlib import resources
 
 
-__all__ = ["QE_TAGS"]
+__all__ = [
+    "QE_TAGS",
+    "META_KEYS",
+    "SettingsCheck",
+    "get_qe_tags",
+    "get_qe_tag_index",
+    "check_pwx_settings",
+]
 
 
-tags_file = pkg_resources.resource_filename(
-    "dftinputgen.qe.settings", "tags_and_groups.json"
-)
-with open(tags_file, "r") as fr:
-    QE_TAGS = json.load(fr)
+# keys in calculation settings that are not pw.x namelist tags, but are used
+# to generate the input (e.g. the list of namelists and cards to write)
+META_KEYS = ("namelists", "cards", "kpoints", "pseudo_names", "hubbard_set")
+
+
+@functools.lru_cache(maxsize=None)
+def get_qe_tags():
+    """Tags for QE codes grouped into namelists/cards (loaded lazily)."""
+    tags_file = resources.files("dftinputgen.qe.settings").joinpath(
+        "tags_and_groups.json"
+    )
+    return json.loads(tags_file.read_text())
+
+
+@functools.lru_cache(maxsize=None)
+def get_qe_tag_index(code="pw.x"):
+    """Reverse index of namelist tag -> (namelist, position) for a QE code.
+
+    `position` is the position of the tag in the list of tags of its
+    namelist, i.e. the order in which tags are written in input files.
+    Built once from the tags in `tags_and_groups.json`, on first use.
+    """
+    index = {}
+    for namelist, tags in get_qe_tags()[code]["namelist_tags"].items():
+        for position, tag in enumerate(tags):
+            index[tag] = (namelist, position)
+    return index
+
+
+class SettingsCheck(
+    collections.namedtuple("SettingsCheck", ["unknown", "misplaced"])
+):
+    """Keys in calculation settings that are not written to input files.
+
+    `unknown` is a sorted list of keys that are neither pw.x namelist tags
+    (or indexed forms of them, e.g. "celldm(1)") nor one of `META_KEYS`, and
+    `misplaced` a dictionary of tags -> namelist they belong to, for tags in
+    namelists that are not in the "namelists" to write.
+    """
+
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        """Are there no unknown or misplaced keys."""
+        return not self.unknown and not self.misplaced
+
+    def messages(self):
+        """Description of each unknown or misplaced key."""
+        messages = ['Unknown tag "{}"'.format(key) for key in self.unknown]
+        for key, namelist in sorted(self.misplaced.items()):
+            msg = 'Tag "{}" in namelist "{}", which is not written'.format(
+                key, namelist
+            )
+            messages.append(msg)
+        return messages
+
+
+def check_pwx_settings(settings):
+    """Find keys in pw.x calculation settings that would not be written.
+
+    A single pass over the keys in `settings`, using the reverse index from
+    `get_qe_tag_index`, e.g. to catch misspelled tags up front.
+
+    Returns
+    -------
+    :class:`SettingsCheck` with the unknown and misplaced keys.
+
+    """
+    index = get_qe_tag_index("pw.x")
+    namelists = set(settings.get("namelists", []))
+    unknown = []
+    misplaced = {}
+    for key in settings:
+        if key in META_KEYS:
+            continue
+        entry = index.get(key)
+        if entry is None:
+            # indexed form of a tag, e.g. "starting_magnetization(1)"
+            entry = index.get(key.partition("(")[0])
+        if entry is None:
+            unknown.append(key)
+        elif entry[0] not in namelists:
+            misplaced[key] = entry[0]
+    return SettingsCheck(sorted(unknown), misplaced)
+
+
+def __getattr__(name):
+    # `QE_TAGS` is loaded lazily, on first access
+    if name == "QE_TAGS":
+        return get_qe_tags()
+    msg = "module {!r} has no attribute {!r}".format(__name__, name)
+    raise AttributeError(msg)
@@ -1,23 +1,289 @@
 import os
 import json
-import pkg_resources
+import time
+import functools
+import threading
+import collections.abc
+from importlib import resources
 
+from dftinputgen.base import DftInputGeneratorError
+from dftinputgen.base import FrozenDict
+from dftinputgen.base import FrozenList
+from dftinputgen.base import freeze
+from dftinputgen.base import thaw
 
-__all__ = ["QE_PRESETS"]
 
+__all__ = [
+    "QE_PRESETS",
+    "PRESETS_PATH_ENV_VAR",
+    "FrozenDict",
+    "FrozenList",
+    "PresetRegistry",
+    "PresetRegistryError",
+    "freeze",
+    "thaw",
+    "get_qe_presets",
+]
 
-QE_PRESETS = {}
 
+# environment variable with directories of site-specific presets
+PRESETS_PATH_ENV_VAR = "DFTINPUTGEN_PRESETS_PATH"
 
-preset_listdir = pkg_resources.resource_listdir(
-    "dftinputgen.qe.settings", "calculation_presets"
-)
-for filename in preset_listdir:
-    root, ext = os.path.splitext(filename)
-    if not ext == ".json":
-        continue
-    resource = pkg_resources.resource_filename(
-        "dftinputgen.qe.settings.calculation_presets", filename
-    )
-    with open(resource, "r") as fr:
-        QE_PRESETS[root] = json.load(fr)
+
+class PresetRegistryError(DftInputGeneratorError):
+    """Base class for errors in loading or registering presets."""
+
+    pass
+
+
+def _validate_preset(name, settings, source):
+    """Check that every key of a preset is a valid pw.x tag.
+
+    If the preset specifies the namelists to write, every tag must also be
+    in one of them (else the namelists come from other settings).
+    """
+    # (imported here: the tags are only loaded when presets are validated)
+    from dftinputgen.qe.settings import check_pwx_settings
+
+    if not isinstance(settings, dict):
+        msg = 'Preset "{}" ({}) is not a dictionary'.format(name, source)
+        raise PresetRegistryError(msg)
+    check = check_pwx_settings(settings)
+    if "namelists" not in settings:
+        check = check._replace(misplaced={})
+    if not check.ok:
+        msg = 'Invalid preset "{}" ({}): {}'.format(
+            name, source, "; ".join(check.messages())
+        )
+        raise PresetRegistryError(msg)
+
+
+def _load_builtin_presets():
+    """Presets shipped with the package, as (name, settings, source)."""
+    package = "dftinputgen.qe.settings.calculation_presets"
+    for resource in sorted(
+        resources.files(package).iterdir(), key=lambda r: r.name
+    ):
+        root, ext = os.path.splitext(resource.name)
+        if not ext == ".json":
+            continue
+        yield root, json.loads(resource.read_text()), resource.name
+
+
+class _PresetDirectory(object):
+    """Presets in *.json files in a directory, reloaded when modified."""
+
+    def __init__(self, path):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self._dir_mtime = None
+        # file name -> modification time
+        self._file_mtimes = {}
+        self.presets = {}
+
+    def _scan(self):
+        """Modification times of the directory and of each *.json file."""
+        try:
+            dir_mtime = os.stat(self.path).st_mtime_ns
+            if dir_mtime == self._dir_mtime:
+                filenames = list(self._file_mtimes)
+            else:
+                filenames = sorted(
+                    f for f in os.listdir(self.path) if f.endswith(".json")
+                )
+            file_mtimes = {}
+            for filename in filenames:
+                path = os.path.join(self.path, filename)
+                file_mtimes[filename] = os.stat(path).st_mtime_ns
+        except OSError as err:
+            msg = 'Failed to list presets in "{}": {}'.format(self.path, err)
+            raise PresetRegistryError(msg)
+        return dir_mtime, file_mtimes
+
+    def refresh(self):
+        """Reload the presets if any file was modified; return if so."""
+        dir_mtime, file_mtimes = self._scan()
+        if dir_mtime == self._dir_mtime and file_mtimes == self._file_mtimes:
+            return False
+        presets = {}
+        for filename in file_mtimes:
+            path = os.path.join(self.path, filename)
+            try:
+                with open(path, "r") as fr:
+                    settings = json.load(fr)
+            except (IOError, OSError, ValueError) as err:
+                msg = 'Failed to load preset "{}": {}'.format(path, err)
+                raise PresetRegistryError(msg)
+            name = os.path.splitext(filename)[0]
+            _validate_preset(name, settings, path)
+            presets[name] = freeze(settings)
+        self.presets = presets
+        self._dir_mtime = dir_mtime
+        self._file_mtimes = file_mtimes
+        return True
+
+
+class PresetRegistry(collections.abc.Mapping):
+    """Read-only mapping of preset name -> frozen calculation settings.
+
+    Presets are validated (see `check_pwx_settings`) and frozen (see
+    `FrozenDict`) once, when loaded, so that they can be shared safely by
+    all input generators, threads, and worker processes forked from the
+    current one (which see the same objects, copy-on-write), and cannot be
+    modified in place by mistake.
+
+    In order of increasing priority, presets are taken from:
+
+    1. the presets shipped with the package (loaded on first use);
+    2. *.json files in site-specific directories (see `add_directory`, and
+       the DFTINPUTGEN_PRESETS_PATH environment variable), named after the
+       file, e.g. "scf-tight" for "scf-tight.json";
+    3. presets registered with `register`.
+
+    Directories are checked for modified, added, or removed files at most
+    once every `check_interval` seconds, and reloaded if needed.
+    """
+
+    def __init__(self, check_interval=1.0):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        check_interval: float, optional
+            Minimum time (in seconds) between checks of the site-specific
+            directories for modified files (0 to check on every access).
+
+            Default: 1.0
+
+        """
+        self.check_interval = check_interval
+        self._builtin = None
+        self._directories = []
+        self._env_path = None
+        self._registered = {}
+        self._presets = None
+        self._checked_at = None
+        self._lock = threading.RLock()
+
+    def register(self, name, settings):
+        """Register a preset from a dictionary of calculation settings.
+
+        Raises `PresetRegistryError` if any of the settings would not be
+        written to input files (e.g. misspelled tags).
+        """
+        _validate_preset(name, settings, "registered")
+        with self._lock:
+            self._registered[name] = freeze(settings)
+            self._presets = None
+
+    def unregister(self, name):
+        """Remove a preset registered with `register`."""
+        with self._lock:
+            del self._registered[name]
+            self._presets = None
+
+    def add_directory(self, path):
+        """Add a directory of site-specific presets (*.json files).
+
+        Presets in directories added later take precedence over those in
+        directories added earlier, and over the presets shipped with the
+        package.
+        """
+        directory = _PresetDirectory(path)
+        with self._lock:
+            directory.refresh()
+            self._directories.append(directory)
+            self._presets = None
+
+    def remove_directory(self, path):
+        """Remove a directory of site-specific presets."""
+        path = os.path.abspath(os.path.expanduser(path))
+        with self._lock:
+            self._directories = [
+                d for d in self._directories if d.path != path
+            ]
+            self._presets = None
+
+    @property
+    def directories(self):
+        """Paths to the directories of site-specific presets."""
+        self._sync_env_path()
+        return [d.path for d in self._directories]
+
+    def _sync_env_path(self):
+        """Use the directories in DFTINPUTGEN_PRESETS_PATH (if changed)."""
+        env_path = os.environ.get(PRESETS_PATH_ENV_VAR, "")
+        if env_path == self._env_path:
+            return
+        with self._lock:
+            old_paths = (self._env_path or "").split(os.pathsep)
+            new_paths = env_path.split(os.pathsep)
+            self._env_path = env_path
+            for path in old_paths:
+                if path and path not in new_paths:
+                    self.remove_directory(path)
+            current = [d.path for d in self._directories]
+            for path in new_paths:
+                abspath = os.path.abspath(os.path.expanduser(path))
+                if path and abspath not in current:
+                    self.add_directory(path)
+
+    def refresh(self):
+        """Reload presets from modified site-specific directories now."""
+        with self._lock:
+            changed = [d.refresh() for d in self._directories]
+            if any(changed):
+                self._presets = None
+            self._checked_at = time.monotonic()
+
+    def _get_presets(self):
+        self._sync_env_path()
+        now = time.monotonic()
+        checked_at = self._checked_at
+        if checked_at is None or now - checked_at >= self.check_interval:
+            self.refresh()
+        presets = self._presets
+        if presets is None:
+            with self._lock:
+                if self._builtin is None:
+                    builtin = {}
+                    for name, settings, source in _load_builtin_presets():
+                        _validate_preset(name, settings, source)
+                        builtin[name] = freeze(settings)
+                    self._builtin = builtin
+                merged = dict(self._builtin)
+                for directory in self._directories:
+                    merged.update(directory.presets)
+                merged.update(self._registered)
+                presets = self._presets = FrozenDict(merged)
+        return presets
+
+    def __getitem__(self, name):
+        return self._get_presets()[name]
+
+    def __iter__(self):
+        return iter(self._get_presets())
+
+    def __len__(self):
+        return len(self._get_presets())
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, sorted(self))
+
+
+@functools.lru_cache(maxsize=None)
+def get_qe_presets():
+    """Registry of all calculation presets for QE codes.
+
+    The registry is created on first use, and the presets shipped with the
+    package are loaded when first accessed (see :class:`PresetRegistry`).
+    """
+    return PresetRegistry()
+
+
+def __getattr__(name):
+    # `QE_PRESETS` is loaded lazily, on first access
+    if name == "QE_PRESETS":
+        return get_qe_presets()
+    msg = "module {!r} has no attribute {!r}".format(__name__, name)
+    raise AttributeError(msg)
@@ -0,0 +1,370 @@
+"""Generate pw.x input files for a sweep over calculation settings."""
+
+import os
+import json
+import hashlib
+import itertools
+import collections
+
+import numpy as np
+
+from dftinputgen.utils import get_kpoint_grids_from_spacing
+from dftinputgen.manifest import Manifest
+from dftinputgen.targets import DirectoryTarget
+from dftinputgen.qe.settings import get_qe_tag_index
+from dftinputgen.qe.pwx import PwxRenderPlan
+from dftinputgen.qe.pwx import PwxInputGeneratorError
+from dftinputgen.qe.pwx import _qe_val_formatter
+from dftinputgen.qe.pwx import _kpoints_card_as_str
+
+
+__all__ = ["PwxSweep", "PwxSweepError", "SweepInput"]
+
+
+class PwxSweepError(PwxInputGeneratorError):
+    """Base class for errors in setting up parameter sweeps."""
+
+    pass
+
+
+SweepInput = collections.namedtuple(
+    "SweepInput", ["index", "values", "points", "text"]
+)
+SweepInput.__doc__ = """One distinct pw.x input in a parameter sweep.
+
+`index` is the position of the input among all distinct inputs, `values` the
+swept settings (of the first sweep point that gives this input), `points` the
+positions of all sweep points that give this (identical) input, and `text`
+the rendered pw.x input.
+"""
+
+
+class PwxSweep(object):
+    """Sweep over values of calculation settings for a crystal structure.
+
+    Generates the pw.x input for every point in a grid of values of one or
+    more settings, e.g., for convergence tests with respect to `ecutwfc`,
+    `ecutrho`, `degauss`, or the k-point spacing.
+
+    The structure-dependent cards (ATOMIC_SPECIES, ATOMIC_POSITIONS,
+    CELL_PARAMETERS) are rendered only once for the whole sweep, and the
+    namelists are compiled once with slots for the swept tags (see
+    :class:`PwxRenderPlan`). Only the swept namelist lines, and the K_POINTS
+    card (if "kpoints" is swept), are rendered for each point.
+
+    Sweep points that result in identical input (e.g. different k-point
+    spacings that give the same k-point grid) are merged into one input.
+    """
+
+    def __init__(self, pwx_input_generator, parameters, mode="product"):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        pwx_input_generator: :class:`PwxInputGenerator`
+            Generator with the crystal structure and the base calculation
+            settings (used for all settings that are not swept).
+
+        parameters: dict
+            Settings to sweep over, with a list of values for each. The keys
+            are either pw.x namelist tags (e.g. "ecutwfc"), or "kpoints",
+            with k-points settings as values, e.g.
+            {"scheme": "automatic", "spacing": 0.2, "shift": [0, 0, 0]}.
+
+        mode: str, optional
+            How to combine the values of different settings into points:
+            "product" (all combinations, in the order of
+            `itertools.product`), or "zip" (the i-th value of every setting;
+            all lists of values must be of the same length).
+
+            Default: "product"
+
+        """
+        self._pwig = pwx_input_generator
+        self._tags = tuple(parameters)
+        self._validate_tags(self._tags)
+        values = [list(parameters[tag]) for tag in self._tags]
+        if mode == "product":
+            self._points = list(itertools.product(*values))
+        elif mode == "zip":
+            if len(set(len(v) for v in values)) > 1:
+                msg = "Values of all settings must be of the same length"
+                raise PwxSweepError(msg)
+            self._points = list(zip(*values))
+        else:
+            msg = 'Unknown sweep mode "{}"'.format(mode)
+            raise PwxSweepError(msg)
+        self._cards = {}
+        self._groups = None
+
+    @staticmethod
+    def _get_namelist(tag):
+        """Namelist of a tag, or of its base tag if indexed, e.g. "celldm(1)".
+
+        None if the tag is not a known namelist tag.
+        """
+        entry = get_qe_tag_index("pw.x").get(tag.partition("(")[0])
+        return entry[0] if entry is not None else None
+
+    @classmethod
+    def _validate_tags(cls, tags):
+        structure_tags = PwxRenderPlan.structure_tags
+        for tag in tags:
+            if tag in structure_tags or (
+                tag != "kpoints" and cls._get_namelist(tag) is None
+            ):
+                msg = 'Cannot sweep over "{}"'.format(tag)
+                raise PwxSweepError(msg)
+            if tag == "pseudo_dir":
+                msg = "Cannot sweep over pseudopotentials"
+                raise PwxSweepError(msg)
+
+    @property
+    def pwx_input_generator(self):
+        """Generator with the crystal structure and base settings."""
+        return self._pwig
+
+    @property
+    def tags(self):
+        """Names of the swept settings."""
+        return self._tags
+
+    @property
+    def points(self):
+        """Values of the swept settings at every sweep point, as dicts."""
+        return [dict(zip(self.tags, point)) for point in self._points]
+
+    @property
+    def namelist_tags(self):
+        """Swept tags that are rendered in the namelists."""
+        calc_sett = self._pwig.calculation_settings
+        rendered = set(calc_sett.get("namelists", []))
+        return tuple(
+            tag for tag in self.tags if self._get_namelist(tag) in rendered
+        )
+
+    def _get_kpoints_cards(self):
+        """K_POINTS card for each distinct k-points setting in the sweep."""
+        if "kpoints" not in self.tags:
+            return {}
+        position = self.tags.index("kpoints")
+        kpoints_setts = collections.OrderedDict()
+        for point in self._points:
+            kpoints_sett = point[position]
+            kpoints_setts[json.dumps(kpoints_sett, sort_keys=True)] = (
+                kpoints_sett
+            )
+        # calculate the k-point grids for all k-spacings at once
+        from_spacing = [
+            key
+            for key, sett in kpoints_setts.items()
+            if sett.get("scheme") == "automatic" and not sett.get("grid")
+        ]
+        grids = {}
+        if from_spacing:
+            cell = self._pwig.structure_view.cell
+            spacings = [kpoints_setts[key]["spacing"] for key in from_spacing]
+            cells = np.repeat(cell[np.newaxis], len(spacings), axis=0)
+            grids = dict(
+                zip(
+                    from_spacing,
+                    get_kpoint_grids_from_spacing(cells, spacings).tolist(),
+                )
+            )
+        return {
+            key: _kpoints_card_as_str(
+                sett, self._pwig.structure_view, grid=grids.get(key)
+            )
+            for key, sett in kpoints_setts.items()
+        }
+
+    def _get_groups(self):
+        """Group sweep points by the input they result in."""
+        if self._groups is not None:
+            return self._groups
+        kpoints_cards = {}
+        if "kpoints" in self._pwig._get_cards():
+            kpoints_cards = self._get_kpoints_cards()
+        positions = [self.tags.index(tag) for tag in self.namelist_tags]
+        groups = collections.OrderedDict()
+        for i, point in enumerate(self._points):
+            key = tuple(_qe_val_formatter(point[p]) for p in positions)
+            if kpoints_cards:
+                kpoints_sett = point[self.tags.index("kpoints")]
+                kpoints_key = json.dumps(kpoints_sett, sort_keys=True)
+                key += (kpoints_cards[kpoints_key],)
+            groups.setdefault(key, []).append(i)
+        self._groups = (groups, kpoints_cards)
+        return self._groups
+
+    def __len__(self):
+        """Number of distinct inputs in the sweep."""
+        return len(self._get_groups()[0])
+
+    def _get_card(self, card):
+        """Render a card that is the same for all sweep points only once."""
+        if card not in self._cards:
+            self._cards[card] = "".join(self._pwig._iter_card(card))
+        return self._cards[card]
+
+    def _iter_groups(self):
+        """Yield the index, swept values and points of each distinct input."""
+        groups, _ = self._get_groups()
+        for index, points in enumerate(groups.values()):
+            values = dict(zip(self.tags, self._points[points[0]]))
+            yield index, values, points
+
+    def _get_plan(self):
+        """Namelists compiled with slots for the swept namelist tags."""
+        pwig = self._pwig
+        return PwxRenderPlan(
+            pwig.calculation_settings,
+            specify_potentials=pwig.specify_potentials,
+            variable_tags=self.namelist_tags,
+        )
+
+    def _render(self, plan, values):
+        """pw.x input for the swept `values`, as a string."""
+        pwig = self._pwig
+        _, kpoints_cards = self._get_groups()
+        namelists = plan.namelists_as_str(
+            pwig.parameters_from_structure, values
+        )
+        cards = []
+        for card in pwig._get_cards():
+            if card == "kpoints" and kpoints_cards:
+                kpoints_key = json.dumps(values["kpoints"], sort_keys=True)
+                cards.append(kpoints_cards[kpoints_key])
+            else:
+                cards.append(self._get_card(card))
+        return "\n".join([namelists, "\n".join(cards)])
+
+    def _input_hash(self, values):
+        """Hash of everything the input for the swept `values` depends on."""
+        hasher = hashlib.sha256()
+        hasher.update(self._pwig.input_hash.encode())
+        hasher.update(
+            json.dumps(values, sort_keys=True, default=str).encode()
+        )
+        return hasher.hexdigest()
+
+    def iter_inputs(self):
+        """Yield each distinct pw.x input in the sweep as a `SweepInput`.
+
+        The inputs are rendered lazily, in the order of the first sweep point
+        that results in each.
+        """
+        plan = self._get_plan()
+        for index, values, points in self._iter_groups():
+            text = self._render(plan, values)
+            yield SweepInput(index, values, points, text)
+
+    def write_inputs(
+        self,
+        write_location=None,
+        filename_template=None,
+        target=None,
+        manifest=None,
+    ):
+        """Write each distinct pw.x input in the sweep to a file.
+
+        Files are written the same way as by
+        `PwxInputGenerator.write_pwx_input`: via temporary files in
+        directories, leaving existing files as is if `overwrite_files` of the
+        base generator is False, and skipping files that are up to date if
+        its `incremental` is True (or a `manifest` is specified). Up-to-date
+        inputs are not rendered.
+
+        Parameters
+        ----------
+        write_location: str, optional
+            Path to the directory in which to write the input files (created
+            if missing), if no `target` is specified.
+
+            Default: `write_location` of the base input generator.
+
+        filename_template: str, optional
+            Template for the names of the input files, with the fields
+            {index} (position of the input among all distinct inputs) and
+            the names of swept namelist tags, e.g. "scf_{ecutwfc}.in".
+
+            Default: "{index}_[`pwx_input_file` of the base generator]".
+
+        target: :class:`OutputTarget`, optional
+            Target to write the input files to, e.g. an archive.
+
+            Default: :class:`DirectoryTarget` for `write_location` (or the
+            `output_target` of the base generator).
+
+        manifest: :class:`Manifest`, optional
+            Manifest to check whether files are up to date, and to record
+            the files written in. The caller is responsible for saving it.
+
+            Default: the manifest kept open for the directory (see
+            `Manifest.open`), else the one saved in it (saved again once
+            all files are written), if `incremental` is True.
+
+        Returns
+        -------
+        Dictionary of the path of each input file (or archive member),
+        whether written or skipped, -> values of the swept settings at all
+        sweep points that result in that input.
+
+        """
+        pwig = self._pwig
+        if target is None:
+            if write_location is not None:
+                target = DirectoryTarget(write_location)
+            else:
+                target = pwig.output_target
+        if filename_template is None:
+            filename_template = "{{index}}_{}".format(pwig.pwx_input_file)
+        save_manifest = False
+        if isinstance(target, DirectoryTarget):
+            if target.write_location is None:
+                msg = "Location to write files not specified"
+                raise PwxInputGeneratorError(msg)
+            if not os.path.isdir(target.write_location):
+                os.makedirs(target.write_location)
+            if manifest is None and pwig.incremental:
+                manifest = Manifest.get_open(target.write_location)
+                save_manifest = manifest is None
+                if save_manifest:
+                    manifest = Manifest.load(target.write_location)
+        else:
+            manifest = None
+        plan = None
+        written = collections.OrderedDict()
+        for index, values, points in self._iter_groups():
+            fields = {
+                tag: value for tag, value in values.items() if tag != "kpoints"
+            }
+            filename = filename_template.format(index=index, **fields)
+            location = None
+            input_hash = None
+            if isinstance(target, DirectoryTarget):
+                if not pwig.overwrite_files and target.exists(filename):
+                    location = target.path(filename)
+                elif manifest is not None:
+                    input_hash = self._input_hash(values)
+                    if manifest.is_current(filename, input_hash):
+                        location = target.path(filename)
+            if location is not None:
+                pwig.stats.count("files_skipped")
+            else:
+                if plan is None:
+                    plan = self._get_plan()
+                text = self._render(plan, values)
+                with pwig.stats.phase("write"):
+                    location = target.write(filename, [text])
+                pwig.stats.count("files_written")
+                if manifest is not None:
+                    output_hash = hashlib.sha256(text.encode()).hexdigest()
+                    manifest.record(filename, input_hash, output_hash)
+            written[location] = [
+                dict(zip(self.tags, self._points[i])) for i in points
+            ]
+        if save_manifest:
+            manifest.save()
+        return written
@@ -0,0 +1,354 @@
+"""Read the headers of pseudopotential files in the UPF format."""
+
+import os
+import re
+import json
+import atexit
+import hashlib
+import threading
+import collections
+
+from dftinputgen.base import DftInputGeneratorError
+
+
+__all__ = [
+    "UpfError",
+    "UpfHeader",
+    "UpfHeaderCache",
+    "UPF_HEADER_CACHE",
+    "read_upf_header",
+    "get_suggested_cutoffs",
+]
+
+
+# environment variable with the directory of the persistent header cache
+CACHE_DIR_ENV_VAR = "DFTINPUTGEN_CACHE_DIR"
+_DEFAULT_CACHE_DIR = os.path.join("~", ".cache", "dftinputgen")
+_CACHE_FILENAME = "upf_headers.json"
+_CACHE_VERSION = 1
+
+# bytes read at a time when hashing pseudopotential files
+_HASH_BLOCK_SIZE = 1 << 20
+
+# attributes of the PP_HEADER element in UPF v2 files
+_RE_ATTRIBUTE = re.compile(r'(\w+)\s*=\s*"([^"]*)"')
+
+
+class UpfError(DftInputGeneratorError):
+    """Base class for errors in reading pseudopotential files."""
+
+    pass
+
+
+class UpfHeader(
+    collections.namedtuple(
+        "UpfHeader",
+        [
+            "element",
+            "pseudo_type",
+            "functional",
+            "z_valence",
+            "wfc_cutoff",
+            "rho_cutoff",
+        ],
+    )
+):
+    """Header of a UPF pseudopotential file.
+
+    - `element`: chemical symbol of the element, e.g. "Fe"
+    - `pseudo_type`: e.g. "NC", "US", or "PAW"
+    - `functional`: exchange-correlation functional, e.g. "PBE"
+    - `z_valence`: number of valence electrons
+    - `wfc_cutoff`, `rho_cutoff`: suggested kinetic energy cutoffs (in Ry)
+      for the wavefunctions and the charge density, or None if not
+      specified in the file
+    """
+
+    __slots__ = ()
+
+    def as_dict(self):
+        """Header as a JSON-serializable dict."""
+        return dict(self._asdict())
+
+
+def _to_float(value):
+    """Float from a Fortran-formatted number, e.g. "1.6D+01"."""
+    return float(value.strip().replace("D", "E").replace("d", "e"))
+
+
+def _to_cutoff(value):
+    """Suggested cutoff, or None if not specified (zero)."""
+    cutoff = _to_float(value)
+    return cutoff if cutoff > 0 else None
+
+
+def _parse_v1_header(lines):
+    """Header from the lines of the PP_HEADER section of a UPF v1 file.
+
+    Values are at fixed positions, one per line: version, element, pseudo
+    type, nonlinear core correction, functional, Z valence, total energy,
+    suggested cutoffs, ...
+    """
+    if len(lines) < 8:
+        raise ValueError("Incomplete PP_HEADER section")
+    cutoffs = lines[7].split()
+    return UpfHeader(
+        element=lines[1].split()[0],
+        pseudo_type=lines[2].split()[0].upper(),
+        # (the functional is the first 20 characters, e.g. "SLA PW PBE PBE")
+        functional=" ".join(lines[4][:20].split()),
+        z_valence=_to_float(lines[5].split()[0]),
+        wfc_cutoff=_to_cutoff(cutoffs[0]),
+        rho_cutoff=_to_cutoff(cutoffs[1]),
+    )
+
+
+def _parse_v2_header(text):
+    """Header from the PP_HEADER element of a UPF v2 file."""
+    attributes = dict(_RE_ATTRIBUTE.findall(text))
+    for attribute in ("element", "pseudo_type", "z_valence"):
+        if attribute not in attributes:
+            msg = 'Attribute "{}" not found in PP_HEADER'.format(attribute)
+            raise ValueError(msg)
+    cutoffs = [
+        attributes.get(attribute, "0")
+        for attribute in ("wfc_cutoff", "rho_cutoff")
+    ]
+    return UpfHeader(
+        element=attributes["element"].strip(),
+        pseudo_type=attributes["pseudo_type"].strip().upper(),
+        functional=" ".join(attributes.get("functional", "").split()),
+        z_valence=_to_float(attributes["z_valence"]),
+        wfc_cutoff=_to_cutoff(cutoffs[0]),
+        rho_cutoff=_to_cutoff(cutoffs[1]),
+    )
+
+
+def _iter_header_lines(lines):
+    """Lines of the PP_HEADER section, from its opening tag to its end."""
+    in_header = False
+    for line in lines:
+        stripped = line.strip()
+        if not in_header:
+            if stripped.startswith("<PP_MESH"):
+                return
+            if not stripped.startswith("<PP_HEADER"):
+                continue
+            in_header = True
+        yield line.rstrip("\n")
+        # UPF v1: "</PP_HEADER>"; UPF v2: <PP_HEADER attr="..." ... />
+        if stripped.startswith("</PP_HEADER") or stripped.endswith("/>"):
+            return
+
+
+def read_upf_header(path):
+    """Read the header of a UPF (v1 or v2) pseudopotential file.
+
+    The file is read line by line only up to the end of the PP_HEADER
+    section, i.e. the (much larger) radial grids and functions that follow
+    are never read.
+
+    Raises `UpfError` if the file cannot be read, or has no valid header.
+    """
+    try:
+        with open(path, "r", errors="replace") as fr:
+            header_lines = list(_iter_header_lines(fr))
+    except (IOError, OSError) as err:
+        msg = 'Failed to read pseudopotential file "{}": {}'.format(path, err)
+        raise UpfError(msg)
+    if not header_lines:
+        msg = 'No PP_HEADER section in "{}"'.format(path)
+        raise UpfError(msg)
+    try:
+        if header_lines[0].strip() == "<PP_HEADER>":
+            return _parse_v1_header(header_lines[1:])
+        return _parse_v2_header(" ".join(header_lines))
+    except (ValueError, IndexError) as err:
+        msg = 'Invalid PP_HEADER in "{}": {}'.format(path, err)
+        raise UpfError(msg)
+
+
+def _hash_file(path):
+    """SHA-256 hash of the contents of a file."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as fr:
+        for block in iter(lambda: fr.read(_HASH_BLOCK_SIZE), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+class UpfHeaderCache(object):
+    """Persistent cache of UPF headers, keyed by the hash of the file.
+
+    Headers are read only once per pseudopotential file content: they are
+    kept in memory, and in a JSON file on disk shared across sessions. The
+    hash of each file is remembered together with its size and
+    modification time, so that unchanged files are not read (or hashed)
+    again either. New entries are written to disk in batches, by `flush`.
+
+    A single cache can be shared across input generators and threads.
+    """
+
+    def __init__(self, path=None):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        path: str, optional
+            Path to the JSON file of the cache on disk.
+
+            Default: "upf_headers.json" in the directory specified by the
+            DFTINPUTGEN_CACHE_DIR environment variable, if set, else in
+            "~/.cache/dftinputgen" (looked up every time the cache is
+            loaded or saved).
+
+        """
+        self._path = path
+        # absolute path of a file -> [size, mtime, hash]
+        self._files = {}
+        # hash of a file -> header (as a dict)
+        self._headers = {}
+        self._loaded = False
+        # are there new entries that are not saved to disk yet
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        """Path to the JSON file of the cache on disk."""
+        if self._path is not None:
+            return self._path
+        cache_dir = os.environ.get(CACHE_DIR_ENV_VAR, _DEFAULT_CACHE_DIR)
+        return os.path.join(os.path.expanduser(cache_dir), _CACHE_FILENAME)
+
+    def clear(self):
+        """Discard all cached headers in memory (not on disk)."""
+        with self._lock:
+            self._files.clear()
+            self._headers.clear()
+            self._loaded = False
+            self._dirty = False
+
+    def _read(self):
+        """Contents of the cache file on disk (empty if missing/invalid)."""
+        try:
+            with open(self.path, "r") as fr:
+                contents = json.load(fr)
+        except (IOError, OSError, ValueError):
+            return {}, {}
+        if contents.get("version") != _CACHE_VERSION:
+            return {}, {}
+        return contents.get("files", {}), contents.get("headers", {})
+
+    def _load(self):
+        if not self._loaded:
+            files, headers = self._read()
+            self._files.update(files)
+            self._headers.update(headers)
+            self._loaded = True
+
+    def _save(self):
+        """Merge the cache into the file on disk (written atomically)."""
+        files, headers = self._read()
+        files.update(self._files)
+        headers.update(self._headers)
+        contents = {
+            "version": _CACHE_VERSION,
+            "files": files,
+            "headers": headers,
+        }
+        path = self.path
+        tmp_path = "{}.{}.part".format(path, os.getpid())
+        try:
+            dirname = os.path.dirname(path)
+            if dirname:
+                os.makedirs(dirname, exist_ok=True)
+            with open(tmp_path, "w") as fw:
+                json.dump(contents, fw, indent=1, sort_keys=True)
+            os.replace(tmp_path, path)
+        except (IOError, OSError):
+            # (the cache is only an optimization: keep it in memory only)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def flush(self):
+        """Save any new entries into the file on disk, at once."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+                self._dirty = False
+
+    def get(self, path):
+        """Header of the UPF file at `path`, read only if not cached.
+
+        New entries are kept in memory until the next `flush` (at the latest,
+        at exit for `UPF_HEADER_CACHE`).
+
+        Raises `UpfError` if the file cannot be read, or has no valid header.
+        """
+        abspath = os.path.abspath(os.path.expanduser(path))
+        try:
+            st = os.stat(abspath)
+        except OSError as err:
+            msg = 'Failed to read pseudopotential file "{}": {}'.format(
+                path, err
+            )
+            raise UpfError(msg)
+        with self._lock:
+            self._load()
+            entry = self._files.get(abspath)
+            if entry is not None and entry[:2] == [st.st_size, st.st_mtime_ns]:
+                header = self._headers.get(entry[2])
+                if header is not None:
+                    return UpfHeader(**header)
+        digest = _hash_file(abspath)
+        with self._lock:
+            header = self._headers.get(digest)
+        if header is not None:
+            header = UpfHeader(**header)
+        else:
+            header = read_upf_header(abspath)
+        with self._lock:
+            self._files[abspath] = [st.st_size, st.st_mtime_ns, digest]
+            self._headers[digest] = header.as_dict()
+            self._dirty = True
+        return header
+
+
+# header cache shared by all input generators
+UPF_HEADER_CACHE = UpfHeaderCache()
+atexit.register(UPF_HEADER_CACHE.flush)
+
+
+def get_suggested_cutoffs(headers):
+    """Smallest cutoffs suggested by all pseudopotentials of a calculation.
+
+    The kinetic energy cutoff for the wavefunctions (`ecutwfc`) and the
+    charge density (`ecutrho`) are the largest of those suggested by the
+    pseudopotentials, i.e. the smallest that are safe for all of them.
+    `ecutrho` is at least 4 times `ecutwfc` (the smallest pw.x allows).
+
+    Parameters
+    ----------
+    headers: iterable of :class:`UpfHeader` objects
+        Headers of the pseudopotentials of all species in the calculation.
+
+    Returns
+    -------
+    Dictionary with "ecutwfc" and/or "ecutrho", each only if suggested by
+    every pseudopotential.
+
+    """
+    headers = list(headers)
+    cutoffs = {}
+    if not headers:
+        return cutoffs
+    wfc_cutoffs = [h.wfc_cutoff for h in headers]
+    if None not in wfc_cutoffs:
+        cutoffs["ecutwfc"] = max(wfc_cutoffs)
+    rho_cutoffs = [h.rho_cutoff for h in headers]
+    if None not in rho_cutoffs:
+        minimum = 4 * cutoffs.get("ecutwfc", 0)
+        cutoffs["ecutrho"] = max(max(rho_cutoffs), minimum)
+    return cutoffs
@@ -0,0 +1,133 @@
+"""Opt-in timing and counting of the phases of input generation."""
+
+import json
+import time
+
+
+__all__ = ["GenerationStats", "NullStats", "NULL_STATS"]
+
+
+class _PhaseTimer(object):
+    """Context manager that records the wall time spent in a phase."""
+
+    __slots__ = ("_stats", "_name", "_start")
+
+    def __init__(self, stats, name):
+        self._stats = stats
+        self._name = name
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stats.record(self._name, time.perf_counter() - self._start)
+
+
+class _NullPhaseTimer(object):
+    """Context manager that does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NULL_PHASE_TIMER = _NullPhaseTimer()
+
+
+class GenerationStats(object):
+    """Wall time and number of calls of each phase of input generation.
+
+    Input generators record, e.g., merging settings ("settings_merge"),
+    reading custom settings files ("settings_file"), matching
+    pseudopotentials ("pseudo_resolution"), calculating k-point grids
+    ("kpoints_card"), rendering namelists and cards ("render_namelists",
+    "render_cards"), and writing files ("write"), as well as counters such
+    as the number of files written or skipped.
+
+    Phases can be nested (e.g. rendering the K_POINTS card is part of
+    rendering cards), and the time recorded for a phase includes the time
+    spent in any nested phases.
+
+    The same stats object can be shared by multiple input generators, and
+    stats from different objects (e.g. from worker processes) can be merged,
+    to aggregate them over a batch of inputs.
+    """
+
+    # whether anything is recorded at all
+    enabled = True
+
+    def __init__(self):
+        # name of phase -> [number of calls, total wall time in seconds]
+        self._phases = {}
+        # name of counter -> value
+        self._counters = {}
+
+    def phase(self, name):
+        """Context manager to time one call of the phase `name`."""
+        return _PhaseTimer(self, name)
+
+    def record(self, name, seconds, calls=1):
+        """Add calls and wall time to the phase `name`."""
+        phase = self._phases.get(name)
+        if phase is None:
+            self._phases[name] = [calls, seconds]
+        else:
+            phase[0] += calls
+            phase[1] += seconds
+
+    def count(self, name, value=1):
+        """Increment the counter `name` by `value`."""
+        self._counters[name] = self._counters.get(name, 0) + value
+
+    def merge(self, other):
+        """Add all phases and counters of another stats object to this one."""
+        for name, (calls, seconds) in other._phases.items():
+            self.record(name, seconds, calls=calls)
+        for name, value in other._counters.items():
+            self.count(name, value)
+
+    def as_dict(self):
+        """Stats as a JSON-serializable dictionary."""
+        return {
+            "phases": {
+                name: {"calls": calls, "seconds": seconds}
+                for name, (calls, seconds) in sorted(self._phases.items())
+            },
+            "counters": dict(sorted(self._counters.items())),
+        }
+
+    def to_json(self, **kwargs):
+        """Stats as a JSON string (`kwargs` are passed to `json.dumps`)."""
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def dump(self, path):
+        """Write the stats as JSON to a file."""
+        with open(path, "w") as fw:
+            json.dump(self.as_dict(), fw, indent=2)
+
+
+class NullStats(GenerationStats):
+    """Stats object that records nothing, used when stats are disabled."""
+
+    enabled = False
+
+    def phase(self, name):
+        """Context manager that does nothing."""
+        return _NULL_PHASE_TIMER
+
+    def record(self, name, seconds, calls=1):
+        """Do nothing."""
+        pass
+
+    def count(self, name, value=1):
+        """Do nothing."""
+        pass
+
+
+# shared by all input generators that do not record stats
+NULL_STATS = NullStats()
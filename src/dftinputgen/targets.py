@@ -0,0 +1,264 @@
+"""Output targets that generated input files are written to."""
+
+import io
+import os
+import abc
+import six
+import json
+import time
+import hashlib
+import tarfile
+import zipfile
+
+from dftinputgen.base import DftInputGeneratorError
+
+
+__all__ = [
+    "OutputTarget",
+    "OutputTargetError",
+    "DirectoryTarget",
+    "ArchiveTarget",
+]
+
+
+class OutputTargetError(DftInputGeneratorError):
+    """Base class for errors in writing to output targets."""
+
+    pass
+
+
+@six.add_metaclass(abc.ABCMeta)
+class OutputTarget(object):
+    """Base abstract class for destinations of generated input files.
+
+    A target receives the content of each input file as an iterable of
+    chunks of text, together with the name of the file. Targets can be used
+    as context managers, to `close` them when done.
+    """
+
+    @abc.abstractmethod
+    def write(self, name, chunks):
+        """Write the chunks of text as the file `name`.
+
+        Returns the location the file was written to.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Finish writing to the target."""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class DirectoryTarget(OutputTarget):
+    """Write input files into a directory on disk, one file per input."""
+
+    def __init__(self, write_location):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        write_location: str
+            Path to the directory in which to write the input files.
+
+        """
+        self.write_location = write_location
+
+    def path(self, name):
+        """Path to the file `name` in the directory."""
+        return os.path.join(self.write_location, name)
+
+    def exists(self, name):
+        """Does the file `name` already exist in the directory."""
+        return os.path.exists(self.path(name))
+
+    def write(self, name, chunks):
+        """Write the chunks of text to the file `name` in the directory.
+
+        The file is written via a temporary file that replaces the target
+        file only once all chunks have been written, so that no partially
+        written files are left behind if an error occurs.
+
+        Returns the path to the file written.
+        """
+        path = self.path(name)
+        tmp_path = "{}.part".format(path)
+        try:
+            with open(tmp_path, "w") as fw:
+                for chunk in chunks:
+                    fw.write(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+
+# archive file extensions -> (format, compression)
+_ARCHIVE_EXTENSIONS = [
+    (".tar.gz", ("tar", "gz")),
+    (".tgz", ("tar", "gz")),
+    (".tar.bz2", ("tar", "bz2")),
+    (".tar.xz", ("tar", "xz")),
+    (".tar", ("tar", None)),
+    (".zip", ("zip", "deflated")),
+]
+
+_ZIP_COMPRESSION = {
+    None: zipfile.ZIP_STORED,
+    "stored": zipfile.ZIP_STORED,
+    "deflated": zipfile.ZIP_DEFLATED,
+    "bz2": zipfile.ZIP_BZIP2,
+    "xz": zipfile.ZIP_LZMA,
+}
+
+
+class ArchiveTarget(OutputTarget):
+    """Write input files as members of a single tar or zip archive.
+
+    Instead of creating one file per input (which is slow for a large number
+    of inputs on parallel filesystems), the inputs are appended one after
+    the other to a single archive file, optionally compressed.
+
+    When the target is closed, an index of all members (name, size, and
+    SHA-256 hash of the content) is written next to the archive, as JSON
+    in "[archive path].index.json".
+    """
+
+    def __init__(
+        self,
+        path,
+        archive_format=None,
+        compression=None,
+        member_template=None,
+    ):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        path: str
+            Path to the archive file to create (overwritten if it exists).
+
+        archive_format: str, optional
+            "tar" or "zip".
+
+            Default: determined from the extension of `path` (.tar, .tar.gz,
+            .tgz, .tar.bz2, .tar.xz, or .zip).
+
+        compression: str, optional
+            Compression to use: "gz", "bz2", "xz", or None for tar archives;
+            "deflated", "bz2", "xz", or "stored" for zip archives.
+
+            Default: determined from the extension of `path`.
+
+        member_template: str, optional
+            Template for the names of archive members, with the fields
+            {name} (name of the input file) and {index} (position of the
+            member in the archive).
+
+            Default: "{name}"
+
+        """
+        self.path = path
+        if archive_format is None:
+            archive_format, default_compression = self._from_extension(path)
+            if compression is None:
+                compression = default_compression
+        if archive_format not in ("tar", "zip"):
+            msg = 'Unknown archive format "{}"'.format(archive_format)
+            raise OutputTargetError(msg)
+        if archive_format == "zip" and compression not in _ZIP_COMPRESSION:
+            msg = 'Unknown compression "{}" for zip'.format(compression)
+            raise OutputTargetError(msg)
+        tar_compressions = (None, "gz", "bz2", "xz")
+        if archive_format == "tar" and compression not in tar_compressions:
+            msg = 'Unknown compression "{}" for tar'.format(compression)
+            raise OutputTargetError(msg)
+        self.archive_format = archive_format
+        self.compression = compression
+        self.member_template = member_template or "{name}"
+        self._archive = None
+        self._index = []
+        self._closed = False
+
+    @staticmethod
+    def _from_extension(path):
+        for extension, format_and_compression in _ARCHIVE_EXTENSIONS:
+            if path.lower().endswith(extension):
+                return format_and_compression
+        msg = 'Cannot determine the archive format of "{}"'.format(path)
+        raise OutputTargetError(msg)
+
+    @property
+    def index_path(self):
+        """Path to the JSON index of archive members."""
+        return "{}.index.json".format(self.path)
+
+    @property
+    def members(self):
+        """Index entries of all members written so far."""
+        return list(self._index)
+
+    def _open(self):
+        if self.archive_format == "tar":
+            mode = "w:{}".format(self.compression or "")
+            return tarfile.open(self.path, mode)
+        return zipfile.ZipFile(
+            self.path, "w", compression=_ZIP_COMPRESSION[self.compression]
+        )
+
+    def write(self, name, chunks):
+        """Append the chunks of text to the archive, as a member.
+
+        The content of the member is rendered completely before it is
+        added, so that no partial members are written if an error occurs.
+
+        Returns the name of the archive member.
+        """
+        if self._closed:
+            msg = 'Archive "{}" is already closed'.format(self.path)
+            raise OutputTargetError(msg)
+        data = "".join(chunks).encode()
+        member = self.member_template.format(name=name, index=len(self._index))
+        if self._archive is None:
+            self._archive = self._open()
+        if self.archive_format == "tar":
+            info = tarfile.TarInfo(member)
+            info.size = len(data)
+            info.mtime = time.time()
+            info.mode = 0o644
+            self._archive.addfile(info, io.BytesIO(data))
+        else:
+            self._archive.writestr(member, data)
+        self._index.append(
+            {
+                "member": member,
+                "size": len(data),
+                "sha256": hashlib.sha256(data).hexdigest(),
+            }
+        )
+        return member
+
+    def close(self):
+        """Finish writing the archive, and write the index of members."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._archive is None:
+            # nothing written: still create an (empty) archive
+            self._archive = self._open()
+        self._archive.close()
+        with open(self.index_path, "w") as fw:
+            index = {
+                "archive": os.path.basename(self.path),
+                "members": self._index,
+            }
+            json.dump(index, fw, indent=1)
@@ -1,10 +1,12 @@
+import os
 import re
 import six
+import glob
+import itertools
+import functools
 import numpy as np
 
-from ase import io as ase_io
-
-from dftinputgen.data import STANDARD_ATOMIC_WEIGHTS
+from dftinputgen.data import get_standard_atomic_weights
 
 
 class DftInputGeneratorUtilsError(Exception):
@@ -13,6 +15,210 @@ class DftInputGeneratorUtilsError(Exception):
     pass
 
 
+class StructureView(object):
+    """Compact, read-only, array-backed view of a crystal structure.
+
+    Holds only the data needed to generate DFT input files, computed once
+    from an :class:`ase.Atoms` object:
+
+    - `species`: tuple of unique chemical symbols, sorted
+    - `species_indices`: (N,) int array, index into `species` of each atom
+    - `scaled_positions`: (N, 3) float64 array of fractional coordinates
+    - `cell`: (3, 3) float64 array of lattice vectors (in Angstrom)
+
+    NB: The view is not updated if the `ase.Atoms` object it was created
+    from is later modified in place.
+    """
+
+    __slots__ = ("species", "species_indices", "scaled_positions", "cell")
+
+    def __init__(self, species, species_indices, scaled_positions, cell):
+        self.species = tuple(species)
+        self.species_indices = np.asarray(species_indices, dtype=np.intp)
+        self.scaled_positions = np.asarray(scaled_positions, dtype=np.float64)
+        self.cell = np.asarray(cell, dtype=np.float64)
+        for array in (self.species_indices, self.scaled_positions, self.cell):
+            array.setflags(write=False)
+
+    @classmethod
+    def from_atoms(cls, atoms):
+        """Create a view of an :class:`ase.Atoms` object."""
+        species, species_indices = np.unique(
+            atoms.get_chemical_symbols(), return_inverse=True
+        )
+        return cls(
+            species=species.tolist(),
+            species_indices=species_indices.reshape(-1),
+            scaled_positions=atoms.get_scaled_positions(),
+            cell=atoms.cell,
+        )
+
+    def to_atoms(self):
+        """Create an :class:`ase.Atoms` object from the view (periodic)."""
+        from ase import Atoms
+
+        return Atoms(
+            symbols=self.symbols.tolist(),
+            scaled_positions=self.scaled_positions,
+            cell=self.cell,
+            pbc=True,
+        )
+
+    def __len__(self):
+        return len(self.species_indices)
+
+    @property
+    def symbols(self):
+        """(N,) object array with the chemical symbol of every atom."""
+        species = np.empty(len(self.species), dtype=object)
+        species[:] = self.species
+        return species[self.species_indices]
+
+    def iter_blocks(self, size):
+        """Yield (symbols, scaled positions) of `size` atoms at a time."""
+        symbols = self.symbols
+        for start in range(0, len(self), size):
+            end = start + size
+            yield symbols[start:end], self.scaled_positions[start:end]
+
+    def species_counts(self):
+        """(S,) int array, number of atoms of each of the `species`."""
+        return np.bincount(self.species_indices, minlength=len(self.species))
+
+    def hash_arrays(self):
+        """Arrays that fully determine the view (e.g. to hash it)."""
+        return (self.species_indices, self.scaled_positions, self.cell)
+
+
+def get_supercell_matrix(supercell):
+    """Get the (3, 3) integer transformation matrix of a supercell.
+
+    `supercell` is either the number of repetitions of the cell along all
+    three lattice vectors (int), along each lattice vector (3 ints), or a
+    (3, 3) transformation matrix, whose rows are the lattice vectors of the
+    supercell in terms of those of the cell.
+
+    Raises `DftInputGeneratorUtilsError` if the matrix is not an integer,
+    non-singular matrix.
+    """
+    matrix = np.asarray(supercell)
+    if matrix.size == 1:
+        matrix = np.diag([matrix.item()] * 3)
+    elif matrix.shape == (3,):
+        matrix = np.diag(matrix)
+    if matrix.shape != (3, 3) or not np.all(matrix == np.round(matrix)):
+        msg = "Expected 1, 3, or (3, 3) integers for the supercell"
+        raise DftInputGeneratorUtilsError(msg)
+    matrix = np.round(matrix).astype(int)
+    if int(round(np.linalg.det(matrix))) == 0:
+        msg = "Supercell transformation matrix is singular"
+        raise DftInputGeneratorUtilsError(msg)
+    return matrix
+
+
+class SupercellView(StructureView):
+    """View of a supercell of a crystal structure, without building it.
+
+    The supercell is defined by a primitive :class:`StructureView` and a
+    transformation matrix (see `get_supercell_matrix`). The number of atoms
+    and the lattice vectors are calculated from the primitive cell, and the
+    atoms are generated one tile (periodic image of the primitive cell) at a
+    time by `iter_blocks`, so that memory scales with the primitive cell
+    rather than with the supercell.
+
+    Atoms are in the same order as in `ase.Atoms.repeat` for diagonal
+    matrices: all atoms of the primitive cell, tile by tile, with the tile
+    index along the first lattice vector varying the slowest.
+
+    NB: `species_indices`, `scaled_positions`, and `symbols` materialize
+    arrays for all atoms in the supercell.
+    """
+
+    __slots__ = ("primitive", "matrix")
+
+    def __init__(self, primitive, supercell):
+        self.primitive = primitive
+        self.matrix = get_supercell_matrix(supercell)
+        self.matrix.setflags(write=False)
+        self.species = primitive.species
+        self.cell = np.dot(self.matrix, primitive.cell)
+        self.cell.setflags(write=False)
+
+    @property
+    def n_tiles(self):
+        """Number of tiles (copies of the primitive cell) in the supercell."""
+        return abs(int(round(np.linalg.det(self.matrix))))
+
+    def __len__(self):
+        return self.n_tiles * len(self.primitive)
+
+    def iter_translations(self):
+        """Yield lattice translations of the tiles, one slab at a time.
+
+        Translations are (M, 3) int arrays, in units of the primitive
+        lattice vectors, with one slab per tile index along the first
+        primitive lattice vector.
+        """
+        inverse = np.linalg.inv(self.matrix)
+        # bounding box of the supercell, in primitive lattice coordinates
+        unit_corners = list(itertools.product([0, 1], repeat=3))
+        corners = np.dot(unit_corners, self.matrix)
+        lower = corners.min(axis=0)
+        upper = corners.max(axis=0)
+        for i in range(lower[0], upper[0]):
+            jk = np.mgrid[lower[1]:upper[1], lower[2]:upper[2]]
+            slab = np.empty((jk[0].size, 3), dtype=int)
+            slab[:, 0] = i
+            slab[:, 1] = jk[0].ravel()
+            slab[:, 2] = jk[1].ravel()
+            fractional = np.dot(slab, inverse)
+            inside = np.all(
+                (fractional > -1e-8) & (fractional < 1 - 1e-8), axis=1
+            )
+            if inside.any():
+                yield slab[inside]
+
+    def iter_blocks(self, size):
+        """Yield (symbols, scaled positions) of atoms, a few tiles at a time.
+
+        Each block holds as many whole tiles as fit in `size` atoms (at least
+        one tile).
+        """
+        inverse = np.linalg.inv(self.matrix)
+        n_atoms = len(self.primitive)
+        tiles_per_block = max(1, size // max(n_atoms, 1))
+        symbols = self.primitive.symbols
+        positions = self.primitive.scaled_positions
+        for slab in self.iter_translations():
+            for start in range(0, len(slab), tiles_per_block):
+                tiles = slab[start:start + tiles_per_block]
+                block = positions[np.newaxis] + tiles[:, np.newaxis]
+                block = np.dot(block.reshape(-1, 3), inverse)
+                # (twice, as in `ase.Atoms.get_scaled_positions`)
+                block %= 1.0
+                block %= 1.0
+                yield np.tile(symbols, len(tiles)), block
+
+    @property
+    def species_indices(self):
+        """(N,) int array, index into `species` of each atom (materialized)."""
+        return np.tile(self.primitive.species_indices, self.n_tiles)
+
+    @property
+    def scaled_positions(self):
+        """(N, 3) array of fractional coordinates (materialized)."""
+        blocks = [block for _, block in self.iter_blocks(len(self))]
+        return np.concatenate(blocks) if blocks else np.empty((0, 3))
+
+    def species_counts(self):
+        """(S,) int array, number of atoms of each of the `species`."""
+        return self.primitive.species_counts() * self.n_tiles
+
+    def hash_arrays(self):
+        """Arrays that fully determine the view (e.g. to hash it)."""
+        return self.primitive.hash_arrays() + (self.matrix,)
+
+
 def get_elem_symbol(species_label):
     """Get element symbol from species label, e.g. "Fe" from "Fe1", "Fe-2".
 
@@ -23,7 +229,7 @@ def get_elem_symbol(species_label):
     re_formula = re.compile("([A-Z][a-z]?)")
     symbols = re_formula.findall(species_label)
     for symbol in symbols:
-        if symbol in STANDARD_ATOMIC_WEIGHTS:
+        if symbol in get_standard_atomic_weights():
             return symbol
     msg = "No valid element symbol found"
     raise DftInputGeneratorUtilsError(msg)
@@ -32,21 +238,154 @@ def get_elem_symbol(species_label):
 def read_crystal_structure(crystal_structure, **kwargs):
     """Use `ase.io.read` to from crystal structure file specified."""
     if isinstance(crystal_structure, six.string_types):
+        from ase import io as ase_io
+
         return ase_io.read(crystal_structure, **kwargs)
     else:
         msg = "Expected type str; found {}".format(type(crystal_structure))
         raise TypeError(msg)
 
 
+def expand_structure_paths(paths):
+    """Expand globs and directories into a list of crystal structure files.
+
+    Every input path can be a file, a directory (all non-hidden files in it
+    are used), or a glob pattern (e.g. "structures/*.vasp"). Files from each
+    directory/glob are sorted by name; duplicates are listed only once.
+
+    Raises `DftInputGeneratorUtilsError` if a path does not match any file.
+    """
+    if isinstance(paths, six.string_types):
+        paths = [paths]
+    files = []
+    seen = set()
+    for path in paths:
+        if os.path.isdir(path):
+            matches = [
+                os.path.join(path, f)
+                for f in sorted(os.listdir(path))
+                if not f.startswith(".")
+            ]
+            matches = [m for m in matches if os.path.isfile(m)]
+        elif glob.has_magic(path):
+            matches = sorted(p for p in glob.glob(path) if os.path.isfile(p))
+        else:
+            matches = [path] if os.path.isfile(path) else []
+        if not matches:
+            msg = 'No crystal structure files found for "{}"'.format(path)
+            raise DftInputGeneratorUtilsError(msg)
+        for match in matches:
+            if match not in seen:
+                seen.add(match)
+                files.append(match)
+    return files
+
+
+def iter_chunks(items, chunksize):
+    """Yield lists of (up to) `chunksize` consecutive items of an iterable.
+
+    The items are consumed lazily, one chunk at a time, e.g. to send them to
+    worker processes in chunks.
+    """
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def read_crystal_structures(crystal_structures, index=":", **kwargs):
+    """Use `ase.io.read` to read all frames from a crystal structure file.
+
+    Returns a list of `ase.Atoms` objects for the frames selected by `index`
+    (e.g. ":" for all frames in a trajectory or extxyz file, "-1" for the
+    last one), even if a single frame is selected.
+    """
+    if not isinstance(crystal_structures, six.string_types):
+        msg = "Expected type str; found {}".format(type(crystal_structures))
+        raise TypeError(msg)
+    from ase import io as ase_io
+
+    frames = ase_io.read(crystal_structures, index=index, **kwargs)
+    if not isinstance(frames, list):
+        frames = [frames]
+    return frames
+
+
+# number of decimals cells and k-spacings are rounded to, to cache k-grids
+_KPOINT_GRID_CACHE_DECIMALS = 10
+
+
+def get_kpoint_grids_from_spacing(cells, spacing):
+    """Get k-point grids for a stack of cells and k-spacing(s), at once.
+
+    Vectorized variant of `get_kpoint_grid_from_spacing`, e.g., for
+    k-spacing convergence studies over a large number of structures.
+
+    Parameters
+    ----------
+    cells: array-like
+        (N, 3, 3) array of lattice vectors (in Angstrom) of N cells.
+
+    spacing: float or array-like
+        Maximum distance between two k-points on a uniform grid in reciprocal
+        space: either the same for all cells, or (N,) one for each cell.
+
+    Returns
+    -------
+    k-point grids as an (N, 3) array of integers.
+
+    """
+    cells = np.asarray(cells, dtype=float).reshape(-1, 3, 3)
+    spacing = np.asarray(spacing, dtype=float).reshape(-1, 1)
+    rcells = 2 * np.pi * np.linalg.inv(cells).transpose(0, 2, 1)
+    norms = np.linalg.norm(rcells, axis=2)
+    return np.ceil(norms / spacing).astype(int)
+
+
+class _KpointGridKey(object):
+    """Cell and k-spacing, hashed and compared by their rounded values."""
+
+    __slots__ = ("cell", "spacing", "_key")
+
+    def __init__(self, cell, spacing):
+        self.cell = cell
+        self.spacing = spacing
+        self._key = (
+            tuple(np.round(cell, _KPOINT_GRID_CACHE_DECIMALS).ravel()),
+            round(spacing, _KPOINT_GRID_CACHE_DECIMALS),
+        )
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __eq__(self, other):
+        if not isinstance(other, _KpointGridKey):
+            return NotImplemented
+        return self._key == other._key
+
+
+@functools.lru_cache(maxsize=1024)
+def _get_cached_kpoint_grid(key):
+    # the rounded values are only the cache key: grid from the actual ones
+    cell = key.cell.reshape(1, 3, 3)
+    return tuple(get_kpoint_grids_from_spacing(cell, key.spacing)[0].tolist())
+
+
 def get_kpoint_grid_from_spacing(crystal_structure, spacing):
     """Get k-point grid for an input crystal structure and k-spacing.
 
     Returns a list [k1, k2, k3] with the dimensions of a uniform
     k-point grid corresponding to the input `spacing`.
 
+    Grids are cached for the most recently used (cell, spacing) pairs, looked
+    up with both rounded to `_KPOINT_GRID_CACHE_DECIMALS` decimals, but
+    calculated from the actual cell and spacing.
+
     Parameters
     ----------
-    crystal_structure: `ase.Atoms` object
+    crystal_structure: `ase.Atoms` or `StructureView` object
         Crystal structure for which to calculate k-point grid
 
     spacing: float
@@ -58,5 +397,6 @@ def get_kpoint_grid_from_spacing(crystal_structure, spacing):
     k-point grid as a 3 x 1 list of integers.
 
     """
-    rcell = 2 * np.pi * (np.linalg.inv(crystal_structure.cell).T)
-    return list(map(int, np.ceil(np.linalg.norm(rcell, axis=1) / spacing)))
+    cell = np.array(crystal_structure.cell, dtype=float)
+    key = _KpointGridKey(cell, float(spacing))
+    return list(_get_cached_kpoint_grid(key))
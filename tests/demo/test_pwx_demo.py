@@ -7,6 +7,8 @@ from dftinputgen.utils import read_crystal_structure
 from dftinputgen.demo.pwx import _get_default_parser
 from dftinputgen.demo.pwx import build_pwx_parser
 from dftinputgen.demo.pwx import run_demo
+from dftinputgen.qe.pwx import PwxInputGeneratorError
+from dftinputgen.qe.settings.calculation_presets import get_qe_presets
 
 
 files_dir = os.path.join(os.path.dirname(__file__), "files")
@@ -41,6 +43,13 @@ def test_get_parser_default_args():
     assert args.custom_settings_file is None
     assert args.custom_settings_dict == {}
     assert not args.specify_potentials
+    assert args.crystal_structures is None
+    assert args.index == ":"
+    assert args.jobs == 1
+    assert args.stats is None
+    assert not args.strict
+    assert args.archive is None
+    assert not args.auto_cutoffs
 
 
 def test_get_parser_input_args(capsys):
@@ -53,6 +62,15 @@ def test_get_parser_input_args(capsys):
     stderr = capsys.readouterr().err
     assert "invalid choice" in stderr
 
+    # site-specific presets
+    presets = get_qe_presets()
+    presets.register("scf-site", {"ecutwfc": 50})
+    try:
+        args = parser.parse_args(["-i", feo_file, "-pre", "scf-site"])
+        assert args.calculation_presets == "scf-site"
+    finally:
+        presets.unregister("scf-site")
+
     # all ok
     args = parser.parse_args(
         [
@@ -104,3 +122,181 @@ def test_run_demo():
     with open(feo_scf_ref_in, "r") as fr:
         reference = fr.read().rstrip("\n")
     assert test == reference
+
+    # supercell of the input crystal structure
+    run_demo(args + ["--supercell", "2", "1", "1"])
+    with open(filename, "r") as fr:
+        assert "nat = 4" in fr.read()
+
+    # unknown settings: error in strict mode
+    args[args.index("-dict") + 1] = '{"ecutwcf": 45}'
+    run_demo(args)
+    with pytest.raises(PwxInputGeneratorError, match="ecutwcf"):
+        run_demo(args + ["--strict"])
+
+
+def test_run_demo_many(tmpdir, capsys):
+    from ase import io as ase_io
+
+    structures_dir = tmpdir.mkdir("structures")
+    xyz_file = str(structures_dir.join("feo_frames.xyz"))
+    ase_io.write(xyz_file, [feo_struct, feo_struct], format="extxyz")
+    write_location = str(tmpdir.join("inputs"))
+    args = [
+        "-I",
+        str(structures_dir.join("*.xyz")),
+        feo_file,
+        "-pre",
+        "scf",
+        "-t",
+        "{stem}_{frame}_{preset}.in",
+        "-file",
+        sett_file,
+        "-dict",
+        '{"ecutwfc": 45}',
+        "-loc",
+        write_location,
+        "-j",
+        "2",
+    ]
+    run_demo(args)
+    assert "Wrote 3 pw.x input file(s)" in capsys.readouterr().out
+    with open(feo_scf_ref_in, "r") as fr:
+        reference = fr.read().rstrip("\n")
+    for name in [
+        "feo_frames_0_scf.in",
+        "feo_frames_1_scf.in",
+        "feo_poscar_0_scf.in",
+    ]:
+        with open(os.path.join(write_location, name), "r") as fr:
+            assert fr.read() == reference
+
+    # incremental: up-to-date files are skipped
+    run_demo(args + ["--incremental"])
+    assert "Wrote 3 pw.x input file(s)" in capsys.readouterr().out
+    run_demo(args + ["--incremental"])
+    msg = "Wrote 0 pw.x input file(s) in {} (3 up to date)"
+    assert msg.format(write_location) in capsys.readouterr().out
+
+    # timing stats
+    stats_file = str(tmpdir.join("stats.json"))
+    run_demo(args + ["--stats", stats_file])
+    with open(stats_file, "r") as fr:
+        stats = json.load(fr)
+    assert stats["counters"]["files_written"] == 3
+    assert stats["phases"]["write"]["calls"] == 3
+
+    # all input files in one archive
+    archive = str(tmpdir.join("inputs.tar"))
+    run_demo(args + ["--archive", archive])
+    out = capsys.readouterr().out
+    assert "Wrote 3 pw.x input file(s) in {}".format(archive) in out
+    import tarfile
+
+    with tarfile.open(archive, "r") as tar:
+        assert sorted(tar.getnames()) == [
+            "feo_frames_0_scf.in",
+            "feo_frames_1_scf.in",
+            "feo_poscar_0_scf.in",
+        ]
+        member = tar.extractfile("feo_poscar_0_scf.in")
+        assert member.read().decode() == reference
+
+    # sharded layout, with keys from a template
+    sharded_location = str(tmpdir.join("sharded"))
+    sharded_args = args[:-4] + ["-loc", sharded_location]
+    run_demo(
+        sharded_args + ["--layout", "sharded", "--key-template", "{stem}"]
+    )
+    assert "Wrote 3 pw.x input file(s)" in capsys.readouterr().out
+    from dftinputgen.layouts import ShardedLayout
+
+    path = ShardedLayout().lookup(
+        sharded_location, "feo_frames", "feo_frames_1_scf.in"
+    )
+    with open(path, "r") as fr:
+        assert fr.read() == reference
+
+    # duplicate structures (all three are the same) are skipped
+    dedup_location = str(tmpdir.join("dedup"))
+    dedup_file = str(tmpdir.join("dedup.json"))
+    dedup_args = args[:-4] + ["-loc", dedup_location]
+    run_demo(dedup_args + ["--dedup", dedup_file])
+    out = capsys.readouterr().out
+    assert "Wrote 1 pw.x input file(s)" in out
+    assert "(2 duplicate(s) skipped)" in out
+    assert os.listdir(dedup_location) == ["feo_frames_0_scf.in"]
+    with open(dedup_file, "r") as fr:
+        assert json.load(fr) == {
+            "unique": ["feo_frames_0_scf.in"],
+            "duplicates": {
+                "feo_frames_1_scf.in": "feo_frames_0_scf.in",
+                "feo_poscar_0_scf.in": "feo_frames_0_scf.in",
+            },
+        }
+
+    # failures are reported, with a non-zero exit status
+    bad_file = str(structures_dir.join("bad.xyz"))
+    with open(bad_file, "w") as fw:
+        fw.write("not a structure")
+    args = [
+        "-I",
+        str(structures_dir),
+        "-pre",
+        "scf",
+        "-dict",
+        '{"pseudo_dir": "wrong_dir"}',
+        "-pot",
+        "True",
+        "-loc",
+        write_location,
+        "-t",
+        "{index}.in",
+    ]
+    with pytest.raises(SystemExit):
+        run_demo(args)
+    captured = capsys.readouterr()
+    assert "Wrote 0 pw.x input file(s)" in captured.out
+    assert "bad.xyz" in captured.err
+    assert 'Failed to generate "0.in"' in captured.err
+
+
+def test_run_demo_many_default_names(tmpdir, monkeypatch, capsys):
+    from ase import io as ase_io
+
+    # same file names in different directories: no files overwritten
+    monkeypatch.chdir(str(tmpdir))
+    for dirname in ["a", "b"]:
+        tmpdir.mkdir(dirname)
+        ase_io.write(os.path.join(dirname, "feo.vasp"), feo_struct)
+    args = ["-I", "a", "b", "-loc", "inputs", "-pre", "scf"]
+    run_demo(args)
+    assert "Wrote 2 pw.x input file(s)" in capsys.readouterr().out
+    assert sorted(os.listdir("inputs")) == ["a_feo_0_scf.in", "b_feo_0_scf.in"]
+    # outside of the current directory: absolute paths
+    monkeypatch.chdir("a")
+    run_demo(args[3:] + ["-I", os.path.join(os.pardir, "b")])
+    name = "_".join(str(tmpdir.join("b", "feo")).split(os.sep)).lstrip("_")
+    assert os.listdir("inputs") == ["{}_0_scf.in".format(name)]
+
+
+@pytest.mark.parametrize(
+    "option",
+    [
+        ["-j", "2"],
+        ["--index", "-1"],
+        ["-t", "{index}.in"],
+        ["--key-template", "{stem}"],
+        ["--dedup", "dedup.json"],
+    ],
+)
+def test_get_parser_many_structures_options(option, capsys):
+    parser = _get_default_parser()
+    build_pwx_parser(parser)
+    # options for multiple crystal structures only: error with -i
+    for args in [["-i", feo_file] + option, option + ["-i", feo_file]]:
+        with pytest.raises(SystemExit):
+            parser.parse_args(args)
+        assert "not allowed with argument" in capsys.readouterr().err
+    args = parser.parse_args(["-I", feo_file] + option)
+    assert args.crystal_structures == [feo_file]
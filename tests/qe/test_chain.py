@@ -0,0 +1,162 @@
+"""Unit tests for chained pw.x calculations in :mod:`dftinputgen.qe.chain`."""
+
+import os
+import json
+import tarfile
+import pytest
+
+from ase import io as ase_io
+
+from dftinputgen.targets import ArchiveTarget
+from dftinputgen.qe.chain import PwxChain
+from dftinputgen.qe.chain import PwxChainError
+
+
+test_data_dir = os.path.join(os.path.dirname(__file__), "files")
+feo_struct = ase_io.read(os.path.join(test_data_dir, "feo_conv.vasp"))
+
+
+def test_chain_steps():
+    chain = PwxChain(
+        feo_struct,
+        custom_sett_dict={"pseudo_dir": test_data_dir},
+        step_settings={"scf": {"kpoints": {"scheme": "gamma"}}},
+    )
+    assert chain.step_names == ("relax", "vc-relax", "scf")
+    assert chain.prefix.startswith("Fe2O2_")
+    assert chain.outdir == "./out"
+    relax, vc_relax, scf = chain.steps
+    assert relax.depends_on is None
+    assert relax.restart == {}
+    assert relax.structure_from is None
+    assert vc_relax.depends_on == "relax"
+    # structure changed by the previous step: wavefunctions are not reused
+    assert vc_relax.restart == {"startingpot": "file"}
+    assert vc_relax.structure_from == "relax"
+    # different k-points: only the charge density is reused
+    assert scf.restart == {"startingpot": "file"}
+    assert scf.structure_from == "vc-relax"
+    for step in chain.steps:
+        calc_sett = step.generator.calculation_settings
+        assert calc_sett["calculation"] == step.name
+        assert calc_sett["prefix"] == chain.prefix
+        assert calc_sett["outdir"] == "./out"
+    text = vc_relax.generator.pwx_input_as_str
+    assert 'startingpot = "file"' in text
+    assert "startingwfc" not in text
+    assert 'prefix = "{}"'.format(chain.prefix) in text
+    assert chain.prefix == "Fe2O2_{}".format(relax.generator.structure_hash[:8])
+    # same structure: wavefunctions are reused as well
+    chain = PwxChain(feo_struct, steps=["scf", "relax"])
+    assert chain.steps[1].restart == {
+        "startingpot": "file",
+        "startingwfc": "file",
+    }
+    assert chain.steps[1].structure_from is None
+
+
+def test_chain_restart_settings():
+    # different density cutoffs: nothing to restart from
+    chain = PwxChain(
+        feo_struct,
+        steps=["relax", "scf"],
+        prefix="feo",
+        custom_sett_dict={"outdir": "/scratch/feo"},
+        step_settings={"scf": {"ecutrho": 400}},
+    )
+    assert chain.outdir == "/scratch/feo"
+    assert chain.steps[1].restart == {}
+    assert chain.steps[1].generator.calculation_settings["prefix"] == "feo"
+    # restart settings specified by the user take precedence
+    chain = PwxChain(
+        feo_struct,
+        steps=["relax", "scf"],
+        step_settings={"scf": {"startingwfc": "atomic+random"}},
+    )
+    assert chain.steps[1].restart == {"startingpot": "file"}
+    calc_sett = chain.steps[1].generator.calculation_settings
+    assert calc_sett["startingwfc"] == "atomic+random"
+
+
+def test_chain_shared_settings_from_file(tmpdir):
+    sett_file = tmpdir.join("custom.json")
+    sett_file.write(json.dumps({"prefix": "feo", "outdir": "/scratch/feo"}))
+    chain = PwxChain(
+        feo_struct, steps=["relax", "scf"], custom_sett_file=str(sett_file)
+    )
+    assert chain.prefix == "feo"
+    assert chain.outdir == "/scratch/feo"
+    for step in chain.steps:
+        calc_sett = step.generator.calculation_settings
+        assert calc_sett["prefix"] == "feo"
+        assert calc_sett["outdir"] == "/scratch/feo"
+    # arguments take precedence over the custom settings
+    chain = PwxChain(
+        feo_struct,
+        steps=["relax", "scf"],
+        custom_sett_file=str(sett_file),
+        prefix="fe2o2",
+    )
+    assert chain.prefix == "fe2o2"
+    assert chain.outdir == "/scratch/feo"
+
+
+def test_chain_errors():
+    with pytest.raises(PwxChainError, match="Unknown"):
+        PwxChain(feo_struct, steps=["relax", "bands"])
+    with pytest.raises(PwxChainError, match="unique"):
+        PwxChain(feo_struct, steps=["scf", "scf"])
+    with pytest.raises(PwxChainError, match="No steps"):
+        PwxChain(feo_struct, steps=[])
+    with pytest.raises(PwxChainError, match="unknown step"):
+        PwxChain(feo_struct, step_settings={"nscf": {}})
+    with pytest.raises(PwxChainError, match="prefix"):
+        PwxChain(feo_struct, step_settings={"scf": {"prefix": "x"}})
+
+
+def test_write_inputs(tmpdir):
+    chain = PwxChain(feo_struct, prefix="feo")
+    written = chain.write_inputs(write_location=str(tmpdir))
+    assert list(written) == ["relax", "vc-relax", "scf"]
+    for name, path in written.items():
+        assert path == str(tmpdir.join("{}.in".format(name)))
+        assert os.path.isfile(path)
+    with open(str(tmpdir.join("chain.json")), "r") as fr:
+        manifest = json.load(fr)
+    assert manifest["prefix"] == "feo"
+    assert [s["input"] for s in manifest["steps"]] == [
+        "relax.in",
+        "vc-relax.in",
+        "scf.in",
+    ]
+    assert [s["depends_on"] for s in manifest["steps"]] == [
+        [],
+        ["relax"],
+        ["vc-relax"],
+    ]
+
+    # keyed layouts: all steps (and the manifest) in the same directory
+    chain = PwxChain(feo_struct, prefix="feo", layout="sharded")
+    written = chain.write_inputs(write_location=str(tmpdir.join("sharded")))
+    dirnames = set(os.path.dirname(path) for path in written.values())
+    assert len(dirnames) == 1
+    (dirname,) = dirnames
+    assert dirname.endswith(chain.manifest_dir)
+    assert os.path.basename(dirname) == "feo"
+    assert os.path.isfile(os.path.join(dirname, "chain.json"))
+
+    # other output targets, e.g. archives
+    archive = str(tmpdir.join("chain.tar"))
+    with ArchiveTarget(archive) as target:
+        chain = PwxChain(feo_struct, prefix="feo", output_target=target)
+        written = chain.write_inputs()
+    assert list(written.values()) == ["relax.in", "vc-relax.in", "scf.in"]
+    with tarfile.open(archive) as tar:
+        assert tar.getnames() == [
+            "relax.in",
+            "vc-relax.in",
+            "scf.in",
+            "chain.json",
+        ]
+        manifest = json.load(tar.extractfile("chain.json"))
+    assert manifest["prefix"] == "feo"
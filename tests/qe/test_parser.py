@@ -0,0 +1,150 @@
+"""Unit tests for reading pw.x input files in :mod:`dftinputgen.qe.parser`."""
+
+import os
+import pytest
+import numpy as np
+
+from ase import io as ase_io
+
+from dftinputgen.qe.pwx import PwxInputGenerator
+from dftinputgen.qe.parser import PwxInputParserError
+from dftinputgen.qe.parser import parse_pwx_input
+from dftinputgen.qe.parser import read_pwx_input
+from dftinputgen.qe.parser import read_many_pwx_inputs
+
+
+test_data_dir = os.path.join(os.path.dirname(__file__), "files")
+feo_struct = ase_io.read(os.path.join(test_data_dir, "feo_conv.vasp"))
+with open(os.path.join(test_data_dir, "TEST_feo_conv_scf.in"), "r") as fr:
+    feo_scf_in = fr.read().format(pseudo_dir=test_data_dir).rstrip("\n")
+
+custom_in = """
+ &control
+    calculation='relax', ! comment, with a comma
+    pseudo_dir = './pseudos!/'
+    tprnfor=.t.
+ /
+ &SYSTEM
+    ibrav=0, celldm(1)=10.0d0, nat=2, ntyp=1
+    ecutwfc=3.0D1, starting_magnetization(1) = 0.5 /
+ATOMIC_SPECIES
+  Fe  55.845  Fe.pbe-spn-rrkjus.UPF
+CELL_PARAMETERS alat
+  1.0 0.0 0.0
+  0.0 1.0 0.0
+  0.0 0.0 1.0
+ATOMIC_POSITIONS (bohr)
+  Fe 0.0 0.0 0.0
+  Fe 5.0 5.0 5.0  0 0 1
+K_POINTS gamma
+"""
+
+# (the last row of ATOMIC_POSITIONS missing)
+feo_truncated_in = "\n".join(
+    line for line in feo_scf_in.splitlines() if "0.75" not in line
+)
+
+
+def test_round_trip(tmpdir):
+    path = os.path.join(str(tmpdir), "scf.in")
+    with open(path, "w") as fw:
+        fw.write(feo_scf_in)
+    pwx_input = read_pwx_input(path)
+    settings = pwx_input.settings
+    assert settings["namelists"] == ["control", "system", "electrons"]
+    assert settings["cards"] == [
+        "atomic_species",
+        "atomic_positions",
+        "kpoints",
+        "cell_parameters",
+    ]
+    assert settings["tstress"] is True
+    assert settings["ecutwfc"] == 40
+    assert settings["degauss"] == 0.02
+    assert settings["kpoints"] == {
+        "scheme": "automatic",
+        "grid": [9, 9, 9],
+        "shift": [0, 0, 0],
+    }
+    assert settings["pseudo_names"]["Fe"] == "fe_pbe_v1.5.uspp.F.UPF"
+    structure = pwx_input.structure
+    assert structure.species == ("Fe", "O")
+    assert structure.species_indices.tolist() == [0, 0, 1, 1]
+    assert np.allclose(structure.cell, feo_struct.cell)
+    # regenerated input is identical
+    pwig = PwxInputGenerator(
+        crystal_structure=structure.to_atoms(),
+        custom_sett_dict=settings,
+        specify_potentials=True,
+    )
+    assert pwig.pwx_input_as_str == feo_scf_in
+
+
+def test_parse_pwx_input():
+    pwx_input = parse_pwx_input(custom_in.splitlines())
+    settings = pwx_input.settings
+    assert settings["calculation"] == "relax"
+    assert settings["pseudo_dir"] == "./pseudos!/"
+    assert settings["tprnfor"] is True
+    assert settings["celldm(1)"] == 10.0
+    assert settings["ecutwfc"] == 30.0
+    assert settings["starting_magnetization(1)"] == 0.5
+    assert settings["nat"] == 2
+    assert settings["kpoints"] == {"scheme": "gamma"}
+    # tags are spelled as in the tag tables
+    text = custom_in.replace("celldm(1)=10.0d0", "a=5.0")
+    assert parse_pwx_input(text.splitlines()).settings["A"] == 5.0
+    structure = pwx_input.structure
+    alat = 10.0 * 0.52917721067
+    assert np.allclose(structure.cell, np.eye(3) * alat)
+    assert np.allclose(
+        structure.scaled_positions[1], [5.0 * 0.52917721067 / alat] * 3
+    )
+
+
+@pytest.mark.parametrize(
+    "text, match",
+    [
+        ("&INPUTPP\n/\n", "Unknown namelist"),
+        ("&SYSTEM\n  ibrav=2\n/\n", "CELL_PARAMETERS"),
+        ("&SYSTEM\n  ibrav\n/\n", "Cannot parse"),
+        ("&SYSTEM\n  ecutwcf=30\n/\n", 'Unknown tag "ecutwcf"'),
+        ("&SYSTEM\n  conv_thr=1e-6\n/\n", "belongs to &ELECTRONS"),
+        ("&CONTROL\n  ecutwfc=30\n/\n", '"ecutwfc" in &CONTROL'),
+        ("&SYSTEM\n  nat=2, ecutwfc=30\n  nat=3\n/\n", "more than once"),
+        (feo_truncated_in, "nat = 4, but 3 row"),
+        (
+            custom_in.replace("ntyp=1", "ntyp=2"),
+            "ntyp = 2, but 1 row",
+        ),
+        ("ecutwfc = 30\n", "outside of a namelist"),
+        ("CONSTRAINTS\n1\n", "CONSTRAINTS card"),
+        (feo_scf_in.replace("{angstrom}", "{alat}"), "Lattice parameter"),
+    ],
+)
+def test_parse_pwx_input_error(text, match):
+    with pytest.raises(PwxInputParserError, match=match):
+        parse_pwx_input(text.splitlines())
+
+
+def test_read_many_pwx_inputs(tmpdir):
+    dirname = tmpdir.mkdir("campaign")
+    for i in range(3):
+        subdir = dirname.mkdir("{:02d}".format(i))
+        subdir.join("scf.in").write(feo_scf_in)
+        subdir.join("notes.txt").write("not an input")
+    dirname.join("bad.in").write("&INPUTPP\n/\n")
+    for max_workers in [1, 2]:
+        results = read_many_pwx_inputs(
+            str(dirname), max_workers=max_workers, chunksize=2
+        )
+        assert [os.path.relpath(r.path, str(dirname)) for r in results] == [
+            "bad.in",
+            os.path.join("00", "scf.in"),
+            os.path.join("01", "scf.in"),
+            os.path.join("02", "scf.in"),
+        ]
+        assert isinstance(results[0].error, PwxInputParserError)
+        assert results[0].pwx_input is None
+        assert all(r.error is None for r in results[1:])
+        assert results[3].pwx_input.settings["ecutwfc"] == 40
@@ -0,0 +1,68 @@
+"""Unit tests for pseudopotential matching in :mod:`dftinputgen.qe.pseudos`."""
+
+import os
+import pytest
+
+from dftinputgen.qe.pseudos import PseudoResolver
+from dftinputgen.qe.pseudos import PseudoResolverError
+from dftinputgen.qe.pseudos import PSEUDO_RESOLVER
+
+
+pseudo_dir = os.path.join(os.path.dirname(__file__), "files")
+
+
+def _touch(dirname, filename):
+    with open(os.path.join(dirname, filename), "w") as fw:
+        fw.write("")
+
+
+def test_index():
+    resolver = PseudoResolver()
+    index = resolver.index(pseudo_dir)
+    assert index == {
+        "al": "al_pbe_v1.uspp.F.UPF",
+        "fe": "fe_pbe_v1.5.uspp.F.UPF",
+        "o": "o_pbe_v1.2.uspp.F.UPF",
+    }
+    # cached index is reused
+    assert resolver.index(pseudo_dir) is index
+    resolver.clear()
+    assert resolver.index(pseudo_dir) is not index
+    # missing directory: error
+    with pytest.raises(PseudoResolverError, match="list contents"):
+        resolver.index(os.path.join(pseudo_dir, "missing_dir"))
+
+
+def test_index_directory_changed(tmpdir):
+    resolver = PseudoResolver()
+    dirname = str(tmpdir)
+    _touch(dirname, "Fe.pbe-spn-rrkjus.UPF")
+    _touch(dirname, "fe.notes.txt")
+    assert resolver.index(dirname) == {"fe": "Fe.pbe-spn-rrkjus.UPF"}
+    # files added to the directory are picked up
+    _touch(dirname, "O.pbe-n-kjpaw.upf")
+    os.utime(dirname, ns=(0, 0))
+    assert resolver.resolve("O", dirname) == "O.pbe-n-kjpaw.upf"
+
+
+def test_resolve(tmpdir):
+    resolver = PseudoResolver()
+    assert resolver.resolve("Fe-34", pseudo_dir) == "fe_pbe_v1.5.uspp.F.UPF"
+    assert resolver.resolve("Cu", pseudo_dir) is None
+    # multiple directories, in decreasing order of priority
+    dirname = str(tmpdir)
+    _touch(dirname, "Fe.pbe-spn-rrkjus.UPF")
+    _touch(dirname, "Cu.pbe-dn-rrkjus.UPF")
+    assert resolver.resolve("Fe", [dirname, pseudo_dir]) == (
+        "Fe.pbe-spn-rrkjus.UPF"
+    )
+    assert resolver.resolve("Fe", [pseudo_dir, dirname]) == (
+        "fe_pbe_v1.5.uspp.F.UPF"
+    )
+    assert resolver.resolve("Cu", [pseudo_dir, dirname]) == (
+        "Cu.pbe-dn-rrkjus.UPF"
+    )
+
+
+def test_shared_resolver():
+    assert isinstance(PSEUDO_RESOLVER, PseudoResolver)
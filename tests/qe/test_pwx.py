@@ -1,13 +1,19 @@
 """Unit tests for the `PwxInputGenerator` class."""
 
 import os
+import copy
+import pickle
 import pytest
+import numpy as np
 
 from ase import io as ase_io
 
+from dftinputgen.base import freeze
+from dftinputgen.qe.pwx import PwxRenderPlan
 from dftinputgen.qe.pwx import PwxInputGenerator
 from dftinputgen.qe.pwx import PwxInputGeneratorError
 from dftinputgen.qe.pwx import _qe_val_formatter
+from dftinputgen.qe.pwx import _qe_block_formatter
 
 
 # define module-level variables used for testing
@@ -32,6 +38,25 @@ def test_qe_val_formatter():
     assert _qe_val_formatter(1e-10) == "1e-10"
 
 
+def test_qe_block_formatter():
+    rng = np.random.RandomState(42)
+    values = np.vstack(
+        [rng.uniform(-1e3, 1e3, size=(50, 3)), [[-0.0, 1e-9, 5e-9]]]
+    )
+    labels = ["Fe", "O", "Si", "Ge", "Sb"] * 10 + ["H"]
+    row_fmt = "{:4s}  {:12.8f}  {:12.8f}  {:12.8f}"
+    reference = "\n".join(
+        [row_fmt.format(s, *v) for s, v in zip(labels, values)]
+    )
+    block = _qe_block_formatter(
+        "%-4s  %12.8f  %12.8f  %12.8f", values, labels=labels
+    )
+    assert block == reference
+    # no labels
+    reference = "\n".join(["{:12.8f}  {:12.8f}".format(*v[:2]) for v in values])
+    assert _qe_block_formatter("%12.8f  %12.8f", values[:, :2]) == reference
+
+
 def test_no_crystal_structure_input_error():
     with pytest.raises(TypeError):
         PwxInputGenerator()
@@ -42,6 +67,14 @@ def test_parameters_from_structure():
     assert pwig.parameters_from_structure == {"nat": 4, "ntyp": 2}
 
 
+def test_structure_view():
+    pwig = PwxInputGenerator(crystal_structure=feo_struct)
+    assert pwig.structure_view.species == ("Fe", "O")
+    pwig.crystal_structure = al_fcc_struct
+    assert pwig.structure_view.species == ("Al",)
+    assert pwig.parameters_from_structure == {"nat": 4, "ntyp": 1}
+
+
 def test_specify_potentials_attribute():
     # default specify_potentials = False
     pwig = PwxInputGenerator(crystal_structure=feo_struct)
@@ -145,6 +178,92 @@ def test_relax_base_calculation_settings():
     assert cs["namelists"] == ["control", "system", "electrons", "ions"]
 
 
+def test_calculation_settings_cache():
+    pwig = PwxInputGenerator(crystal_structure=al_fcc_struct)
+    assert pwig.calculation_settings_version == 0
+    # settings are built once, and cached on subsequent accesses
+    cs = pwig.calculation_settings
+    assert pwig.calculation_settings is cs
+    assert pwig.calculation_settings_version == 1
+    # any change to the inputs triggers a rebuild on next access
+    pwig.calculation_presets = "scf"
+    assert pwig.calculation_settings["calculation"] == "scf"
+    assert pwig.calculation_settings_version == 2
+    pwig.custom_sett_dict = {"ecutwfc": 50}
+    assert pwig.calculation_settings["ecutwfc"] == 50
+    assert pwig.calculation_settings_version == 3
+    pwig.custom_sett_dict["ecutwfc"] = 60
+    assert pwig.calculation_settings["ecutwfc"] == 60
+    pwig.custom_sett_dict.update({"ecutrho": 480})
+    assert pwig.calculation_settings["ecutrho"] == 480
+    pwig.custom_sett_dict.pop("ecutrho")
+    assert pwig.calculation_settings["ecutrho"] == 240
+    pwig.custom_sett_dict.setdefault("ecutrho", 360)
+    del pwig.custom_sett_dict["ecutwfc"]
+    assert pwig.calculation_settings["ecutrho"] == 360
+    assert pwig.calculation_settings["ecutwfc"] == 40
+    pwig.custom_sett_dict.popitem()
+    pwig.custom_sett_dict.clear()
+    assert pwig.calculation_settings["ecutrho"] == 240
+    assert pwig.calculation_settings_version == 8
+    pwig.crystal_structure = feo_struct
+    assert pwig.calculation_settings["ntyp"] == 2
+    assert pwig.calculation_settings_version == 9
+
+
+def test_calculation_settings_cache_nested():
+    kpoints = {"scheme": "automatic", "spacing": 0.3}
+    custom_sett = {"kpoints": kpoints}
+    pwig = PwxInputGenerator(
+        crystal_structure=al_fcc_struct,
+        calculation_presets="scf",
+        custom_sett_dict=custom_sett,
+    )
+    assert pwig.calculation_settings["kpoints"]["spacing"] == 0.3
+    # changes to nested dictionaries in place are tracked
+    pwig.custom_sett_dict["kpoints"]["spacing"] = 0.2
+    assert pwig.calculation_settings["kpoints"]["spacing"] == 0.2
+    pwig.custom_sett_dict["kpoints"].update({"shift": [1, 1, 1]})
+    assert pwig.calculation_settings["kpoints"]["shift"] == [1, 1, 1]
+    pwig.custom_sett_dict["smearing"] = {}
+    pwig.custom_sett_dict["smearing"]["degauss"] = 0.01
+    assert pwig.calculation_settings["smearing"] == {"degauss": 0.01}
+    # the dictionary set is copied: later changes to it have no effect
+    kpoints["spacing"] = 0.5
+    custom_sett["ecutwfc"] = 80
+    assert pwig.calculation_settings["kpoints"]["spacing"] == 0.2
+    assert "ecutwfc" not in pwig.custom_sett_dict
+    # copies are plain dictionaries
+    for other in [
+        copy.deepcopy(pwig.custom_sett_dict),
+        pickle.loads(pickle.dumps(pwig.custom_sett_dict)),
+    ]:
+        assert type(other) is dict
+        assert type(other["kpoints"]) is dict
+        assert other == pwig.custom_sett_dict
+
+
+def test_calculation_settings_frozen_shared():
+    frozen = freeze({"ecutwfc": 50, "kpoints": {"spacing": 0.3}})
+    pwig = PwxInputGenerator(
+        crystal_structure=al_fcc_struct,
+        calculation_presets="scf",
+        custom_sett_dict=frozen,
+    )
+    # frozen settings are shared as is, without copies
+    assert pwig._custom_sett_dict is frozen
+    assert pwig.calculation_settings["ecutwfc"] == 50
+    assert pwig.calculation_settings["kpoints"]["spacing"] == 0.3
+    assert pwig._custom_sett_dict is frozen
+    # changes go to a copy, and leave the frozen settings as is
+    pwig.custom_sett_dict["kpoints"]["spacing"] = 0.2
+    pwig.custom_sett_dict["ecutwfc"] = 60
+    assert pwig.calculation_settings["ecutwfc"] == 60
+    assert pwig.calculation_settings["kpoints"]["spacing"] == 0.2
+    assert frozen["ecutwfc"] == 50
+    assert frozen["kpoints"]["spacing"] == 0.3
+
+
 def test_control_namelist_to_str():
     # control namelist without pseudo, settings: error
     pwig = PwxInputGenerator(crystal_structure=feo_struct)
@@ -192,6 +311,91 @@ def test_all_namelists_as_str():
     assert pwig.all_namelists_as_str == namelists
 
 
+def test_indexed_tags():
+    # indexed forms of tags are written at the position of the tag, in the
+    # order of their indices
+    pwig = PwxInputGenerator(
+        crystal_structure=feo_struct,
+        calculation_presets="scf",
+        custom_sett_dict={
+            "nspin": 2,
+            "starting_magnetization(2)": 0.0,
+            "starting_magnetization(1)": 0.5,
+            "Hubbard_U(10)": 1.0,
+            "Hubbard_U(2)": 4.0,
+        },
+    )
+    pwig.validate_calculation_settings()
+    system = pwig._namelist_to_str("system").splitlines()
+    assert system[4:6] == [
+        "    starting_magnetization(1) = 0.5",
+        "    starting_magnetization(2) = 0.0",
+    ]
+    assert system[-4:] == [
+        "    nspin = 2",
+        "    Hubbard_U(2) = 4.0",
+        "    Hubbard_U(10) = 1.0",
+        "/",
+    ]
+    # (the same with a render plan)
+    assert "\n".join(system) in pwig.all_namelists_as_str
+
+
+def test_render_plan():
+    settings = {
+        "namelists": ["control", "system"],
+        "title": "{curly} braces",
+        "nat": 1,
+        "ecutwfc": 40,
+    }
+    plan = PwxRenderPlan(settings)
+    assert not plan.specify_potentials
+    namelists = plan.namelists_as_str({"nat": 4, "ntyp": 2})
+    assert namelists == "\n".join(
+        [
+            "&CONTROL",
+            '    title = "{curly} braces"',
+            "/",
+            "&SYSTEM",
+            "    nat = 4",
+            "    ntyp = 2",
+            "    ecutwfc = 40",
+            "/",
+        ]
+    )
+    # pseudo_dir is required to specify potentials
+    with pytest.raises(PwxInputGeneratorError, match="not specified"):
+        PwxRenderPlan(settings, specify_potentials=True)
+
+
+def test_render_plan_generator():
+    pwig = PwxInputGenerator(
+        crystal_structure=al_fcc_struct,
+        calculation_presets="scf",
+        custom_sett_dict={"pseudo_dir": pseudo_dir},
+    )
+    plan = pwig.render_plan
+    assert pwig.render_plan is plan
+    # plan is reused across crystal structures
+    pwig.crystal_structure = feo_struct
+    assert pwig.render_plan is plan
+    assert pwig.all_namelists_as_str == "\n".join(
+        feo_scf_in.splitlines()[:20]
+    )
+    # ...but recompiled if settings change
+    pwig.custom_sett_dict["ecutwfc"] = 60
+    assert pwig.render_plan is not plan
+    assert "ecutwfc = 60" in pwig.all_namelists_as_str
+    plan = pwig.render_plan
+    pwig.specify_potentials = True
+    assert pwig.render_plan is not plan
+    # share a plan with another generator
+    other = PwxInputGenerator(crystal_structure=al_fcc_struct)
+    other.render_plan = plan
+    assert other.render_plan is plan
+    assert "ecutwfc = 60" in other.all_namelists_as_str
+
+
 def test_get_atomic_species_card():
     # specify_potentials = False, no pseudo_dir: no error
     pwig = PwxInputGenerator(crystal_structure=feo_struct)
@@ -291,6 +495,27 @@ def test_pwx_input_as_str():
     assert pwig.pwx_input_as_str == feo_scf_in.rstrip("\n")
 
 
+def test_iter_pwx_input_chunks(monkeypatch):
+    import dftinputgen.qe.pwx
+
+    monkeypatch.setattr(dftinputgen.qe.pwx, "_ATOMS_PER_CHUNK", 3)
+    pwig = PwxInputGenerator(
+        crystal_structure=feo_struct,
+        calculation_presets="scf",
+        custom_sett_dict={"pseudo_dir": pseudo_dir},
+        specify_potentials=True,
+    )
+    chunks = list(pwig.iter_pwx_input_chunks())
+    assert "".join(chunks) == feo_scf_in.rstrip("\n")
+    # atomic positions are streamed in chunks of 3 atoms
+    positions = "\n".join(feo_scf_in.splitlines()[24:27])
+    assert positions in chunks
+    # only cards: no namelists
+    pwig.custom_sett_dict["namelists"] = []
+    chunks = list(pwig.iter_pwx_input_chunks())
+    assert "".join(chunks) == "\n" + pwig.all_cards_as_str
+
+
 def test_write_pwx_input():
     # no input settings: error
     pwig = PwxInputGenerator(crystal_structure=feo_struct)
@@ -317,6 +542,19 @@ def test_write_pwx_input():
         assert fr.read() == feo_scf_in.rstrip("\n")
 
 
+def test_write_pwx_input_error(tmpdir):
+    # errors while rendering: no (partially written) file left behind
+    pwig = PwxInputGenerator(
+        crystal_structure=feo_struct,
+        calculation_presets="scf",
+        custom_sett_dict={"pseudo_dir": "wrong_dir"},
+        specify_potentials=True,
+    )
+    with pytest.raises(PwxInputGeneratorError, match="list contents"):
+        pwig.write_pwx_input(write_location=str(tmpdir), filename="scf.in")
+    assert tmpdir.listdir() == []
+
+
 def test_write_input_files():
     import tempfile
 
@@ -332,3 +570,223 @@ def test_write_input_files():
     pwig.write_input_files()
     with open(filename, "r") as fr:
         assert fr.read() == feo_scf_in.rstrip("\n")
+
+
+def test_write_pwx_input_incremental(tmpdir):
+    from dftinputgen.manifest import Manifest
+
+    write_location = str(tmpdir)
+    path = os.path.join(write_location, "scf.in")
+    pwig = PwxInputGenerator(
+        crystal_structure=feo_struct,
+        calculation_presets="scf",
+        custom_sett_dict={"pseudo_dir": pseudo_dir},
+        specify_potentials=True,
+        write_location=write_location,
+        pwx_input_file="scf.in",
+        incremental=True,
+    )
+    assert pwig.write_input_files()
+    entry = Manifest.load(write_location).get("scf.in")
+    assert entry["input_hash"] == pwig.input_hash
+    # unchanged: skipped
+    assert not pwig.write_input_files()
+    # settings changed: rewritten
+    pwig.custom_sett_dict["ecutwfc"] = 50
+    assert pwig.write_input_files()
+    with open(path, "r") as fr:
+        assert "ecutwfc = 50" in fr.read()
+    assert not pwig.write_input_files()
+    # file modified by hand: rewritten
+    with open(path, "a") as fw:
+        fw.write("\n")
+    assert pwig.write_input_files()
+    # no overwriting
+    pwig.incremental = False
+    pwig.overwrite_files = False
+    assert not pwig.write_input_files()
+    pwig.overwrite_files = True
+    assert pwig.write_input_files()
+
+
+def test_write_pwx_input_manifest_open(tmpdir, monkeypatch):
+    from dftinputgen.manifest import Manifest
+
+    write_location = str(tmpdir)
+    generators = [
+        PwxInputGenerator(
+            crystal_structure=structure,
+            calculation_presets="scf",
+            write_location=write_location,
+            pwx_input_file="{}.in".format(i),
+            incremental=True,
+        )
+        for i, structure in enumerate([feo_struct, al_fcc_struct])
+    ]
+    with Manifest.open(write_location) as manifest:
+        assert all(pwig.write_input_files() for pwig in generators)
+        assert sorted(manifest.entries) == ["0.in", "1.in"]
+        assert not os.path.exists(manifest.path)
+    assert sorted(Manifest.load(write_location).entries) == ["0.in", "1.in"]
+
+    # up-to-date files are skipped without rendering any input
+    def _fail(self):
+        raise AssertionError("input rendered")
+
+    monkeypatch.setattr(PwxInputGenerator, "iter_pwx_input_chunks", _fail)
+    with Manifest.open(write_location):
+        assert not any(pwig.write_input_files() for pwig in generators)
+
+
+def test_input_hash():
+    pwig = PwxInputGenerator(
+        crystal_structure=feo_struct, calculation_presets="scf"
+    )
+    input_hash = pwig.input_hash
+    other = PwxInputGenerator(
+        crystal_structure=feo_struct.copy(), calculation_presets="scf"
+    )
+    assert other.input_hash == input_hash
+    pwig.calculation_presets = "relax"
+    assert pwig.input_hash != input_hash
+    pwig.calculation_presets = "scf"
+    structure = feo_struct.copy()
+    structure.positions[0, 0] += 0.01
+    pwig.crystal_structure = structure
+    assert pwig.input_hash != input_hash
+
+
+def test_stats(tmpdir):
+    from dftinputgen.stats import GenerationStats
+    from dftinputgen.stats import NULL_STATS
+
+    # disabled by default
+    pwig = PwxInputGenerator(crystal_structure=feo_struct)
+    assert pwig.stats is NULL_STATS
+
+    stats = GenerationStats()
+    for _ in range(2):
+        pwig = PwxInputGenerator(
+            crystal_structure=feo_struct,
+            calculation_presets="scf",
+            custom_sett_dict={"pseudo_dir": pseudo_dir},
+            specify_potentials=True,
+            stats=stats,
+        )
+        pwig.write_pwx_input(write_location=str(tmpdir), filename="scf.in")
+    phases = stats.as_dict()["phases"]
+    for phase in [
+        "settings_merge",
+        "pseudo_resolution",
+        "kpoints_card",
+        "render_namelists",
+        "write",
+    ]:
+        assert phases[phase]["calls"] == 2
+    # one call per card, atomic positions rendered in one chunk
+    assert phases["render_cards"]["calls"] == 8
+    assert stats.as_dict()["counters"] == {"files_written": 2}
+    pwig.overwrite_files = False
+    pwig.write_pwx_input(write_location=str(tmpdir), filename="scf.in")
+    assert stats.as_dict()["counters"]["files_skipped"] == 1
+
+
+def test_validate_calculation_settings():
+    pwig = PwxInputGenerator(
+        crystal_structure=feo_struct, calculation_presets="scf"
+    )
+    pwig.validate_calculation_settings()
+    pwig.custom_sett_dict["ecutwcf"] = 30
+    pwig.custom_sett_dict["press"] = 10.0
+    with pytest.raises(PwxInputGeneratorError, match="ecutwcf.*press"):
+        pwig.validate_calculation_settings()
+    # rendering is unaffected
+    assert "ecutwcf" not in pwig.all_namelists_as_str
+    assert "press" not in pwig.all_namelists_as_str
+
+
+def test_write_input_files_archive(tmpdir):
+    import tarfile
+    from dftinputgen.targets import ArchiveTarget
+
+    path = os.path.join(str(tmpdir), "inputs.tar.gz")
+    with ArchiveTarget(path) as target:
+        pwig = PwxInputGenerator(
+            crystal_structure=feo_struct,
+            calculation_presets="scf",
+            custom_sett_dict={"pseudo_dir": pseudo_dir},
+            specify_potentials=True,
+            output_target=target,
+        )
+        assert pwig.output_target is target
+        assert pwig.write_input_files()
+        pwig.pwx_input_file = "feo.in"
+        assert pwig.write_input_files()
+    with tarfile.open(path, "r") as tar:
+        assert tar.getnames() == ["scf.in", "feo.in"]
+        content = tar.extractfile("feo.in").read().decode()
+    assert content == feo_scf_in.rstrip("\n")
+    # only the archive (and its index) is written
+    assert sorted(os.listdir(str(tmpdir))) == [
+        "inputs.tar.gz",
+        "inputs.tar.gz.index.json",
+    ]
+
+
+def test_write_input_files_sharded(tmpdir):
+    pwig = PwxInputGenerator(
+        crystal_structure=feo_struct,
+        calculation_presets="scf",
+        custom_sett_dict={"pseudo_dir": pseudo_dir},
+        specify_potentials=True,
+        write_location=str(tmpdir),
+        layout="sharded",
+    )
+    # default key: derived from the structure and settings
+    assert pwig.input_key == pwig.input_hash[:16]
+    assert pwig.input_path == pwig.layout.relpath(pwig.input_key, "scf.in")
+    assert pwig.write_input_files()
+    path = pwig.layout.lookup(str(tmpdir), pwig.input_key, "scf.in")
+    with open(path, "r") as fr:
+        assert fr.read() == feo_scf_in.rstrip("\n")
+    # user-specified key
+    pwig.input_key = "feo"
+    assert pwig.input_path.split(os.sep)[-2:] == ["feo", "scf.in"]
+    assert pwig.write_input_files()
+    assert os.path.isfile(pwig.layout.lookup(str(tmpdir), "feo", "scf.in"))
+    # flat layout: keys are not used
+    pwig.layout = "flat"
+    assert pwig.input_path == "scf.in"
+
+
+def test_supercell():
+    pwig = PwxInputGenerator(
+        crystal_structure=feo_struct,
+        calculation_presets="scf",
+        supercell=[2, 1, 3],
+    )
+    assert pwig.supercell.tolist() == [[2, 0, 0], [0, 1, 0], [0, 0, 3]]
+    assert pwig.parameters_from_structure == {"nat": 24, "ntyp": 2}
+    assert "nat = 24" in pwig.all_namelists_as_str
+    lines = pwig.atomic_positions_card.split("\n")
+    assert len(lines) == 25
+    # first tile: the input crystal structure, scaled
+    symbols = feo_struct.get_chemical_symbols()
+    for line, symbol, position in zip(
+        lines[1:], symbols, feo_struct.get_scaled_positions()
+    ):
+        values = line.split()
+        assert values[0] == symbol
+        expected = position / [2, 1, 3]
+        assert np.allclose([float(v) for v in values[1:]], expected)
+    assert pwig.crystal_structure is feo_struct
+    hash_supercell = pwig.input_hash
+    assert pwig.calculation_settings["nat"] == 24
+    pwig.supercell = None
+    assert pwig.parameters_from_structure == {"nat": 4, "ntyp": 2}
+    assert pwig.calculation_settings["nat"] == 4
+    pwig.supercell = 2
+    assert pwig.calculation_settings["nat"] == 32
+    assert "nat = 32" in pwig.all_namelists_as_str
+    pwig.supercell = None
+    assert pwig.input_hash != hash_supercell
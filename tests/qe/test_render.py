@@ -0,0 +1,108 @@
+"""Unit tests for the functional pw.x rendering API."""
+
+import os
+import copy
+import pytest
+from concurrent import futures
+
+from ase import io as ase_io
+
+from dftinputgen.utils import StructureView
+from dftinputgen.qe.settings.calculation_presets import get_qe_presets
+from dftinputgen.qe.pwx import PwxInputGenerator
+from dftinputgen.qe.pwx import PwxInputGeneratorError
+from dftinputgen.qe.render import PwxRenderer
+from dftinputgen.qe.render import render_pwx
+
+
+test_data_dir = os.path.join(os.path.dirname(__file__), "files")
+pseudo_dir = os.path.join(os.path.dirname(__file__), "files")
+feo_struct = ase_io.read(os.path.join(test_data_dir, "feo_conv.vasp"))
+al_fcc_struct = ase_io.read(os.path.join(test_data_dir, "al_fcc_conv.vasp"))
+with open(os.path.join(test_data_dir, "TEST_feo_conv_scf.in"), "r") as fr:
+    feo_scf_in = fr.read().format(pseudo_dir=pseudo_dir)
+with open(os.path.join(test_data_dir, "TEST_al_fcc_conv_scf.in"), "r") as fr:
+    al_fcc_scf_in = fr.read().format(pseudo_dir=pseudo_dir)
+
+
+def _scf_settings():
+    settings = dict(get_qe_presets()["scf"])
+    settings["pseudo_dir"] = pseudo_dir
+    return settings
+
+
+def test_render_pwx():
+    settings = _scf_settings()
+    original = copy.deepcopy(settings)
+    text = render_pwx(feo_struct, settings, specify_potentials=True)
+    assert text == feo_scf_in.rstrip("\n")
+    # no side effects on the inputs
+    assert settings == original
+    assert len(feo_struct) == 4
+    # same as the input generator
+    pwig = PwxInputGenerator(
+        crystal_structure=al_fcc_struct,
+        calculation_presets="scf",
+        custom_sett_dict={"pseudo_dir": pseudo_dir},
+        specify_potentials=True,
+        supercell=2,
+    )
+    text = render_pwx(
+        al_fcc_struct, settings, specify_potentials=True, supercell=2
+    )
+    assert text == pwig.pwx_input_as_str
+    # structure views work as well
+    view = StructureView.from_atoms(al_fcc_struct)
+    text = render_pwx(view, settings, specify_potentials=True)
+    assert text == al_fcc_scf_in.rstrip("\n")
+    # errors
+    with pytest.raises(PwxInputGeneratorError, match="Failed to list"):
+        render_pwx(feo_struct, get_qe_presets()["scf"], True)
+
+
+def test_pwx_renderer():
+    settings = _scf_settings()
+    renderer = PwxRenderer(settings, specify_potentials=True)
+    # later changes to the input settings do not affect the renderer
+    settings["ecutwfc"] = 100
+    settings["kpoints"] = {"scheme": "gamma"}
+    assert renderer.calculation_settings["ecutwfc"] == 40
+    assert renderer.render(feo_struct) == feo_scf_in.rstrip("\n")
+    assert renderer.render(al_fcc_struct) == al_fcc_scf_in.rstrip("\n")
+    # the same renderer, from many threads at once
+    structures = [feo_struct, al_fcc_struct] * 20
+    with futures.ThreadPoolExecutor(max_workers=8) as executor:
+        texts = list(executor.map(renderer.render, structures))
+    assert texts == [renderer.render(s) for s in structures]
+
+
+def test_pwx_renderer_variable_tags():
+    renderer = PwxRenderer(
+        _scf_settings(),
+        specify_potentials=True,
+        variable_tags=["ecutwfc", "ecutrho"],
+    )
+    assert renderer.variable_tags == ("ecutwfc", "ecutrho")
+    # by default, the values in the settings
+    assert renderer.render(feo_struct) == feo_scf_in.rstrip("\n")
+    text = renderer.render(feo_struct, values={"ecutwfc": 60})
+    assert "ecutwfc = 60" in text
+    assert "ecutrho = 240" in text
+    renderer = PwxRenderer(_scf_settings(), variable_tags=["nbnd"])
+    with pytest.raises(PwxInputGeneratorError, match="nbnd"):
+        renderer.render(feo_struct)
+    assert "nbnd = 32" in renderer.render(feo_struct, values={"nbnd": 32})
+
+
+def test_pwx_renderer_unsupported_card():
+    settings = _scf_settings()
+    settings["cards"] = list(settings["cards"]) + ["occupations"]
+    renderer = PwxRenderer(settings)
+    with pytest.raises(PwxInputGeneratorError, match='"OCCUPATIONS"'):
+        renderer.render(feo_struct)
+    # the same error from the input generator
+    pwig = PwxInputGenerator(
+        crystal_structure=feo_struct, custom_sett_dict=settings
+    )
+    with pytest.raises(PwxInputGeneratorError, match='"OCCUPATIONS"'):
+        pwig.pwx_input_as_str
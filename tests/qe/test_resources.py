@@ -0,0 +1,122 @@
+"""Unit tests for the pw.x resource estimator."""
+
+import os
+import pytest
+import numpy as np
+
+from ase import io as ase_io
+
+from dftinputgen.qe.pwx import PwxInputGenerator
+from dftinputgen.qe.pwx import PwxInputGeneratorError
+from dftinputgen.qe.resources import estimate_resources
+from dftinputgen.qe.resources import get_valence_electrons
+from dftinputgen.qe.resources import _count_kpoints
+from dftinputgen.qe.resources import _get_good_fft_dimensions
+
+
+test_data_dir = os.path.join(os.path.dirname(__file__), "files")
+feo_struct = ase_io.read(os.path.join(test_data_dir, "feo_conv.vasp"))
+al_fcc_struct = ase_io.read(os.path.join(test_data_dir, "al_fcc_conv.vasp"))
+
+
+def _get_generator(structure, **kwargs):
+    return PwxInputGenerator(
+        crystal_structure=structure, calculation_presets="scf", **kwargs
+    )
+
+
+def test_get_valence_electrons():
+    assert get_valence_electrons("H") == 1
+    assert get_valence_electrons("O") == 6
+    assert get_valence_electrons("Al") == 3
+    assert get_valence_electrons("Fe") == 8
+
+
+def test_good_fft_dimensions():
+    good = _get_good_fft_dimensions()
+    assert list(good[:12]) == [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 12, 14]
+    assert 11 not in good and 13 not in good
+
+
+def test_count_kpoints():
+    grids = np.array([[1, 1, 1], [2, 2, 2], [4, 4, 4], [3, 3, 3], [4, 4, 4]])
+    shifts = np.array([[0] * 3, [0] * 3, [0] * 3, [0] * 3, [1] * 3])
+    nks = _count_kpoints(grids, shifts, np.array([1, 1, 1, 1, 2]))
+    # every point of a 2x2x2 grid is its own time-reversed partner
+    assert nks.tolist() == [1, 8, 36, 14, 64]
+
+
+def test_estimate_resources():
+    feo = _get_generator(feo_struct)
+    al = _get_generator(
+        al_fcc_struct,
+        custom_sett_dict={"kpoints": {"scheme": "automatic", "grid": [8] * 3}},
+    )
+    estimates = estimate_resources([feo, al], nprocs=8)
+    assert len(estimates) == 2
+    assert estimates.nat.tolist() == [4, 4]
+    assert estimates.nelec.tolist() == [28, 12]
+    # smearing: 20% more bands than occupied, at least 4 more
+    assert estimates.nbnd.tolist() == [18, 10]
+    assert estimates.nks[1] == 260
+    # FFT dimensions have only small prime factors
+    good = set(_get_good_fft_dimensions().tolist())
+    assert set(estimates.fft_grid.ravel().tolist()) <= good
+    assert np.all(estimates.ngm > estimates.npw)
+    assert estimates.nk.tolist() == [8, 8]
+    assert estimates.flags(0) == "-nk 8 -nd 1"
+    assert np.all(estimates.memory_per_process < estimates.memory)
+    assert estimates.as_dicts()[1]["fft_grid"] == [40, 40, 40]
+
+
+def test_estimate_resources_memory_limit():
+    feo = _get_generator(feo_struct)
+    unlimited = estimate_resources([feo], nprocs=8)
+    limit = unlimited.memory_per_process[0] * 0.9
+    limited = estimate_resources([feo], nprocs=8, max_memory_per_process=limit)
+    assert limited.nk[0] == 4
+    assert limited.memory_per_process[0] <= limit
+    # no number of pools fits: fewest bytes per process
+    tiny = estimate_resources([feo], nprocs=8, max_memory_per_process=1)
+    assert tiny.nk[0] == 1
+
+
+def test_estimate_resources_settings():
+    al = _get_generator(
+        al_fcc_struct,
+        custom_sett_dict={
+            "kpoints": {"scheme": "gamma"},
+            "nbnd": 40,
+            "nspin": 2,
+        },
+    )
+    full = _get_generator(al_fcc_struct, custom_sett_dict={"nbnd": 40})
+    estimates = estimate_resources([al, full], valence_electrons={"Al": 13})
+    assert estimates.nelec.tolist() == [52, 52]
+    assert estimates.nbnd.tolist() == [40, 40]
+    assert estimates.nks[0] == 2
+    # Gamma-point tricks halve the number of plane waves
+    assert abs(estimates.npw[0] - estimates.npw[1] / 2) <= 1
+    assert estimates.nk.tolist() == [1, 1]
+
+
+def test_estimate_resources_supercell():
+    primitive = _get_generator(al_fcc_struct)
+    supercell = _get_generator(al_fcc_struct, supercell=2)
+    estimates = estimate_resources([primitive, supercell])
+    assert estimates.nat.tolist() == [4, 32]
+    assert estimates.nelec.tolist() == [12, 96]
+    assert abs(estimates.npw[1] / estimates.npw[0] - 8) < 1e-2
+
+
+def test_estimate_resources_errors():
+    pwig = _get_generator(al_fcc_struct)
+    pwig.calculation_settings.pop("ecutwfc")
+    with pytest.raises(PwxInputGeneratorError, match="ecutwfc"):
+        estimate_resources([pwig])
+    pwig = _get_generator(
+        al_fcc_struct, custom_sett_dict={"kpoints": {"scheme": "tpiba"}}
+    )
+    with pytest.raises(PwxInputGeneratorError, match="tpiba"):
+        estimate_resources([pwig])
+    assert len(estimate_resources([])) == 0
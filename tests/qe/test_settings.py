@@ -0,0 +1,145 @@
+"""Unit tests for the pw.x tags in :mod:`dftinputgen.qe.settings`."""
+
+from dftinputgen.qe.settings import get_qe_tags
+from dftinputgen.qe.settings import get_qe_tag_index
+from dftinputgen.qe.settings import check_pwx_settings
+import os
+import copy
+import json
+import pickle
+
+import pytest
+
+from dftinputgen.qe.settings.calculation_presets import get_qe_presets
+from dftinputgen.qe.settings.calculation_presets import freeze
+from dftinputgen.qe.settings.calculation_presets import thaw
+from dftinputgen.qe.settings.calculation_presets import FrozenDict
+from dftinputgen.qe.settings.calculation_presets import PresetRegistry
+from dftinputgen.qe.settings.calculation_presets import PresetRegistryError
+from dftinputgen.qe.settings.calculation_presets import PRESETS_PATH_ENV_VAR
+
+
+def test_get_qe_tag_index():
+    index = get_qe_tag_index()
+    assert index == get_qe_tag_index("pw.x")
+    assert index["calculation"] == ("control", 0)
+    assert index["ecutwfc"][0] == "system"
+    namelist_tags = get_qe_tags()["pw.x"]["namelist_tags"]
+    assert len(index) == sum(len(tags) for tags in namelist_tags.values())
+    for tag, (namelist, position) in index.items():
+        assert namelist_tags[namelist][position] == tag
+
+
+def test_check_pwx_settings():
+    # all presets are valid
+    for presets in get_qe_presets().values():
+        assert check_pwx_settings(presets).ok
+    settings = {
+        "namelists": ["control", "system"],
+        "kpoints": {"scheme": "gamma"},
+        "ecutwfc": 30,
+        "ecutwcf": 30,
+        "celldm(1)": 10.0,
+        "starting_magnetization(2)": 0.5,
+        "press": 10.0,
+        "mixing_beta": 0.5,
+        "Ecutrho": 240,
+    }
+    check = check_pwx_settings(settings)
+    assert not check.ok
+    assert check.unknown == ["Ecutrho", "ecutwcf"]
+    assert check.misplaced == {"press": "cell", "mixing_beta": "electrons"}
+    assert check.messages() == [
+        'Unknown tag "Ecutrho"',
+        'Unknown tag "ecutwcf"',
+        'Tag "mixing_beta" in namelist "electrons", which is not written',
+        'Tag "press" in namelist "cell", which is not written',
+    ]
+
+
+def test_frozen_presets():
+    presets = get_qe_presets()
+    assert sorted(presets) == ["relax", "scf", "vc-relax"]
+    scf = presets["scf"]
+    assert isinstance(scf, FrozenDict)
+    assert scf["calculation"] == "scf"
+    # compares equal to (and merges into) plain dicts
+    assert thaw(scf) == scf
+    assert dict(scf)["namelists"] == list(scf["namelists"])
+    # nested values cannot be modified in place either
+    with pytest.raises(TypeError):
+        scf["ecutwfc"] = 10
+    with pytest.raises(TypeError):
+        scf.update({"ecutwfc": 10})
+    with pytest.raises(TypeError):
+        scf["namelists"].append("ions")
+    with pytest.raises(TypeError):
+        scf["kpoints"]["scheme"] = "gamma"
+    # shared, not copied
+    assert copy.deepcopy(scf) is scf
+    assert presets["scf"] is scf
+    # ... but can be pickled (e.g. to send to worker processes)
+    unpickled = pickle.loads(pickle.dumps(scf))
+    assert unpickled == scf
+    assert isinstance(unpickled["kpoints"], FrozenDict)
+    # thawed copies are mutable
+    thawed = thaw(scf)
+    thawed["namelists"].append("ions")
+    assert "ions" not in scf["namelists"]
+
+
+def test_preset_registry_register():
+    registry = PresetRegistry()
+    registry.register("scf", {"calculation": "scf", "ecutwfc": 20})
+    assert registry["scf"] == {"calculation": "scf", "ecutwfc": 20}
+    registry.register("scf-custom", {"ecutwfc": 50})
+    assert "scf-custom" in registry
+    assert len(registry) == 4
+    # registered presets take precedence over the built-in ones
+    registry.unregister("scf")
+    assert registry["scf"] == get_qe_presets()["scf"]
+    with pytest.raises(PresetRegistryError, match="ecutwcf"):
+        registry.register("bad", {"ecutwcf": 30})
+    assert "bad" not in registry
+
+
+def test_preset_registry_directories(tmp_path, monkeypatch):
+    site_dir = tmp_path / "presets"
+    site_dir.mkdir()
+    preset_file = site_dir / "scf-tight.json"
+    preset_file.write_text(json.dumps({"conv_thr": 1e-10}))
+    monkeypatch.setenv(PRESETS_PATH_ENV_VAR, str(site_dir))
+    registry = PresetRegistry(check_interval=0)
+    assert registry.directories == [str(site_dir)]
+    assert registry["scf-tight"] == {"conv_thr": 1e-10}
+    # modified files are reloaded
+    preset_file.write_text(json.dumps({"conv_thr": 1e-12}))
+    mtime_ns = os.stat(str(preset_file)).st_mtime_ns + 10 ** 9
+    os.utime(str(preset_file), ns=(mtime_ns, mtime_ns))
+    assert registry["scf-tight"] == {"conv_thr": 1e-12}
+    # ... as are new files, which override the built-in presets
+    (site_dir / "scf.json").write_text(json.dumps({"calculation": "scf"}))
+    mtime_ns = os.stat(str(site_dir)).st_mtime_ns + 10 ** 9
+    os.utime(str(site_dir), ns=(mtime_ns, mtime_ns))
+    assert registry["scf"] == {"calculation": "scf"}
+    # directories removed from the environment variable are dropped
+    monkeypatch.delenv(PRESETS_PATH_ENV_VAR)
+    assert registry.directories == []
+    assert "scf-tight" not in registry
+    assert registry["scf"] == get_qe_presets()["scf"]
+    # invalid presets are rejected when the directory is loaded
+    bad_dir = tmp_path / "bad"
+    bad_dir.mkdir()
+    (bad_dir / "bad.json").write_text(json.dumps({"ecutwcf": 30}))
+    with pytest.raises(PresetRegistryError, match="bad.json"):
+        registry.add_directory(str(bad_dir))
+    registry.add_directory(str(site_dir))
+    assert registry["scf"] == {"calculation": "scf"}
+    registry.remove_directory(str(site_dir))
+    assert "scf-tight" not in registry
+
+
+def test_freeze():
+    frozen = freeze({"a": [1, {"b": (2, 3)}]})
+    assert frozen == {"a": [1, {"b": [2, 3]}]}
+    assert hash(frozen) == hash(freeze({"a": [1, {"b": [2, 3]}]}))
@@ -0,0 +1,181 @@
+"""Unit tests for parameter sweeps in :mod:`dftinputgen.qe.sweep`."""
+
+import os
+import pytest
+
+from ase import io as ase_io
+
+from dftinputgen.qe.pwx import PwxInputGenerator
+from dftinputgen.qe.sweep import PwxSweep
+from dftinputgen.qe.sweep import PwxSweepError
+
+
+test_data_dir = os.path.join(os.path.dirname(__file__), "files")
+feo_struct = ase_io.read(os.path.join(test_data_dir, "feo_conv.vasp"))
+
+
+def _get_pwig(**custom_sett):
+    custom_sett.setdefault("pseudo_dir", test_data_dir)
+    return PwxInputGenerator(
+        crystal_structure=feo_struct,
+        calculation_presets="scf",
+        custom_sett_dict=custom_sett,
+        specify_potentials=True,
+    )
+
+
+def _kpoints(spacing):
+    return {"scheme": "automatic", "spacing": spacing, "shift": [0, 0, 0]}
+
+
+def test_sweep_product():
+    sweep = PwxSweep(
+        _get_pwig(),
+        {"ecutwfc": [30, 40], "degauss": [0.01, 0.02, 0.03]},
+    )
+    assert len(sweep.points) == 6
+    assert sweep.points[1] == {"ecutwfc": 30, "degauss": 0.02}
+    inputs = list(sweep.iter_inputs())
+    assert len(sweep) == len(inputs) == 6
+    # inputs are identical to those from individual generators
+    for sweep_input in inputs:
+        pwig = _get_pwig(**sweep_input.values)
+        assert sweep_input.text == pwig.pwx_input_as_str
+        assert sweep_input.points == [sweep_input.index]
+
+
+def test_sweep_zip():
+    sweep = PwxSweep(
+        _get_pwig(),
+        {"ecutwfc": [30, 40, 50], "ecutrho": [240, 320, 400]},
+        mode="zip",
+    )
+    assert [p["ecutrho"] for p in sweep.points] == [240, 320, 400]
+    for sweep_input in sweep.iter_inputs():
+        pwig = _get_pwig(**sweep_input.values)
+        assert sweep_input.text == pwig.pwx_input_as_str
+    # values of different lengths: error
+    with pytest.raises(PwxSweepError, match="same length"):
+        PwxSweep(_get_pwig(), {"ecutwfc": [30], "ecutrho": []}, mode="zip")
+    with pytest.raises(PwxSweepError, match="Unknown sweep mode"):
+        PwxSweep(_get_pwig(), {"ecutwfc": [30]}, mode="random")
+
+
+def test_sweep_merge_kpoints():
+    spacings = [0.3, 0.25, 0.2, 0.19, 0.15]
+    sweep = PwxSweep(
+        _get_pwig(), {"kpoints": [_kpoints(s) for s in spacings]}
+    )
+    inputs = list(sweep.iter_inputs())
+    texts = [_get_pwig(kpoints=_kpoints(s)).pwx_input_as_str for s in spacings]
+    assert [i.text for i in inputs] == sorted(set(texts), key=texts.index)
+    assert [texts[i.points[0]] for i in inputs] == [i.text for i in inputs]
+    # points with the same k-point grid are merged
+    assert len(inputs) < len(spacings)
+    assert sum(len(i.points) for i in inputs) == len(spacings)
+    # explicit grids
+    sweep = PwxSweep(
+        _get_pwig(),
+        {
+            "kpoints": [
+                {"scheme": "gamma"},
+                {"scheme": "automatic", "grid": [2, 2, 2], "shift": [1] * 3},
+            ]
+        },
+    )
+    texts = [i.text for i in sweep.iter_inputs()]
+    assert texts[0] == _get_pwig(kpoints={"scheme": "gamma"}).pwx_input_as_str
+    assert "K_POINTS {automatic}\n2 2 2 1 1 1" in texts[1]
+
+
+def test_sweep_merge_unrendered():
+    # tags in namelists that are not rendered do not change the input
+    sweep = PwxSweep(_get_pwig(), {"ecutwfc": [30, 40], "press": [0, 10]})
+    assert sweep.namelist_tags == ("ecutwfc",)
+    assert [i.points for i in sweep.iter_inputs()] == [[0, 1], [2, 3]]
+
+
+def test_sweep_indexed_tags():
+    sweep = PwxSweep(
+        _get_pwig(nspin=2),
+        {
+            "starting_magnetization(1)": [0.5, 1.0],
+            "starting_magnetization(2)": [0.0, -0.5],
+        },
+        mode="zip",
+    )
+    assert sweep.namelist_tags == sweep.tags
+    inputs = list(sweep.iter_inputs())
+    assert len(inputs) == 2
+    for sweep_input in inputs:
+        pwig = _get_pwig(nspin=2, **sweep_input.values)
+        assert sweep_input.text == pwig.pwx_input_as_str
+    assert "starting_magnetization(1) = 0.5" in inputs[0].text
+    assert "starting_magnetization(2) = -0.5" in inputs[1].text
+    with pytest.raises(PwxSweepError, match="Cannot sweep"):
+        PwxSweep(_get_pwig(), {"not_a_tag(1)": [1]})
+
+
+def test_sweep_invalid_tags():
+    for tag in ["nat", "pseudo_dir", "not_a_tag", "namelists"]:
+        with pytest.raises(PwxSweepError, match="Cannot sweep"):
+            PwxSweep(_get_pwig(), {tag: [1]})
+
+
+def test_write_inputs(tmpdir):
+    write_location = os.path.join(str(tmpdir), "sweep")
+    sweep = PwxSweep(
+        _get_pwig(), {"ecutwfc": [30, 40], "kpoints": [_kpoints(0.3), _kpoints(0.29)]}
+    )
+    written = sweep.write_inputs(write_location=write_location)
+    assert list(written) == [
+        os.path.join(write_location, "{}_scf.in".format(i)) for i in range(2)
+    ]
+    assert [len(v) for v in written.values()] == [2, 2]
+    written = sweep.write_inputs(
+        write_location=write_location, filename_template="ecut_{ecutwfc}.in"
+    )
+    path = os.path.join(write_location, "ecut_40.in")
+    assert path in written
+    with open(path, "r") as fr:
+        pwig = _get_pwig(ecutwfc=40, kpoints=_kpoints(0.3))
+        assert fr.read() == pwig.pwx_input_as_str
+
+
+def test_write_inputs_targets(tmpdir):
+    import zipfile
+    from dftinputgen.manifest import Manifest
+    from dftinputgen.targets import ArchiveTarget
+
+    write_location = str(tmpdir)
+    pwig = _get_pwig()
+    pwig.write_location = write_location
+    pwig.pwx_input_file = "scf.in"
+    pwig.incremental = True
+    sweep = PwxSweep(pwig, {"ecutwfc": [30, 40]})
+    paths = [
+        os.path.join(write_location, "{}_scf.in".format(i)) for i in [0, 1]
+    ]
+    assert list(sweep.write_inputs()) == paths
+    manifest = Manifest.load(write_location)
+    assert sorted(manifest.entries) == ["0_scf.in", "1_scf.in"]
+    assert not any(p.basename.endswith(".part") for p in tmpdir.listdir())
+    # up to date: skipped without rendering
+    sweep._render = None
+    mtimes = [os.stat(p).st_mtime_ns for p in paths]
+    assert list(sweep.write_inputs()) == paths
+    assert [os.stat(p).st_mtime_ns for p in paths] == mtimes
+    # no overwriting
+    sweep = PwxSweep(pwig, {"ecutwfc": [50, 40]})
+    pwig.incremental = False
+    pwig.overwrite_files = False
+    sweep.write_inputs()
+    with open(paths[0], "r") as fr:
+        assert "ecutwfc = 30" in fr.read()
+    # other output targets
+    path = os.path.join(write_location, "sweep.zip")
+    with ArchiveTarget(path) as target:
+        written = sweep.write_inputs(target=target)
+    assert list(written) == ["0_scf.in", "1_scf.in"]
+    with zipfile.ZipFile(path, "r") as zipf:
+        assert "ecutwfc = 50" in zipf.read("0_scf.in").decode()
@@ -0,0 +1,229 @@
+"""Unit tests for reading and caching UPF pseudopotential headers."""
+
+import os
+import json
+import pytest
+
+from ase import io as ase_io
+from ase.build import bulk
+
+from dftinputgen.qe.pwx import PwxInputGenerator
+from dftinputgen.qe.pwx import PwxInputGeneratorError
+from dftinputgen.qe.upf import UpfError
+from dftinputgen.qe.upf import UpfHeader
+from dftinputgen.qe.upf import UpfHeaderCache
+from dftinputgen.qe.upf import UPF_HEADER_CACHE
+from dftinputgen.qe.upf import CACHE_DIR_ENV_VAR
+from dftinputgen.qe.upf import read_upf_header
+from dftinputgen.qe.upf import get_suggested_cutoffs
+
+
+test_data_dir = os.path.join(os.path.dirname(__file__), "files")
+feo_struct = ase_io.read(os.path.join(test_data_dir, "feo_conv.vasp"))
+al_fcc_struct = ase_io.read(os.path.join(test_data_dir, "al_fcc_conv.vasp"))
+
+upf_v2_header = """<UPF version="2.0.1">
+  <PP_INFO>
+    Generated by new atomic code, or converted to UPF format
+  </PP_INFO>
+  <!--                               -->
+  <!-- END OF HUMAN READABLE SECTION -->
+  <!--                               -->
+  <PP_HEADER
+     generated="Generated using ONCVPSP code"
+     element="Si"
+     pseudo_type="NC"
+     relativistic="scalar"
+     functional="  PBE"
+     z_valence="    4.000000000000000E+000"
+     wfc_cutoff="    2.4D+001"
+     rho_cutoff="    9.6D+001"
+     l_max="1"
+     mesh_size="  1510"/>
+  <PP_MESH dx="1.0E-002" mesh="1510">
+"""
+
+# suggested cutoffs (wfc, rho) for the pseudopotentials in `pseudo_dir`
+_CUTOFFS = {
+    "fe_pbe_v1.5.uspp.F.UPF": (45.0, 360.0),
+    "o_pbe_v1.2.uspp.F.UPF": (50.0, 400.0),
+}
+
+
+@pytest.fixture
+def pseudo_dir(tmpdir, monkeypatch):
+    """Copies of the test pseudopotentials, with suggested cutoffs."""
+    monkeypatch.setenv(CACHE_DIR_ENV_VAR, str(tmpdir.join("cache")))
+    UPF_HEADER_CACHE.clear()
+    pseudos = tmpdir.mkdir("pseudos")
+    for name in os.listdir(test_data_dir):
+        if not name.endswith(".UPF"):
+            continue
+        with open(os.path.join(test_data_dir, name), "r") as fr:
+            text = fr.read()
+        wfc, rho = _CUTOFFS.get(name, (0.0, 0.0))
+        text = text.replace(
+            "    0.00000    0.00000 Suggested",
+            "{:11.5f}{:11.5f} Suggested".format(wfc, rho),
+        )
+        pseudos.join(name).write(text)
+    yield str(pseudos)
+    UPF_HEADER_CACHE.clear()
+
+
+def test_read_upf_header_v1():
+    header = read_upf_header(
+        os.path.join(test_data_dir, "fe_pbe_v1.5.uspp.F.UPF")
+    )
+    assert header == UpfHeader(
+        element="Fe",
+        pseudo_type="US",
+        functional="SLA PW PBX PBC",
+        z_valence=16.0,
+        wfc_cutoff=None,
+        rho_cutoff=None,
+    )
+
+
+def test_read_upf_header_v2(tmpdir):
+    upf = tmpdir.join("si.upf")
+    # (the radial grids after the header are never read)
+    upf.write(upf_v2_header + "  <PP_R>not a number</PP_R>\n")
+    header = read_upf_header(str(upf))
+    assert header.element == "Si"
+    assert header.pseudo_type == "NC"
+    assert header.functional == "PBE"
+    assert header.z_valence == 4.0
+    assert header.wfc_cutoff == 24.0
+    assert header.rho_cutoff == 96.0
+
+
+def test_read_upf_header_errors(tmpdir):
+    with pytest.raises(UpfError, match="Failed to read"):
+        read_upf_header(str(tmpdir.join("missing.upf")))
+    upf = tmpdir.join("invalid.upf")
+    upf.write('<UPF version="2.0.1">\n<PP_MESH dx="1.0E-002"/>\n')
+    with pytest.raises(UpfError, match="No PP_HEADER"):
+        read_upf_header(str(upf))
+    upf.write('<PP_HEADER element="Si"/>\n')
+    with pytest.raises(UpfError, match="pseudo_type"):
+        read_upf_header(str(upf))
+
+
+def test_upf_header_cache(tmpdir, monkeypatch):
+    import dftinputgen.qe.upf as upf_module
+
+    upf = tmpdir.join("si.upf")
+    upf.write(upf_v2_header)
+    cache_path = str(tmpdir.join("cache", "headers.json"))
+    cache = UpfHeaderCache(path=cache_path)
+    header = cache.get(str(upf))
+    assert header.z_valence == 4.0
+    # new entries are saved to disk only when flushed
+    assert not os.path.exists(cache_path)
+    cache.flush()
+    with open(cache_path, "r") as fr:
+        assert len(json.load(fr)["headers"]) == 1
+
+    # headers are neither read nor hashed again, also in a new session
+    def _fail(path):
+        raise AssertionError("read {}".format(path))
+
+    monkeypatch.setattr(upf_module, "read_upf_header", _fail)
+    monkeypatch.setattr(upf_module, "_hash_file", _fail)
+    assert cache.get(str(upf)) == header
+    assert UpfHeaderCache(path=cache_path).get(str(upf)) == header
+
+    # same contents in another file: hashed, but not read again
+    monkeypatch.undo()
+    monkeypatch.setattr(upf_module, "read_upf_header", _fail)
+    copy = tmpdir.join("si_copy.upf")
+    copy.write(upf_v2_header)
+    assert cache.get(str(copy)) == header
+
+    with pytest.raises(UpfError, match="Failed to read"):
+        cache.get(str(tmpdir.join("missing.upf")))
+
+
+def test_get_suggested_cutoffs():
+    header = UpfHeader("Fe", "US", "PBE", 16.0, 45.0, 360.0)
+    assert get_suggested_cutoffs([]) == {}
+    assert get_suggested_cutoffs([header]) == {
+        "ecutwfc": 45.0,
+        "ecutrho": 360.0,
+    }
+    # largest suggested cutoffs; ecutrho at least 4 x ecutwfc
+    nc = UpfHeader("Si", "NC", "PBE", 4.0, 50.0, 100.0)
+    assert get_suggested_cutoffs([header, nc]) == {
+        "ecutwfc": 50.0,
+        "ecutrho": 360.0,
+    }
+    # only cutoffs suggested for all pseudopotentials
+    unknown = header._replace(wfc_cutoff=None)
+    assert get_suggested_cutoffs([unknown, nc]) == {"ecutrho": 360.0}
+
+
+def test_auto_cutoffs(pseudo_dir):
+    pwig = PwxInputGenerator(
+        crystal_structure=feo_struct,
+        calculation_presets="scf",
+        custom_sett_dict={"pseudo_dir": pseudo_dir},
+        specify_potentials=True,
+        auto_cutoffs=True,
+    )
+    assert pwig.calculation_settings["ecutwfc"] == 50.0
+    assert pwig.calculation_settings["ecutrho"] == 400.0
+    assert "ecutwfc = 50.0" in pwig.pwx_input_as_str
+    # the headers of all species are saved to disk at once
+    with open(UPF_HEADER_CACHE.path, "r") as fr:
+        assert len(json.load(fr)["headers"]) == 2
+    assert pwig.pseudo_headers["Fe"].z_valence == 16.0
+
+    # cutoffs follow the species of the crystal structure
+    pwig.crystal_structure = bulk("Fe", "bcc", a=2.87)
+    assert pwig.calculation_settings["ecutwfc"] == 45.0
+    assert pwig.calculation_settings["ecutrho"] == 360.0
+    namelists = pwig.all_namelists_as_str
+    assert "ecutwfc = 45.0" in namelists
+    assert "ecutrho = 360.0" in namelists
+    pwig.crystal_structure = feo_struct
+    assert "ecutwfc = 50.0" in pwig.all_namelists_as_str
+
+    # custom cutoffs take precedence over the suggested ones
+    pwig.custom_sett_dict = {"pseudo_dir": pseudo_dir, "ecutwfc": 60}
+    assert pwig.calculation_settings["ecutwfc"] == 60
+    assert pwig.calculation_settings["ecutrho"] == 400.0
+    # ... with the suggested ecutrho at least 4 x the custom ecutwfc
+    pwig.custom_sett_dict["ecutwfc"] = 120
+    assert pwig.calculation_settings["ecutrho"] == 480
+    assert "ecutrho = 480" in pwig.all_namelists_as_str
+    pwig.custom_sett_dict["ecutrho"] = 400
+    assert pwig.calculation_settings["ecutrho"] == 400
+
+    # no suggested cutoffs (for Al): presets are kept
+    pwig = PwxInputGenerator(
+        crystal_structure=al_fcc_struct,
+        calculation_presets="scf",
+        custom_sett_dict={"pseudo_dir": pseudo_dir},
+        auto_cutoffs=True,
+    )
+    assert pwig.calculation_settings["ecutwfc"] == 40
+    pwig.auto_cutoffs = False
+    assert pwig.calculation_settings["ecutrho"] == 240
+
+
+def test_auto_cutoffs_errors(pseudo_dir, tmpdir):
+    pwig = PwxInputGenerator(
+        crystal_structure=feo_struct,
+        calculation_presets="scf",
+        custom_sett_dict={"pseudo_dir": None},
+        auto_cutoffs=True,
+    )
+    with pytest.raises(PwxInputGeneratorError, match="directory"):
+        pwig.calculation_settings
+    pwig.custom_sett_dict = {"pseudo_dir": [pseudo_dir]}
+    with pytest.raises(PwxInputGeneratorError, match="type str"):
+        pwig.calculation_settings
+    pwig.custom_sett_dict = {"pseudo_dir": str(tmpdir.mkdir("empty"))}
+    with pytest.raises(PwxInputGeneratorError, match="Fe, O|O, Fe"):
+        pwig.calculation_settings
@@ -0,0 +1,364 @@
+"""Unit tests for batch input generation in :mod:`dftinputgen.batch`."""
+
+import os
+import json
+
+from ase import io as ase_io
+
+from dftinputgen.batch import generate_many
+from dftinputgen.qe.pwx import PwxInputGeneratorError
+
+
+test_base_dir = os.path.dirname(__file__)
+qe_files_dir = os.path.join(test_base_dir, "qe", "files")
+feo_struct = ase_io.read(os.path.join(qe_files_dir, "feo_conv.vasp"))
+al_fcc_struct = ase_io.read(os.path.join(qe_files_dir, "al_fcc_conv.vasp"))
+with open(os.path.join(qe_files_dir, "TEST_feo_conv_scf.in"), "r") as fr:
+    feo_scf_in = fr.read().format(pseudo_dir=qe_files_dir).rstrip("\n")
+with open(os.path.join(qe_files_dir, "TEST_al_fcc_conv_scf.in"), "r") as fr:
+    al_fcc_scf_in = fr.read().format(pseudo_dir=qe_files_dir).rstrip("\n")
+
+
+def test_generate_many_serial():
+    results = generate_many(
+        [feo_struct, "not a structure", al_fcc_struct],
+        calculation_presets="scf",
+        custom_sett_dict={"pseudo_dir": qe_files_dir},
+        specify_potentials=True,
+        max_workers=1,
+    )
+    assert [r.index for r in results] == [0, 1, 2]
+    assert results[0].text == feo_scf_in
+    assert results[0].path is None
+    assert results[0].error is None
+    # errors are reported per structure
+    assert isinstance(results[1].error, TypeError)
+    assert results[1].text is None
+    assert results[2].text == al_fcc_scf_in
+
+
+def test_generate_many_missing_pseudos():
+    results = generate_many(
+        [feo_struct],
+        calculation_presets="scf",
+        custom_sett_dict={"pseudo_dir": ""},
+        specify_potentials=True,
+        max_workers=1,
+    )
+    assert isinstance(results[0].error, PwxInputGeneratorError)
+    assert "not specified" in str(results[0].error)
+    results = generate_many(
+        [feo_struct],
+        calculation_presets="scf",
+        custom_sett_dict={"pseudo_dir": "wrong_dir"},
+        specify_potentials=True,
+        max_workers=1,
+    )
+    assert isinstance(results[0].error, PwxInputGeneratorError)
+    assert "list contents" in str(results[0].error)
+
+
+def test_generate_many_process_pool(tmpdir):
+    sett_file = os.path.join(str(tmpdir), "sett.json")
+    with open(sett_file, "w") as fw:
+        json.dump({"pseudo_dir": qe_files_dir}, fw)
+    write_location = os.path.join(str(tmpdir), "inputs")
+    structures = [feo_struct, al_fcc_struct] * 5
+    results = generate_many(
+        structures,
+        calculation_presets="scf",
+        custom_sett_file=sett_file,
+        specify_potentials=True,
+        write_location=write_location,
+        max_workers=2,
+        chunksize=3,
+    )
+    assert len(results) == 10
+    assert all(r.error is None for r in results)
+    assert results[3].path == os.path.join(write_location, "3_scf.in")
+    with open(results[3].path, "r") as fr:
+        assert fr.read() == al_fcc_scf_in
+
+    # user-specified file names
+    results = generate_many(
+        [feo_struct],
+        calculation_presets="scf",
+        custom_sett_file=sett_file,
+        specify_potentials=True,
+        write_location=write_location,
+        filenames=["feo.in"],
+        max_workers=1,
+    )
+    with open(os.path.join(write_location, "feo.in"), "r") as fr:
+        assert fr.read() == feo_scf_in
+
+
+def test_generate_many_incremental(tmpdir):
+    from dftinputgen.manifest import Manifest
+
+    write_location = str(tmpdir)
+    kwargs = dict(
+        calculation_presets="scf",
+        custom_sett_dict={"pseudo_dir": qe_files_dir},
+        specify_potentials=True,
+        write_location=write_location,
+        incremental=True,
+    )
+    results = generate_many(
+        [feo_struct, al_fcc_struct], max_workers=2, **kwargs
+    )
+    assert [r.written for r in results] == [True, True]
+    manifest = Manifest.load(write_location)
+    assert sorted(manifest.entries) == ["0_scf.in", "1_scf.in"]
+    # only new or changed structures are written
+    results = generate_many(
+        [feo_struct, feo_struct, al_fcc_struct], max_workers=1, **kwargs
+    )
+    assert [r.written for r in results] == [False, True, True]
+    assert all(r.error is None for r in results)
+    with open(os.path.join(write_location, "1_scf.in"), "r") as fr:
+        assert fr.read() == feo_scf_in
+    results = generate_many(
+        [feo_struct, feo_struct, al_fcc_struct], max_workers=2, **kwargs
+    )
+    assert [r.written for r in results] == [False, False, False]
+
+
+def test_generate_many_incremental_pseudo_dir(tmpdir):
+    import shutil
+    from dftinputgen.manifest import Manifest
+    from dftinputgen.qe.pwx import PwxInputGenerator
+
+    pseudo_dir = os.path.join(str(tmpdir), "pseudos")
+    os.makedirs(pseudo_dir)
+    for fname in ["fe_pbe_v1.5.uspp.F.UPF", "o_pbe_v1.2.uspp.F.UPF"]:
+        shutil.copy(os.path.join(qe_files_dir, fname), pseudo_dir)
+    write_location = os.path.join(str(tmpdir), "inputs")
+    kwargs = dict(
+        calculation_presets="scf",
+        custom_sett_dict={"pseudo_dir": pseudo_dir},
+        specify_potentials=True,
+        write_location=write_location,
+        incremental=True,
+        max_workers=1,
+    )
+    results = generate_many([feo_struct], **kwargs)
+    assert [r.written for r in results] == [True]
+    # same hash as a single generator with the same settings
+    pwig = PwxInputGenerator(
+        crystal_structure=feo_struct,
+        calculation_presets="scf",
+        custom_sett_dict={"pseudo_dir": pseudo_dir},
+        specify_potentials=True,
+    )
+    manifest = Manifest.load(write_location)
+    assert manifest.get("0_scf.in")["input_hash"] == pwig.input_hash
+    # pseudopotentials of other elements do not affect the inputs
+    shutil.copy(os.path.join(qe_files_dir, "al_pbe_v1.uspp.F.UPF"), pseudo_dir)
+    results = generate_many([feo_struct], **kwargs)
+    assert [r.written for r in results] == [False]
+
+
+def test_generate_many_stats(tmpdir):
+    from dftinputgen.stats import GenerationStats
+
+    for max_workers in [1, 2]:
+        stats = GenerationStats()
+        generate_many(
+            [feo_struct, al_fcc_struct] * 3,
+            calculation_presets="scf",
+            custom_sett_dict={"pseudo_dir": qe_files_dir},
+            specify_potentials=True,
+            write_location=str(tmpdir),
+            max_workers=max_workers,
+            chunksize=2,
+            stats=stats,
+        )
+        stats_dict = stats.as_dict()
+        # stats from all workers are aggregated
+        assert stats_dict["counters"] == {"files_written": 6}
+        assert stats_dict["phases"]["write"]["calls"] == 6
+        assert stats_dict["phases"]["pseudo_resolution"]["calls"] == 7
+
+
+def test_generate_many_strict():
+    import pytest
+
+    kwargs = dict(
+        calculation_presets="scf",
+        custom_sett_dict={"ecutwcf": 30},
+        max_workers=1,
+    )
+    results = generate_many([feo_struct], **kwargs)
+    assert results[0].error is None
+    with pytest.raises(PwxInputGeneratorError, match="ecutwcf"):
+        generate_many([feo_struct], strict=True, **kwargs)
+
+
+def test_generate_many_archive(tmpdir):
+    import zipfile
+    from dftinputgen.targets import ArchiveTarget
+
+    path = os.path.join(str(tmpdir), "inputs.zip")
+    for max_workers in [1, 2]:
+        with ArchiveTarget(path) as target:
+            results = generate_many(
+                [feo_struct, "not a structure", al_fcc_struct],
+                calculation_presets="scf",
+                custom_sett_dict={"pseudo_dir": qe_files_dir},
+                specify_potentials=True,
+                max_workers=max_workers,
+                output_target=target,
+            )
+        assert [r.path for r in results] == ["0_scf.in", None, "2_scf.in"]
+        assert isinstance(results[1].error, TypeError)
+        assert all(r.text is None for r in results)
+        with zipfile.ZipFile(path, "r") as zipf:
+            assert zipf.namelist() == ["0_scf.in", "2_scf.in"]
+            assert zipf.read("2_scf.in").decode() == al_fcc_scf_in
+
+
+def test_generate_many_sharded(tmpdir):
+    from dftinputgen.layouts import ShardedLayout
+
+    layout = ShardedLayout()
+    write_location = str(tmpdir)
+    for max_workers in [1, 2]:
+        results = generate_many(
+            [feo_struct, al_fcc_struct],
+            calculation_presets="scf",
+            custom_sett_dict={"pseudo_dir": qe_files_dir},
+            specify_potentials=True,
+            write_location=write_location,
+            max_workers=max_workers,
+            layout="sharded",
+            keys=["feo", "al"],
+        )
+        assert [r.path for r in results] == [
+            layout.lookup(write_location, "feo", "0_scf.in"),
+            layout.lookup(write_location, "al", "1_scf.in"),
+        ]
+        with open(results[1].path, "r") as fr:
+            assert fr.read() == al_fcc_scf_in
+
+    # default keys, in an archive
+    import tarfile
+    from dftinputgen.targets import ArchiveTarget
+
+    path = os.path.join(str(tmpdir), "inputs.tar")
+    with ArchiveTarget(path) as target:
+        results = generate_many(
+            [feo_struct],
+            calculation_presets="scf",
+            custom_sett_dict={"pseudo_dir": qe_files_dir},
+            specify_potentials=True,
+            max_workers=1,
+            output_target=target,
+            layout=layout,
+        )
+    assert results[0].error is None
+    assert len(results[0].path.split(os.sep)) == 4
+    with tarfile.open(path, "r") as tar:
+        assert tar.getnames() == [results[0].path]
+
+
+def test_generate_many_supercell():
+    results = generate_many(
+        [feo_struct, al_fcc_struct],
+        calculation_presets="scf",
+        supercell=2,
+        max_workers=1,
+    )
+    assert [r.error for r in results] == [None, None]
+    assert "nat = 32" in results[0].text
+    assert "nat = 32" in results[1].text
+
+
+def test_generate_many_auto_cutoffs(tmpdir, monkeypatch):
+    from dftinputgen.qe.upf import UPF_HEADER_CACHE
+    from dftinputgen.qe.upf import CACHE_DIR_ENV_VAR
+
+    monkeypatch.setenv(CACHE_DIR_ENV_VAR, str(tmpdir.join("cache")))
+    UPF_HEADER_CACHE.clear()
+    pseudo_dir = tmpdir.mkdir("pseudos")
+    for name in os.listdir(qe_files_dir):
+        if name.endswith(".UPF"):
+            with open(os.path.join(qe_files_dir, name), "r") as fr:
+                text = fr.read()
+            # suggest cutoffs only in the O pseudopotential
+            if name.startswith("o_"):
+                text = text.replace(
+                    "    0.00000    0.00000", "   50.00000  400.00000"
+                )
+            pseudo_dir.join(name).write(text)
+    results = generate_many(
+        [feo_struct, al_fcc_struct],
+        calculation_presets="scf",
+        custom_sett_dict={"pseudo_dir": str(pseudo_dir)},
+        specify_potentials=True,
+        max_workers=1,
+        auto_cutoffs=True,
+    )
+    UPF_HEADER_CACHE.clear()
+    # no suggested cutoffs for Fe and Al: cutoffs from the presets
+    assert results[0].text == feo_scf_in.replace(qe_files_dir, str(pseudo_dir))
+    assert results[1].text == al_fcc_scf_in.replace(
+        qe_files_dir, str(pseudo_dir)
+    )
+
+    (al_pseudo,) = [p for p in pseudo_dir.listdir() if "al_" in p.basename]
+    al_pseudo.write(
+        al_pseudo.read().replace("    0.00000    0.00000", "   30.00000    0.")
+    )
+    results = generate_many(
+        [feo_struct, al_fcc_struct],
+        calculation_presets="scf",
+        custom_sett_dict={"pseudo_dir": str(pseudo_dir), "ecutrho": 300},
+        specify_potentials=True,
+        max_workers=1,
+        auto_cutoffs=True,
+    )
+    UPF_HEADER_CACHE.clear()
+    assert "ecutwfc = 40" in results[0].text
+    assert "ecutwfc = 30.0" in results[1].text
+    # custom cutoffs take precedence
+    assert "ecutrho = 300" in results[1].text
+
+
+def test_map_bounded():
+    import threading
+    from concurrent import futures
+    from dftinputgen.batch import _map_bounded
+
+    consumed = []
+    release = threading.Event()
+
+    def _items():
+        for i in range(20):
+            consumed.append(i)
+            yield i
+
+    def _square(i):
+        if i == 0:
+            release.wait()
+        return i * i
+
+    with futures.ThreadPoolExecutor(max_workers=2) as executor:
+        try:
+            outcomes = _map_bounded(executor, _square, _items(), window=4)
+            # results as they complete (item 0 is still running), while
+            # only a few more items are submitted as slots free up
+            first = [next(outcomes) for _ in range(3)]
+            assert 0 not in first
+            assert len(consumed) <= 10
+        finally:
+            release.set()
+        assert sorted(first + list(outcomes)) == [i * i for i in range(20)]
+    release.clear()
+    with futures.ThreadPoolExecutor(max_workers=2) as executor:
+        timer = threading.Timer(0.1, release.set)
+        timer.start()
+        outcomes = _map_bounded(
+            executor, _square, range(20), window=4, ordered=True
+        )
+        assert list(outcomes) == [i * i for i in range(20)]
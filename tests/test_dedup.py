@@ -0,0 +1,168 @@
+"""Unit tests for finding duplicate structures in :mod:`dftinputgen.dedup`."""
+
+import os
+import json
+import pytest
+import numpy as np
+
+import ase
+from ase import io as ase_io
+
+import dftinputgen.dedup
+from dftinputgen.dedup import StructureDeduplicator
+from dftinputgen.dedup import get_structure_fingerprint
+
+
+test_base_dir = os.path.dirname(__file__)
+qe_files_dir = os.path.join(test_base_dir, "qe", "files")
+feo_struct = ase_io.read(os.path.join(qe_files_dir, "feo_conv.vasp"))
+al_fcc_struct = ase_io.read(os.path.join(qe_files_dir, "al_fcc_conv.vasp"))
+
+
+def _copy(structure, cell=None, positions=None, order=None):
+    symbols = np.array(structure.get_chemical_symbols())
+    if positions is None:
+        positions = structure.positions
+    if order is not None:
+        symbols = symbols[order]
+        positions = positions[order]
+    return ase.Atoms(
+        symbols=symbols.tolist(),
+        positions=positions,
+        cell=structure.cell if cell is None else cell,
+        pbc=True,
+    )
+
+
+def _equivalent_structures(structure):
+    """The same crystal structure, represented in different ways."""
+    # atoms reordered
+    yield _copy(structure, order=np.arange(len(structure))[::-1])
+    # origin shifted
+    shifted = _copy(structure, positions=structure.positions + [0.3, 0.1, 0])
+    shifted.wrap()
+    yield shifted
+    # rotated by 90 degrees about z
+    rotation = np.array([[0, 1, 0], [-1, 0, 0], [0, 0, 1]])
+    yield _copy(
+        structure,
+        cell=np.dot(structure.cell, rotation),
+        positions=np.dot(structure.positions, rotation),
+    )
+    # different (equivalent) lattice vectors
+    cell = np.dot([[1, 1, 0], [0, 1, 0], [0, 0, 1]], structure.cell)
+    other_basis = _copy(structure, cell=cell)
+    other_basis.wrap()
+    yield other_basis
+
+
+@pytest.mark.parametrize("structure", [feo_struct, al_fcc_struct])
+def test_get_structure_fingerprint(structure):
+    fingerprint = get_structure_fingerprint(structure)
+    assert fingerprint.formula == tuple(
+        sorted(
+            (sp, structure.get_chemical_symbols().count(sp))
+            for sp in set(structure.get_chemical_symbols())
+        )
+    )
+    assert np.isclose(
+        np.linalg.det(fingerprint.cell), abs(structure.get_volume())
+    )
+    for equivalent in _equivalent_structures(structure):
+        equivalent_fingerprint = get_structure_fingerprint(equivalent)
+        assert equivalent_fingerprint.digest == fingerprint.digest
+    displaced = structure.copy()
+    displaced.positions[0] += [0.3, 0, 0]
+    assert get_structure_fingerprint(displaced).digest != fingerprint.digest
+
+
+def test_deduplicator(tmpdir):
+    rng = np.random.RandomState(42)
+    noisy = feo_struct.copy()
+    noisy.positions += rng.normal(scale=1e-3, size=noisy.positions.shape)
+    displaced = feo_struct.copy()
+    displaced.positions[0] += [0.3, 0, 0]
+    structures = (
+        [feo_struct, al_fcc_struct]
+        + list(_equivalent_structures(feo_struct))
+        + [noisy, displaced]
+    )
+
+    dedup = StructureDeduplicator()
+    unique = list(dedup.iter_unique(structures))
+    assert [name for name, _ in unique] == [0, 1, 7]
+    assert unique[1][1] is al_fcc_struct
+    assert dedup.unique == [0, 1, 7]
+    assert dedup.duplicates == {2: 0, 3: 0, 4: 0, 5: 0, 6: 0}
+    assert dedup.mapping[1] == 1
+    with pytest.raises(ValueError):
+        dedup.add(feo_struct, name=0)
+    # tighter tolerances: the noisy structure is no longer a duplicate
+    dedup = StructureDeduplicator(length_tolerance=1e-4)
+    assert dedup.add(feo_struct, name="feo") == "feo"
+    assert dedup.add(noisy, name="noisy") == "noisy"
+
+    path = str(tmpdir.join("dedup.json"))
+    dedup.dump(path)
+    with open(path, "r") as fr:
+        assert json.load(fr) == {
+            "unique": ["feo", "noisy"],
+            "duplicates": {},
+        }
+
+
+def _fcc_configurations(count, rng):
+    """Random Al/Cu decorations of a supercell of fcc Al (8 atoms)."""
+    positions = np.concatenate(
+        [al_fcc_struct.positions, al_fcc_struct.positions]
+    )
+    positions[4:] += al_fcc_struct.cell[0]
+    cell = al_fcc_struct.cell * [[2], [1], [1]]
+    symbols = np.array(["Al"] * 5 + ["Cu"] * 3)
+    for _ in range(count):
+        rng.shuffle(symbols)
+        yield ase.Atoms(
+            symbols=symbols.tolist(), positions=positions, cell=cell, pbc=True
+        )
+
+
+def test_deduplicator_configurations(monkeypatch):
+    # distinct decorations of the same lattice, and noisy copies of them
+    rng = np.random.RandomState(0)
+    structures = list(_fcc_configurations(20, rng))
+    noisy = []
+    for structure in structures[:3]:
+        copy = _copy(structure, order=rng.permutation(len(structure)))
+        copy.positions += rng.normal(scale=2e-3, size=copy.positions.shape)
+        noisy.append(copy)
+
+    # atoms are compared one by one only for (near) duplicates
+    calls = []
+    is_near_duplicate = StructureDeduplicator._is_near_duplicate
+
+    def _is_near_duplicate(self, fingerprint, other):
+        result = is_near_duplicate(self, fingerprint, other)
+        calls.append(result)
+        return result
+
+    monkeypatch.setattr(
+        StructureDeduplicator, "_is_near_duplicate", _is_near_duplicate
+    )
+    dedup = StructureDeduplicator()
+    reps = [dedup.add(structure) for structure in structures + noisy]
+    assert reps[20:] == reps[:3]
+    assert calls and False not in calls
+
+    # lattice parameters within the tolerance: in probed buckets
+    fingerprint = get_structure_fingerprint(structures[0])
+    keys = list(dedup._iter_bucket_keys(fingerprint))
+    assert len(keys) == 64
+    for scale in [-0.009, 0.009]:
+        strained = structures[0].copy()
+        strained.set_cell(
+            strained.cell * (1 + scale / np.linalg.norm(strained.cell[0])),
+            scale_atoms=True,
+        )
+        strained_fingerprint = get_structure_fingerprint(strained)
+        assert dedup._get_bucket_key(strained_fingerprint) in keys
+        assert dedup.add(strained) == reps[0]
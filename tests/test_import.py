@@ -0,0 +1,68 @@
+"""Import-time regression tests for the `dftinputgen` package."""
+
+import sys
+import json
+import pytest
+import subprocess
+
+
+_IMPORT_CHECK = """
+import sys, json, time
+import ase
+before = set(sys.modules)
+start = time.time()
+import dftinputgen.cli
+import dftinputgen.qe.pwx
+elapsed = time.time() - start
+from dftinputgen.data import get_standard_atomic_weights
+from dftinputgen.qe.settings import get_qe_tags
+from dftinputgen.qe.settings.calculation_presets import get_qe_presets
+print(json.dumps({
+    "new_modules": sorted(set(sys.modules) - before),
+    "elapsed": elapsed,
+    "data_loaded": [
+        f.cache_info().currsize
+        for f in (get_standard_atomic_weights, get_qe_tags, get_qe_presets)
+    ],
+}))
+"""
+
+
+def _run_import_check():
+    output = subprocess.check_output([sys.executable, "-c", _IMPORT_CHECK])
+    return json.loads(output.decode())
+
+
+def test_lazy_import():
+    # (`ase` itself is imported beforehand: it is needed in any case to
+    # read/create crystal structures, and older versions of it import
+    # `pkg_resources` via `distutils`.)
+    result = _run_import_check()
+    assert "pkg_resources" not in result["new_modules"]
+    assert "ase.io" not in result["new_modules"]
+    # no data files are parsed at import time
+    assert result["data_loaded"] == [0, 0, 0]
+    # generous upper bound, to catch gross regressions only
+    assert result["elapsed"] < 1.0
+
+
+def test_lazy_data_access():
+    from dftinputgen.data import STANDARD_ATOMIC_WEIGHTS
+    from dftinputgen.qe.settings import QE_TAGS
+    from dftinputgen.qe.settings.calculation_presets import QE_PRESETS
+
+    assert STANDARD_ATOMIC_WEIGHTS["Fe"]["standard_atomic_weight"] == 55.845
+    assert "pw.x" in QE_TAGS
+    assert sorted(QE_PRESETS) == ["relax", "scf", "vc-relax"]
+
+    import dftinputgen.data
+    import dftinputgen.qe.settings
+    import dftinputgen.qe.settings.calculation_presets
+
+    for module in [
+        dftinputgen.data,
+        dftinputgen.qe.settings,
+        dftinputgen.qe.settings.calculation_presets,
+    ]:
+        with pytest.raises(AttributeError, match="MISSING_CONSTANT"):
+            module.MISSING_CONSTANT
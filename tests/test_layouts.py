@@ -0,0 +1,63 @@
+"""Unit tests for layouts of input files in :mod:`dftinputgen.layouts`."""
+
+import os
+import pytest
+
+from dftinputgen.layouts import FlatLayout
+from dftinputgen.layouts import ShardedLayout
+from dftinputgen.layouts import get_layout
+
+
+def test_flat_layout(tmpdir):
+    layout = FlatLayout()
+    assert not layout.keyed
+    assert layout.relpath("abc", "scf.in") == "scf.in"
+    assert layout.lookup(str(tmpdir), "abc", "scf.in") == os.path.join(
+        str(tmpdir), "scf.in"
+    )
+
+
+def test_sharded_layout(tmpdir):
+    layout = ShardedLayout()
+    assert layout.keyed
+    # shards from the SHA-256 hash of the key "abc" (ba7816bf...)
+    assert layout.shards("abc") == ["ba", "78"]
+    assert ShardedLayout(levels=3, width=1).shards("abc") == ["b", "a", "7"]
+    relpath = layout.relpath("abc", "scf.in")
+    assert relpath == os.path.join("ba", "78", "abc", "scf.in")
+    location = str(tmpdir)
+    assert layout.lookup(location, "abc") == os.path.join(
+        location, "ba", "78", "abc"
+    )
+    assert layout.lookup(location, "abc", "scf.in") == os.path.join(
+        location, relpath
+    )
+    for key in ["", ".", "..", os.path.join("a", "b")]:
+        with pytest.raises(ValueError):
+            layout.relpath(key, "scf.in")
+
+
+def test_make_dirs(tmpdir, monkeypatch):
+    layout = ShardedLayout()
+    location = str(tmpdir.join("inputs"))
+    relpaths = [layout.relpath(k, f) for k in "abc" for f in ["1.in", "2.in"]]
+    layout.make_dirs(location, relpaths)
+    for key in "abc":
+        assert os.path.isdir(layout.lookup(location, key))
+
+    # directories created earlier are not created again
+    def _makedirs(path, **kwargs):
+        raise AssertionError("{} created again".format(path))
+
+    monkeypatch.setattr(os, "makedirs", _makedirs)
+    layout.make_dirs(location, relpaths)
+
+
+def test_get_layout():
+    assert isinstance(get_layout(None), FlatLayout)
+    assert isinstance(get_layout("flat"), FlatLayout)
+    assert isinstance(get_layout("sharded"), ShardedLayout)
+    layout = ShardedLayout(levels=1)
+    assert get_layout(layout) is layout
+    with pytest.raises(ValueError):
+        get_layout("nested")
@@ -0,0 +1,63 @@
+"""Unit tests for the manifest of files in :mod:`dftinputgen.manifest`."""
+
+import os
+
+from dftinputgen.manifest import MANIFEST_FILENAME
+from dftinputgen.manifest import Manifest
+
+
+def _write(path, text):
+    with open(path, "w") as fw:
+        fw.write(text)
+
+
+def test_load_save(tmpdir):
+    write_location = str(tmpdir)
+    # no manifest on disk: empty
+    manifest = Manifest.load(write_location)
+    assert manifest.entries == {}
+    assert manifest.path == os.path.join(write_location, MANIFEST_FILENAME)
+    _write(os.path.join(write_location, "scf.in"), "input")
+    entry = manifest.record("scf.in", "in_hash", "out_hash")
+    assert entry["input_hash"] == "in_hash"
+    assert entry["output_hash"] == "out_hash"
+    assert entry["size"] == 5
+    manifest.save()
+    assert tmpdir.listdir() != []
+    assert not os.path.exists(manifest.path + ".part")
+    assert Manifest.load(write_location).entries == {"scf.in": entry}
+    # paths are normalized
+    assert manifest.get("./scf.in") == entry
+
+
+def test_is_current(tmpdir):
+    write_location = str(tmpdir)
+    path = os.path.join(write_location, "scf.in")
+    manifest = Manifest(write_location)
+    assert not manifest.is_current("scf.in", "in_hash")
+    _write(path, "input")
+    manifest.record("scf.in", "in_hash", "out_hash")
+    assert manifest.is_current("scf.in", "in_hash")
+    # input changed
+    assert not manifest.is_current("scf.in", "other_hash")
+    # file modified since it was written
+    _write(path, "modified input")
+    assert not manifest.is_current("scf.in", "in_hash")
+    # file deleted
+    manifest.record("scf.in", "in_hash", "out_hash")
+    os.remove(path)
+    assert not manifest.is_current("scf.in", "in_hash")
+
+
+def test_open(tmpdir):
+    write_location = str(tmpdir)
+    assert Manifest.get_open(write_location) is None
+    with Manifest.open(write_location) as manifest:
+        assert Manifest.get_open(write_location) is manifest
+        assert Manifest.get_open(write_location + "/.") is manifest
+        _write(os.path.join(write_location, "scf.in"), "input")
+        entry = manifest.record("scf.in", "in_hash", "out_hash")
+        # saved only once closed
+        assert not os.path.exists(manifest.path)
+    assert Manifest.get_open(write_location) is None
+    assert Manifest.load(write_location).entries == {"scf.in": entry}
@@ -0,0 +1,62 @@
+"""Unit tests for generation stats in :mod:`dftinputgen.stats`."""
+
+import json
+
+from dftinputgen.stats import GenerationStats
+from dftinputgen.stats import NullStats
+from dftinputgen.stats import NULL_STATS
+
+
+def test_generation_stats(tmpdir):
+    stats = GenerationStats()
+    assert stats.enabled
+    for _ in range(3):
+        with stats.phase("render"):
+            pass
+    stats.count("files_written")
+    stats.count("files_written", 2)
+    stats_dict = stats.as_dict()
+    assert stats_dict["phases"]["render"]["calls"] == 3
+    assert stats_dict["phases"]["render"]["seconds"] >= 0
+    assert stats_dict["counters"] == {"files_written": 3}
+    # time is recorded even if the phase raises an error
+    try:
+        with stats.phase("write"):
+            raise ValueError
+    except ValueError:
+        pass
+    assert stats.as_dict()["phases"]["write"]["calls"] == 1
+    # dumped as JSON
+    path = str(tmpdir.join("stats.json"))
+    stats.dump(path)
+    with open(path, "r") as fr:
+        assert json.load(fr) == json.loads(stats.to_json())
+
+
+def test_merge():
+    stats = GenerationStats()
+    stats.record("render", 1.0)
+    other = GenerationStats()
+    other.record("render", 0.5, calls=2)
+    other.record("write", 0.25)
+    other.count("files_written", 3)
+    stats.merge(other)
+    assert stats.as_dict() == {
+        "phases": {
+            "render": {"calls": 3, "seconds": 1.5},
+            "write": {"calls": 1, "seconds": 0.25},
+        },
+        "counters": {"files_written": 3},
+    }
+
+
+def test_null_stats():
+    assert isinstance(NULL_STATS, NullStats)
+    assert not NULL_STATS.enabled
+    with NULL_STATS.phase("render"):
+        pass
+    NULL_STATS.count("files_written")
+    other = GenerationStats()
+    other.record("render", 1.0)
+    NULL_STATS.merge(other)
+    assert NULL_STATS.as_dict() == {"phases": {}, "counters": {}}
@@ -0,0 +1,84 @@
+"""Unit tests for output targets in :mod:`dftinputgen.targets`."""
+
+import os
+import json
+import pytest
+import tarfile
+import zipfile
+
+from dftinputgen.targets import ArchiveTarget
+from dftinputgen.targets import DirectoryTarget
+from dftinputgen.targets import OutputTargetError
+
+
+def _failing_chunks():
+    yield "partial"
+    raise ValueError("rendering failed")
+
+
+def test_directory_target(tmpdir):
+    target = DirectoryTarget(str(tmpdir))
+    assert not target.exists("scf.in")
+    path = target.write("scf.in", ["&CONTROL", "\n/"])
+    assert path == os.path.join(str(tmpdir), "scf.in")
+    assert target.exists("scf.in")
+    with open(path, "r") as fr:
+        assert fr.read() == "&CONTROL\n/"
+    # errors while writing: no partial file left behind
+    with pytest.raises(ValueError):
+        target.write("relax.in", _failing_chunks())
+    assert sorted(os.listdir(str(tmpdir))) == ["scf.in"]
+
+
+@pytest.mark.parametrize(
+    "filename, archive_format, compression",
+    [
+        ("inputs.tar", "tar", None),
+        ("inputs.tar.gz", "tar", "gz"),
+        ("inputs.tgz", "tar", "gz"),
+        ("inputs.tar.xz", "tar", "xz"),
+        ("inputs.zip", "zip", "deflated"),
+    ],
+)
+def test_archive_target(tmpdir, filename, archive_format, compression):
+    path = os.path.join(str(tmpdir), filename)
+    with ArchiveTarget(path, member_template="{index}/{name}") as target:
+        assert target.archive_format == archive_format
+        assert target.compression == compression
+        assert target.write("scf.in", ["&CONTROL", "\n/"]) == "0/scf.in"
+        assert target.write("scf.in", ["&SYSTEM\n/"]) == "1/scf.in"
+        with pytest.raises(ValueError):
+            target.write("relax.in", _failing_chunks())
+    if archive_format == "tar":
+        with tarfile.open(path, "r") as tar:
+            assert tar.getnames() == ["0/scf.in", "1/scf.in"]
+            content = tar.extractfile("1/scf.in").read()
+    else:
+        with zipfile.ZipFile(path, "r") as zipf:
+            assert zipf.namelist() == ["0/scf.in", "1/scf.in"]
+            content = zipf.read("1/scf.in")
+    assert content == b"&SYSTEM\n/"
+    with open(target.index_path, "r") as fr:
+        index = json.load(fr)
+    assert index["archive"] == filename
+    assert [m["member"] for m in index["members"]] == ["0/scf.in", "1/scf.in"]
+    assert index["members"][0]["size"] == len("&CONTROL\n/")
+    # closed: nothing more can be written
+    target.close()
+    with pytest.raises(OutputTargetError, match="closed"):
+        target.write("scf.in", ["&CONTROL\n/"])
+
+
+def test_archive_target_errors(tmpdir):
+    path = os.path.join(str(tmpdir), "inputs")
+    with pytest.raises(OutputTargetError, match="archive format of"):
+        ArchiveTarget(path)
+    with pytest.raises(OutputTargetError, match="Unknown archive format"):
+        ArchiveTarget(path, archive_format="rar")
+    with pytest.raises(OutputTargetError, match="for tar"):
+        ArchiveTarget(path, archive_format="tar", compression="deflated")
+    # empty archive
+    with ArchiveTarget(path + ".zip") as target:
+        pass
+    with zipfile.ZipFile(target.path, "r") as zipf:
+        assert zipf.namelist() == []
@@ -2,12 +2,20 @@
 
 import os
 import pytest
+import numpy as np
 
 from ase import io as ase_io
 
+from dftinputgen.utils import StructureView
+from dftinputgen.utils import SupercellView
+from dftinputgen.utils import get_supercell_matrix
 from dftinputgen.utils import get_elem_symbol
 from dftinputgen.utils import read_crystal_structure
+from dftinputgen.utils import read_crystal_structures
+from dftinputgen.utils import expand_structure_paths
+from dftinputgen.utils import iter_chunks
 from dftinputgen.utils import get_kpoint_grid_from_spacing
+from dftinputgen.utils import get_kpoint_grids_from_spacing
 from dftinputgen.utils import DftInputGeneratorUtilsError
 
 
@@ -16,6 +24,78 @@ feo_conv_file = os.path.join(test_base_dir, "qe", "files", "feo_conv.vasp")
 feo_conv = ase_io.read(feo_conv_file)
 
 
+def test_structure_view():
+    view = StructureView.from_atoms(feo_conv)
+    assert len(view) == 4
+    assert view.species == ("Fe", "O")
+    assert view.species_indices.tolist() == [0, 0, 1, 1]
+    assert view.symbols.tolist() == feo_conv.get_chemical_symbols()
+    assert np.allclose(view.scaled_positions, feo_conv.get_scaled_positions())
+    assert view.scaled_positions.dtype == np.float64
+    assert np.allclose(view.cell, feo_conv.cell)
+    # read-only arrays, no arbitrary attributes
+    with pytest.raises(ValueError):
+        view.scaled_positions[0, 0] = 0.5
+    with pytest.raises(AttributeError):
+        view.natoms = 4
+    # back to `ase.Atoms`
+    atoms = view.to_atoms()
+    assert atoms.get_chemical_symbols() == feo_conv.get_chemical_symbols()
+    assert np.allclose(atoms.positions, feo_conv.positions)
+
+
+def _repeat(view, repetitions):
+    """Supercell in the order of `ase.Atoms.repeat`, built explicitly."""
+    species_indices = []
+    scaled_positions = []
+    for tile in np.ndindex(*repetitions):
+        species_indices.extend(view.species_indices)
+        scaled_positions.extend((view.scaled_positions + tile) / repetitions)
+    return species_indices, np.array(scaled_positions)
+
+
+def test_get_supercell_matrix():
+    assert get_supercell_matrix(2).tolist() == (2 * np.eye(3)).tolist()
+    assert get_supercell_matrix([1, 2, 3]).tolist() == [
+        [1, 0, 0],
+        [0, 2, 0],
+        [0, 0, 3],
+    ]
+    matrix = [[1, 1, 0], [-1, 1, 0], [0, 0, 1]]
+    assert get_supercell_matrix(matrix).tolist() == matrix
+    for supercell in [[1, 2], 1.5, [[1, 0, 0], [0, 1, 0], [1, 1, 0]]]:
+        with pytest.raises(DftInputGeneratorUtilsError):
+            get_supercell_matrix(supercell)
+
+
+def test_supercell_view():
+    primitive = StructureView.from_atoms(feo_conv)
+    view = SupercellView(primitive, [2, 3, 1])
+    assert len(view) == 24
+    assert view.n_tiles == 6
+    assert view.species == ("Fe", "O")
+    assert np.allclose(view.cell, primitive.cell * [[2], [3], [1]])
+    species_indices, scaled_positions = _repeat(primitive, [2, 3, 1])
+    assert view.species_indices.tolist() == species_indices
+    assert np.allclose(view.scaled_positions, scaled_positions)
+    # blocks of whole tiles
+    blocks = list(view.iter_blocks(10))
+    assert [len(symbols) for symbols, _ in blocks] == [8, 4, 8, 4]
+    symbols = np.concatenate([symbols for symbols, _ in blocks])
+    assert symbols.tolist() == view.symbols.tolist()
+
+    # non-diagonal transformation matrix
+    view = SupercellView(primitive, [[1, 1, 0], [-1, 1, 0], [0, 0, 2]])
+    assert len(view) == 16
+    assert np.allclose(np.linalg.det(view.cell), 4 * feo_conv.get_volume())
+    positions = view.scaled_positions
+    assert np.all((positions >= 0) & (positions < 1))
+    # all atoms are distinct (no duplicate periodic images)
+    cartesian = np.dot(positions, view.cell)
+    distances = np.linalg.norm(cartesian[:, None] - cartesian[None], axis=2)
+    assert np.all(distances[np.triu_indices(16, 1)] > 1e-6)
+
+
 def test_get_elem_symbol():
     assert get_elem_symbol("Fe-34") == "Fe"
     assert get_elem_symbol("3RGe-34") == "Ge"
@@ -32,7 +112,74 @@ def test_read_crystal_structure():
         read_crystal_structure(feo_conv)
 
 
+def test_read_crystal_structures(tmpdir):
+    xyz_file = str(tmpdir.join("frames.xyz"))
+    ase_io.write(xyz_file, [feo_conv, feo_conv], format="extxyz")
+    assert len(read_crystal_structures(xyz_file)) == 2
+    # single frame: still a list
+    assert len(read_crystal_structures(xyz_file, index="-1")) == 1
+    assert read_crystal_structures(feo_conv_file) == [feo_conv]
+    with pytest.raises(TypeError):
+        read_crystal_structures(feo_conv)
+
+
+def test_expand_structure_paths(tmpdir):
+    for name in ["b.vasp", "a.vasp", "c.xyz", ".hidden"]:
+        tmpdir.join(name).write("")
+    tmpdir.mkdir("subdir")
+    dirname = str(tmpdir)
+    # directory: all non-hidden files, sorted
+    assert expand_structure_paths(dirname) == [
+        os.path.join(dirname, n) for n in ["a.vasp", "b.vasp", "c.xyz"]
+    ]
+    # globs, files, without duplicates
+    paths = [
+        os.path.join(dirname, "*.vasp"),
+        os.path.join(dirname, "a.vasp"),
+        os.path.join(dirname, "c.xyz"),
+    ]
+    assert expand_structure_paths(paths) == [
+        os.path.join(dirname, n) for n in ["a.vasp", "b.vasp", "c.xyz"]
+    ]
+    # no matches: error
+    with pytest.raises(DftInputGeneratorUtilsError, match="No crystal"):
+        expand_structure_paths(os.path.join(dirname, "*.cif"))
+
+
+def test_iter_chunks():
+    chunks = iter_chunks(range(7), 3)
+    assert next(chunks) == [0, 1, 2]
+    assert list(chunks) == [[3, 4, 5], [6]]
+    assert list(iter_chunks([], 3)) == []
+
+
 def test_kpoint_grid_from_spacing():
     assert get_kpoint_grid_from_spacing(feo_conv, 0.2) == pytest.approx(
         [7, 7, 7]
     )
+    view = StructureView.from_atoms(feo_conv)
+    assert get_kpoint_grid_from_spacing(view, 0.2) == [7, 7, 7]
+    # cached grids are not shared with the caller
+    grid = get_kpoint_grid_from_spacing(view, 0.2)
+    grid[0] = 1
+    assert get_kpoint_grid_from_spacing(view, 0.2) == [7, 7, 7]
+    # grids are calculated from the actual (not the rounded) spacing
+    structure = StructureView(("Fe",), [], np.zeros((0, 3)), np.eye(3))
+    spacing = 2 * np.pi / 7 + 1e-12
+    assert get_kpoint_grid_from_spacing(structure, spacing) == [7, 7, 7]
+
+
+def test_kpoint_grids_from_spacing():
+    cells = np.array([feo_conv.cell, 2 * np.array(feo_conv.cell), np.eye(3)])
+    grids = get_kpoint_grids_from_spacing(cells, 0.2)
+    assert grids.shape == (3, 3)
+    assert grids.dtype.kind == "i"
+    for cell, grid in zip(cells, grids):
+        structure = StructureView(("Fe",), [], np.zeros((0, 3)), cell)
+        assert get_kpoint_grid_from_spacing(structure, 0.2) == grid.tolist()
+    # one spacing per cell
+    spacings = [0.4, 0.2, 0.1]
+    grids = get_kpoint_grids_from_spacing(cells[:1].repeat(3, 0), spacings)
+    assert grids.tolist() == [
+        get_kpoint_grid_from_spacing(feo_conv, s) for s in spacings
+    ]